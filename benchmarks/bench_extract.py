@@ -0,0 +1,93 @@
+"""
+Compare the extraction engines on speed and output size.
+
+    python benchmarks/bench_extract.py                  # synthetic pages
+    python benchmarks/bench_extract.py page1.html ...   # saved HTML files
+    python benchmarks/bench_extract.py --processes 4    # also time a process pool
+"""
+import argparse
+import random
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from searchapp.core.search.extract import EXTRACTORS, convert
+
+WORDS = "python search engine answer question page content result language model cache latency token".split()
+
+
+def sentence(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "."
+
+
+def synthetic_page(rng, paragraphs=40):
+    nav = "".join(f"<li><a href='/s{i}'>Section {i}</a></li>" for i in range(30))
+    body = "".join(f"<h2>{sentence(rng)}</h2><p>{' '.join(sentence(rng) for _ in range(5))}</p>" for _ in range(paragraphs))
+    footer = "".join(f"<a href='/f{i}'>Footer link {i}</a>" for i in range(40))
+    return f"""<html><head><style>body {{ color: red; }}</style><script>var tracking = {list(range(200))};</script></head>
+    <body><header><h1>Site name</h1></header><nav><ul>{nav}</ul></nav>
+    <div id="cookie-consent">We use cookies to improve your experience. <button>Accept all</button></div>
+    <div class="sidebar">{nav}</div>
+    <main><article><h1>{sentence(rng)}</h1>{body}</article></main>
+    <footer>{footer}</footer></body></html>"""
+
+
+def approx_tokens(chars):
+    # Roughly four characters per token for English text
+    return chars / 4
+
+
+def bench(pages, engine):
+    timings, sizes = [], []
+    for html in pages:
+        start = perf_counter()
+        markdown = convert(html, "http://bench.local", engine)
+        timings.append(perf_counter() - start)
+        sizes.append(len(markdown))
+    return timings, sizes
+
+
+def bench_pool(pages, engine, processes):
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        # Warm the workers up so start-up cost is not counted
+        list(pool.map(convert, pages[:processes], ["http://bench.local"] * processes, [engine] * processes))
+        start = perf_counter()
+        list(pool.map(convert, pages, ["http://bench.local"] * len(pages), [engine] * len(pages)))
+        return perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="HTML files to convert instead of synthetic pages")
+    parser.add_argument("--pages", type=int, default=50, help="number of synthetic pages")
+    parser.add_argument("--processes", type=int, default=0, help="also time a process pool of this size")
+    args = parser.parse_args()
+
+    if args.files:
+        pages = []
+        for path in args.files:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                pages.append(f.read())
+    else:
+        rng = random.Random(42)
+        pages = [synthetic_page(rng) for _ in range(args.pages)]
+
+    print(f"{len(pages)} pages, {sum(map(len, pages)) / len(pages) / 1024:.1f} KiB average HTML\n")
+    print(f"{'engine':<12}{'mean ms':>10}{'p95 ms':>10}{'total s':>10}{'avg chars':>12}{'~tokens':>10}")
+    for engine in EXTRACTORS:
+        timings, sizes = bench(pages, engine)
+        p95 = sorted(timings)[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+        print(
+            f"{engine:<12}{statistics.mean(timings) * 1000:>10.2f}{p95 * 1000:>10.2f}"
+            f"{sum(timings):>10.2f}{statistics.mean(sizes):>12.0f}{approx_tokens(statistics.mean(sizes)):>10.0f}"
+        )
+
+    if args.processes:
+        print()
+        for engine in EXTRACTORS:
+            elapsed = bench_pool(pages, engine, args.processes)
+            print(f"{engine:<12} process pool x{args.processes}: {elapsed:.2f} s total")
+
+
+if __name__ == "__main__":
+    main()
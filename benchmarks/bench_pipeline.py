@@ -0,0 +1,194 @@
+"""
+Reproducible latency benchmark of InputController against the local fake upstreams.
+
+    python benchmarks/bench_pipeline.py --output results.json
+    python benchmarks/bench_pipeline.py --baseline results.json --threshold 0.2
+
+Reports p50/p95/p99 per stage (format_question, bing_search, rank_snippets, fetch, convert,
+summarize, final_answer and the whole question) with every cache off, then the cache-hit path of
+InputController.run through RedisHelper: the per-worker L1 tier and Redis itself. With
+--baseline the run fails if any stage's p95 grew by more than --threshold.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from time import perf_counter
+
+import redis
+
+from searchapp.api.controller import InputController
+from searchapp.devtools.fakes import (
+    Endpoint,
+    FakeBing,
+    FakeOpenAI,
+    FakeUpstreams,
+    FakeWeb,
+    LatencyModel,
+)
+from searchapp.utils.aio import run_sync
+from searchapp.utils.telemetry import StageTimings, collect
+
+STAGES = ("format_question", "bing_search", "rank_snippets", "fetch", "convert", "summarize", "final_answer", "question")
+
+# Every pipeline cache off so the cold path really reaches the upstreams
+COLD_ENVIRON = {
+    "BING_CACHE_TTL": "0",
+    "QUERY_CACHE_TTL": "0",
+    "PAGE_CACHE": "0",
+    "SUMMARY_CACHE": "0",
+    "BING_QPS": "1000",
+}
+
+
+def start_fakes(args):
+    def endpoint(latency):
+        return Endpoint(LatencyModel(latency, latency * args.jitter, args.distribution, seed=args.seed))
+
+    corpus = FakeWeb(endpoint(args.web_latency), size=args.corpus_size, seed=args.seed)
+    return FakeUpstreams(
+        openai=FakeOpenAI(endpoint(args.llm_latency), token_rate=args.token_rate, seed=args.seed),
+        corpus=corpus,
+        bing=FakeBing(corpus, endpoint(args.bing_latency), seed=args.seed),
+    ).start()
+
+
+async def cold_questions(questions, concurrency):
+    timings = StageTimings()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(question):
+        async with semaphore:
+            with collect(timings):
+                start = perf_counter()
+                await InputController().main(question)
+                timings.record("question", perf_counter() - start)
+
+    await asyncio.gather(*(answer(question) for question in questions))
+    return timings
+
+
+def cached_questions(questions, repeats):
+    """
+    Time InputController.run for stored answers, from the L1 tier and then from Redis, and
+    the memoization lookup alone on a warm controller.
+    """
+    timings = StageTimings()
+    controller = InputController()
+    try:
+        controller.redis.redis_client.ping()
+    except redis.RedisError as e:
+        print(f"Skipping the cache-hit path, Redis is unavailable: {e}", file=sys.stderr)
+        return timings
+
+    for question in questions:
+        controller.question = question
+        controller.storeResult(f"Benchmark answer for {question}")
+
+    for _ in range(repeats):
+        for question in questions:
+            start = perf_counter()
+            InputController().run(question)
+            timings.record("cached_run_l1", perf_counter() - start)
+
+            # Drop the worker's copy so the lookup has to go to Redis
+            controller.redis.local_cache.clear()
+            start = perf_counter()
+            InputController().run(question)
+            timings.record("cached_run_l2", perf_counter() - start)
+
+            controller.question = question
+            start = perf_counter()
+            controller.memoization()
+            timings.record("lookup_l1", perf_counter() - start)
+
+            controller.redis.local_cache.clear()
+            start = perf_counter()
+            controller.memoization()
+            timings.record("lookup_l2", perf_counter() - start)
+
+    for question in questions:
+        controller.question = question
+        controller.redis.delete(controller.cacheKey())
+    return timings
+
+
+def compare(results, baseline, threshold, slack):
+    """
+    Return the stages whose p95 regressed past the threshold, ignoring changes under slack seconds.
+    """
+    regressions = []
+    for name, current in results["stages"].items():
+        previous = baseline.get("stages", {}).get(name)
+        if not previous:
+            continue
+        limit = previous["p95"] * (1 + threshold) + slack
+        if current["p95"] > limit:
+            regressions.append(f"{name}: p95 {current['p95'] * 1000:.1f} ms > {limit * 1000:.1f} ms")
+    return regressions
+
+
+def report(stages):
+    print(f"{'stage':<16} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    order = [name for name in STAGES if name in stages] + sorted(name for name in stages if name not in STAGES)
+    for name in order:
+        summary = stages[name]
+        print(
+            f"{name:<16} {summary['count']:>6} {summary['p50'] * 1000:>9.2f}"
+            f" {summary['p95'] * 1000:>9.2f} {summary['p99'] * 1000:>9.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=20, help="distinct questions on the cold path")
+    parser.add_argument("--concurrency", type=int, default=1, help="questions answered at once")
+    parser.add_argument("--cache-repeats", type=int, default=20, help="lookups per question on the cache-hit path")
+    parser.add_argument("--llm-latency", type=float, default=300, help="mean chat latency in ms")
+    parser.add_argument("--bing-latency", type=float, default=150, help="mean search latency in ms")
+    parser.add_argument("--web-latency", type=float, default=200, help="mean page latency in ms")
+    parser.add_argument("--jitter", type=float, default=0.3, help="latency spread as a fraction of the mean")
+    parser.add_argument("--distribution", choices=("fixed", "uniform", "lognormal"), default="lognormal")
+    parser.add_argument("--token-rate", type=float, default=100, help="streamed tokens per second")
+    parser.add_argument("--corpus-size", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p95 growth per stage")
+    parser.add_argument("--slack", type=float, default=5, help="ignore p95 changes under this many ms")
+    args = parser.parse_args()
+
+    fakes = start_fakes(args)
+    os.environ.update(COLD_ENVIRON)
+    os.environ.update(fakes.environ())
+
+    questions = [f"benchmark question {args.seed}-{index}" for index in range(args.questions)]
+    try:
+        timings = run_sync(cold_questions(questions, args.concurrency))
+        timings.merge(cached_questions(questions, args.cache_repeats))
+    finally:
+        fakes.stop()
+
+    results = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "stages": timings.summary(),
+    }
+    report(results["stages"])
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baselineFile:
+            baseline = json.load(baselineFile)
+        regressions = compare(results, baseline, args.threshold, args.slack / 1000)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+        print(f"\nNo stage regressed more than {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Compare request throughput of the serving models against a local upstream with fixed latency.
+
+    python benchmarks/bench_serving.py
+    python benchmarks/bench_serving.py --concurrency 64 --threads 8 --latency 50
+
+Each simulated question makes the same upstream calls as the pipeline: query formatting and
+search, then a fetch and a summary per page in parallel, then the final answer.
+
+- asyncio.run: every request starts its own loop and session on a WSGI thread (the old model)
+- shared loop: WSGI threads hand the request to the worker's long-lived loop (run_sync)
+- asgi: handlers await the pipeline on the server loop, no thread is held per request
+"""
+import argparse
+import asyncio
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+import aiohttp
+from aiohttp import web
+
+from searchapp.utils.aio import SharedSession, run_sync
+
+
+class Upstream:
+    """aiohttp server on its own thread that sleeps for `latency` and counts new connections."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.connections = set()
+        self.loop = asyncio.new_event_loop()
+        self.url = None
+
+    async def handle(self, request):
+        self.connections.add(id(request.transport))
+        await asyncio.sleep(self.latency)
+        return web.json_response({"ok": True})
+
+    def start(self):
+        ready = threading.Event()
+
+        async def serve():
+            app = web.Application()
+            app.router.add_get("/{tail:.*}", self.handle)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            self.url = f"http://127.0.0.1:{port}"
+            ready.set()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(serve())
+            self.loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        ready.wait()
+
+
+async def question(session, url, pages):
+    async def call(path):
+        async with session.get(f"{url}/{path}") as response:
+            await response.read()
+
+    await call("format")
+    await call("search")
+
+    async def page(index):
+        await call(f"fetch/{index}")
+        await call(f"summarize/{index}")
+
+    await asyncio.gather(*(page(index) for index in range(pages)))
+    await call("answer")
+
+
+async def fresh_session_question(url, pages):
+    async with aiohttp.ClientSession() as session:
+        await question(session, url, pages)
+
+
+async def shared_session_question(shared, url, pages):
+    # The pooled session is bound on first use from the loop it will live on
+    await question(shared.session, url, pages)
+
+
+def run_threaded(handle, requests, concurrency, threads):
+    # Clients run on their own threads, the server only has `threads` request threads
+    workers = threading.Semaphore(threads)
+    latencies = []
+
+    def client(count):
+        for _ in range(count):
+            start = perf_counter()
+            with workers:
+                handle()
+            latencies.append(perf_counter() - start)
+
+    counts = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client, counts))
+    return perf_counter() - start, latencies
+
+
+def run_asgi(handle, requests, concurrency, close=None):
+    latencies = []
+
+    async def client(count):
+        for _ in range(count):
+            start = perf_counter()
+            await handle()
+            latencies.append(perf_counter() - start)
+
+    async def main():
+        counts = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+        await asyncio.gather(*(client(count) for count in counts))
+        elapsed = perf_counter() - start
+        if close is not None:
+            await close()
+        return elapsed
+
+    start = perf_counter()
+    elapsed = asyncio.run(main())
+    return elapsed, latencies
+
+
+def report(name, elapsed, latencies, connections):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(
+        f"{name:<12} {len(latencies) / elapsed:8.1f} req/s"
+        f"   p50 {statistics.median(latencies) * 1000:7.1f} ms"
+        f"   p95 {p95 * 1000:7.1f} ms"
+        f"   connections {connections}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="questions per model")
+    parser.add_argument("--concurrency", type=int, default=32, help="simultaneous clients")
+    parser.add_argument("--threads", type=int, default=8, help="WSGI request threads per worker")
+    parser.add_argument("--latency", type=float, default=20, help="upstream latency in ms")
+    parser.add_argument("--pages", type=int, default=5, help="pages fetched and summarized per question")
+    args = parser.parse_args()
+
+    upstream = Upstream(args.latency / 1000)
+    upstream.start()
+    print(f"{args.requests} questions, {args.concurrency} clients, {args.threads} WSGI threads, "
+          f"{args.latency:.0f} ms upstream latency, {args.pages} pages\n")
+
+    elapsed, latencies = run_threaded(
+        lambda: asyncio.run(fresh_session_question(upstream.url, args.pages)),
+        args.requests, args.concurrency, args.threads,
+    )
+    report("asyncio.run", elapsed, latencies, len(upstream.connections))
+
+    upstream.connections.clear()
+    shared = SharedSession(limit=100, max_concurrency=100)
+    elapsed, latencies = run_threaded(
+        lambda: run_sync(shared_session_question(shared, upstream.url, args.pages)),
+        args.requests, args.concurrency, args.threads,
+    )
+    report("shared loop", elapsed, latencies, len(upstream.connections))
+    run_sync(shared.close())
+
+    upstream.connections.clear()
+    shared = SharedSession(limit=100, max_concurrency=100)
+
+    elapsed, latencies = run_asgi(
+        lambda: shared_session_question(shared, upstream.url, args.pages),
+        args.requests, args.concurrency, close=shared.close,
+    )
+    report("asgi", elapsed, latencies, len(upstream.connections))
+
+
+if __name__ == "__main__":
+    main()
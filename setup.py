@@ -21,6 +21,11 @@ setup(
         "faker",
         "aiohttp",
         "pydantic",
+        "numpy",
     ],
+    extras_require={
+        "asgi": ["uvicorn"],
+        "tokens": ["tiktoken"],
+    },
     python_requires=">=3.7",
 )
\ No newline at end of file
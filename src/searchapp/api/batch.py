@@ -0,0 +1,35 @@
+"""
+Answer a file of questions, one per line, and write JSON lines as the answers complete.
+
+    python -m searchapp.api.batch questions.txt > answers.jsonl
+    cat questions.txt | python -m searchapp.api.batch --concurrency 16
+"""
+import argparse
+import json
+import logging
+import sys
+from time import time
+
+from searchapp.api.controller import InputController
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("questions", nargs="?", type=argparse.FileType("r"), default=sys.stdin)
+    parser.add_argument("--concurrency", type=int, default=None, help="pipelines at once (BATCH_CONCURRENCY)")
+    args = parser.parse_args()
+
+    questions = [line.strip() for line in args.questions if line.strip()]
+    start_time = time()
+    answered = 0
+    for result in InputController().runBatchSync(questions, args.concurrency):
+        answered += 1
+        print(json.dumps(result), flush=True)
+
+    logger.info(f"Answered {answered} questions in {time() - start_time:.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
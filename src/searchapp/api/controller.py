@@ -1,18 +1,74 @@
 import asyncio
+import copy
 import logging
-from time import time
-from typing import Optional
+import os
+import threading
+from typing import AsyncIterator, Dict, Iterator, List, Optional
 
+from searchapp.api.jobs import DONE, JobManager
 from searchapp.core.inference.inference import Inference
 from searchapp.core.search.web import WebSearch
-from searchapp.utils.caching import RedisHelper
+from searchapp.utils.aio import iterate_sync, run_sync
+from searchapp.utils.caching import RedisHelper, shared_local_cache
+from searchapp.utils.keys import NearDuplicateIndex, question_key
+from searchapp.utils.singleflight import Flight, SingleFlight, getSingleFlight
+from searchapp.utils.telemetry import trace
 
 logger = logging.getLogger(__name__)
 
+_memoryLimitApplied = False
+
+_jobManager: Optional[JobManager] = None
+_jobManagerLock = threading.Lock()
+
+
+def getJobManager() -> JobManager:
+    # One pool of background pipeline runs per worker process
+    global _jobManager
+    with _jobManagerLock:
+        if _jobManager is None:
+            _jobManager = JobManager(lambda question: InputController().stream(question))
+        return _jobManager
+
 class InputController:
     def __init__(self):
-        self.redis = RedisHelper()
+        # Hot answers are served from a per-worker LRU before Redis, and every answer expires
+        self.redis = RedisHelper(
+            local_cache=shared_local_cache("answers"),
+            name="answers",
+            default_ttl=int(os.getenv("CACHE_ANSWER_TTL", 24 * 60 * 60)),
+        )
         self.question: Optional[str] = None
+        self.applyMemoryLimit()
+
+        # Paraphrase matching is opt-in, similar questions can still need different answers
+        self.nearDuplicates: Optional[NearDuplicateIndex] = None
+        if os.getenv("CACHE_NEAR_DUPLICATES", "").lower() in ("1", "true", "yes"):
+            # Its own helper: band lookups are not answer lookups, and must neither count in the
+            # answers hit rate nor push answers out of the L1 tier
+            self.nearDuplicates = NearDuplicateIndex(
+                RedisHelper(), threshold=float(os.getenv("CACHE_NEAR_DUPLICATE_THRESHOLD", 0.8))
+            )
+
+        # Concurrent requests for the same question, in any worker, share one pipeline run
+        self.singleFlight: Optional[SingleFlight] = getSingleFlight()
+
+        # Latency budget in seconds for a question, 0 lets every page finish
+        self.deadline = float(os.getenv("ANSWER_DEADLINE", 0))
+        # URLs the last answer from main() was based on, empty for cached answers
+        self.sources: List[str] = []
+
+    def applyMemoryLimit(self) -> None:
+        # Once per process, when REDIS_MAXMEMORY (e.g. "256mb") is set
+        global _memoryLimitApplied
+        maxmemory = os.getenv("REDIS_MAXMEMORY")
+        if maxmemory and not _memoryLimitApplied:
+            _memoryLimitApplied = True
+            self.redis.set_memory_limit(maxmemory)
+
+    def cacheKey(self) -> str:
+        # Questions differing only in case, spacing, punctuation or Unicode form share a key
+        return question_key(self.question)
 
     def memoization(self) -> Optional[str]:
         """
@@ -20,16 +76,26 @@ class InputController:
         """
         try:
             # Try to look up the question in Redis
-            returnObject = self.redis.lookup(key=self.question)
+            returnObject = self.redis.lookup(key=self.cacheKey())
             if returnObject:
                 return returnObject  # Return the cached result from Redis
-            else:
-                return None
+
+            if self.nearDuplicates:
+                match = self.nearDuplicates.query(self.question)
+                if match:
+                    return self.redis.lookup(key=match)
+            return None
 
         except Exception as e:
             logger.error(f"Error with memoization: {e}")
             return None  # Ensure None is returned in case of an exception
 
+    def storeResult(self, result: str) -> None:
+        key = self.cacheKey()
+        self.redis.store(key=key, value=result)
+        if self.nearDuplicates:
+            self.nearDuplicates.add(self.question, key, ttl=self.redis.default_ttl)
+
     def run(self, question: str = None):
         try:
             self.question = question
@@ -44,40 +110,288 @@ class InputController:
                 logger.info(f"Returning cached result for '{question}' from Redis")
                 return cached_result  # Return cached result from Redis
             else:
-                # If no cache, run the main method and store the result in Redis
-                result = asyncio.run(self.main(question))
-                self.redis.store(key=self.question, value=result)
-                return result
+                # If no cache, run the main method on the worker's long-lived loop and store the result in Redis
+                return run_sync(self.coalescedMain(question))
 
-    async def main(self, question: str = None) -> str:
-        start_time = time()
+    def forQuestion(self, question: str) -> "InputController":
+        # Shares the Redis client and indexes, only the question differs
+        controller = copy.copy(self)
+        controller.question = question
+        return controller
+
+    async def runBatch(self, questions: List[str], concurrency: Optional[int] = None) -> AsyncIterator[dict]:
+        """
+        Answer many questions concurrently, yielding each result as soon as it is ready.
+
+        Every result is a dict with the question's "index" in the input, the "question", its
+        "answer" (None on failure) and whether it was "cached". Questions that normalize to the
+        same key run once, cached answers come back first, and at most concurrency pipelines
+        (BATCH_CONCURRENCY) run at a time. Bing, page fetch and LLM limits are process-wide, and
+        pages cited by several questions are fetched and converted once.
+        """
+        loop = asyncio.get_running_loop()
+        concurrency = concurrency or int(os.getenv("BATCH_CONCURRENCY", 8))
+
+        groups: Dict[str, List[int]] = {}
+        for index, question in enumerate(questions):
+            if question and question.strip():
+                groups.setdefault(question_key(question), []).append(index)
+        controllers = [(self.forQuestion(questions[indexes[0]]), indexes) for indexes in groups.values()]
+
+        # Redis is a blocking client, the lookups run side by side in the executor
+        cachedResults = await asyncio.gather(
+            *(loop.run_in_executor(None, controller.memoization) for controller, _ in controllers)
+        )
+        pending = []
+        for (controller, indexes), cached in zip(controllers, cachedResults):
+            if not cached:
+                pending.append((controller, indexes))
+                continue
+            for index in indexes:
+                yield {"index": index, "question": questions[index], "answer": cached, "cached": True}
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def answer(controller, indexes):
+            async with semaphore:
+                try:
+                    result = await controller.coalescedMain(controller.question)
+                except Exception as e:
+                    logger.error(f"Error answering '{controller.question}': {e}")
+                    result = None
+            return indexes, result
+
+        tasks = [asyncio.ensure_future(answer(controller, indexes)) for controller, indexes in pending]
+        try:
+            for task in asyncio.as_completed(tasks):
+                indexes, result = await task
+                for index in indexes:
+                    yield {"index": index, "question": questions[index], "answer": result, "cached": False}
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def runBatchSync(self, questions: List[str], concurrency: Optional[int] = None) -> Iterator[dict]:
+        """
+        runBatch() for sync callers, driven on the worker's long-lived loop.
+        """
+        return iterate_sync(self.runBatch(questions, concurrency))
+
+    def submitJob(self, question: str) -> dict:
+        """
+        Start answering a question in the background and return its job without waiting.
+        """
+        self.question = question
+        return getJobManager().submit(question).toDict()
+
+    def jobStatus(self, jobId: str) -> Optional[dict]:
+        return getJobManager().get(jobId)
 
-        webSearch = WebSearch()
-        myInference = Inference()
-        myInference.base_url = "https://api.openai.com/v1/chat/completions"
+    def jobResult(self, jobId: str) -> Optional[str]:
+        job = self.jobStatus(jobId)
+        if job and job["status"] == DONE:
+            return job["result"]
+        return None
 
-        if question:
-            myInference.setQuestion(question)
+    def cancelJob(self, jobId: str) -> bool:
+        return getJobManager().cancel(jobId)
 
-        # Perform the web search and inference
-        webSearch.searchAPI(myInference.formattedQuestion)
-        myInference.question = question
-        myInference.pagesInMD = webSearch.pagesContentsMD
+    def subscribeJob(self, jobId: str) -> AsyncIterator[dict]:
+        return getJobManager().subscribe(jobId)
 
-        start_time_inference = time()
-        await myInference.populatePageResponsesAsync()
+    async def runAsync(self, question: str) -> Optional[str]:
+        """
+        Async version of run() for servers that await the pipeline on their own loop.
+        """
+        self.question = question
+        if not self.question:
+            return None
 
-        final_answer = myInference.finalAnswer()
-        end_time_inference = time()
+        loop = asyncio.get_running_loop()
+        cached_result = await loop.run_in_executor(None, self.memoization)
+        if cached_result:
+            logger.info(f"Returning cached result for '{question}' from Redis")
+            return cached_result
+        return await self.coalescedMain(question)
 
-        total_time = time() - start_time
+    async def joinFlight(self) -> Optional[Flight]:
+        if self.singleFlight is None:
+            return None
+        return await self.singleFlight.join(self.cacheKey(), self.memoization)
 
-        logger.info(f"""
-            Total time taken: {total_time:.2f} seconds
-            Time taken for inference: {end_time_inference - start_time_inference:.2f} seconds
+    async def coalescedMain(self, question: str) -> Optional[str]:
+        """
+        Run main() and store its result, unless another request for the question is already
+        running, in which case its result is shared.
+        """
+        loop = asyncio.get_running_loop()
+        flight = await self.joinFlight()
+        if flight is not None and flight.result:
+            logger.info(f"Sharing in-flight result for '{question}'")
+            return flight.result
+
+        result = None
+        try:
+            result = await self.main(question)
+            if result:
+                # Stored before the lease is released, waiters in other workers read it from Redis.
+                # The answer is still returned when Redis is unavailable
+                try:
+                    await loop.run_in_executor(None, self.storeResult, result)
+                except Exception as e:
+                    logger.error(f"Error storing result in Redis: {e}")
+        finally:
+            if flight is not None:
+                await flight.finish(result)
+        return result
+
+    async def stream(self, question: str) -> AsyncIterator[dict]:
+        """
+        Yield progress events and answer tokens for a question, serving cached answers immediately.
+
+        Every event is a dict with an "event" name and a "data" payload.
+        """
+        self.question = question
+
+        # Redis is a blocking client, keep the lookup off the event loop
+        loop = asyncio.get_running_loop()
+        cached_result = await loop.run_in_executor(None, self.memoization)
+        if cached_result:
+            logger.info(f"Returning cached result for '{question}' from Redis")
+            yield {"event": "answer", "data": {"answer": cached_result, "cached": True}}
+            yield {"event": "done", "data": {"cached": True}}
+            return
+
+        flight = await self.joinFlight()
+        if flight is not None and flight.result:
+            logger.info(f"Sharing in-flight result for '{question}'")
+            yield {"event": "answer", "data": {"answer": flight.result, "cached": True}}
+            yield {"event": "done", "data": {"cached": True}}
+            return
+
+        result = None
+        try:
+            tokens = []
+            failed = False
+            async for event in self.pipeline(question, streamAnswer=True):
+                if event["event"] == "token":
+                    tokens.append(event["data"]["text"])
+                if event["event"] == "error":
+                    failed = True
+                yield event
+
+            # A stream cut off part way is neither cached nor shared with waiting askers
+            if failed:
+                return
+            result = "".join(tokens)
+            if result:
+                try:
+                    await loop.run_in_executor(None, self.storeResult, result)
+                except Exception as e:
+                    logger.error(f"Error storing result in Redis: {e}")
+                yield {"event": "done", "data": {"cached": False}}
+            else:
+                yield {"event": "error", "data": {"message": "No answer was generated"}}
+        finally:
+            if flight is not None:
+                await flight.finish(result or None)
+
+    async def pipeline(
+        self, question: str, streamAnswer: bool = False, deadline: Optional[float] = None
+    ) -> AsyncIterator[dict]:
+        """
+        Run the search and inference stages, yielding an event as each one completes.
+
+        With streamAnswer the final answer arrives as "token" events, otherwise as a single "answer" event.
+        A "sources" event with the URLs the answer was based on follows it. With a deadline
+        (seconds, ANSWER_DEADLINE by default) page summaries stop early enough for the final
+        answer to start within it, and the answer uses the summaries that arrived in time.
+        """
+        with trace("question", question=question) as span:
+            webSearch = WebSearch()
+            myInference = Inference()
+            myInference.base_url = os.getenv("OPENAI_CHAT_URL", "https://api.openai.com/v1/chat/completions")
+            myInference.question = question
+
+            deadline = deadline if deadline is not None else self.deadline
+            if deadline:
+                # Part of the budget is kept back for the final answer itself
+                answerTime = min(float(os.getenv("ANSWER_TIME_RESERVE", 5)), deadline / 2)
+                myInference.summaryDeadline = asyncio.get_running_loop().time() + deadline - answerTime
+
+            # Search the raw question while the LLM reformats it
+            rawSearch = asyncio.ensure_future(webSearch.searchResultsAsync(question))
+            try:
+                await myInference.setQuestionAsync(question)
+                yield {"event": "formatted_query", "data": {"query": myInference.formattedQuestion}}
+
+                formattedSearch = None
+                if myInference.formattedQuestion and myInference.formattedQuestion != question:
+                    formattedSearch = await webSearch.searchResultsAsync(myInference.formattedQuestion)
+                rawResults = await rawSearch
+            finally:
+                rawSearch.cancel()
+
+            # Results for the reformatted query are preferred, the raw ones fill the gaps, and
+            # only the candidates whose snippets match the question are fetched
+            candidates = webSearch.mergeResults(formattedSearch, rawResults)
+            webSearch.pages = webSearch.rankResults(candidates, question, myInference.formattedQuestion)
+
+            totalPages = len(webSearch.pages["webPages"]["value"])
+            span.set(candidates=len(candidates["webPages"]["value"]), results=totalPages)
+            yield {"event": "search_done", "data": {"results": totalPages}}
+
+            # Each page is summarized as soon as its markdown is ready rather than after the slowest download
+            completed = 0
+            async for index, summary in myInference.iterPageResponsesAsync(
+                webSearch.iterPagesContentsAsync()
+            ):
+                completed += 1
+                if summary is not None:
+                    myInference.addSummary(index, summary)
+                else:
+                    logger.error("Error: Unable to process one of the pages")
+                yield {
+                    "event": "page_summarized",
+                    "data": {
+                        "page": index,
+                        "ok": summary is not None,
+                        "completed": completed,
+                        "total": totalPages,
+                    },
+                }
+            span.set(
+                summaries=len(myInference.pageRelevantResponses),
+                summary_cache_hits=myInference.summaryCacheHits,
+            )
+
+            if streamAnswer:
+                async for token in myInference.finalAnswerStream():
+                    yield {"event": "token", "data": {"text": token}}
+                if myInference.answerError:
+                    # The tokens so far are a truncated answer, consumers must not keep them
+                    span.set(error=myInference.answerError)
+                    yield {"event": "error", "data": {"message": myInference.answerError}}
+                    return
+            else:
+                final_answer = await myInference.finalAnswerAsync()
+                yield {"event": "answer", "data": {"answer": final_answer, "cached": False}}
+            yield {"event": "sources", "data": {"sources": myInference.sourcesUsed}}
+            span.set(tokens=myInference.usage.toDict(), sources=len(myInference.sourcesUsed))
+
+        logger.info(
+            f"Answered '{question}' in {span.duration:.2f} seconds using "
+            f"{myInference.usage.promptTokens} prompt and {myInference.usage.completionTokens} completion tokens"
+        )
+
+    async def main(self, question: str = None) -> str:
+        final_answer = None
+        async for event in self.pipeline(question):
+            if event["event"] == "answer":
+                final_answer = event["data"]["answer"]
+            if event["event"] == "sources":
+                self.sources = event["data"]["sources"]
 
-            Final Answer: {final_answer.json()["choices"][0]["message"]["content"]}
-            """)
+        logger.info(f"Final Answer: {final_answer}")
 
-        # Return the final answer from the API response
-        return final_answer.json()["choices"][0]["message"]["content"]
\ No newline at end of file
+        return final_answer
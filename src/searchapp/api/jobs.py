@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from searchapp.utils.aio import get_loop
+from searchapp.utils.caching import JSONCache
+from searchapp.utils.keys import question_key
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class Job:
+    def __init__(self, question: str, jobId: Optional[str] = None):
+        self.id = jobId or uuid.uuid4().hex
+        self.question = question
+        self.key = question_key(question, "job")
+        self.status = QUEUED
+        self.result: Optional[str] = None
+        self.error: Optional[str] = None
+        self.cached = False
+        self.sources: List[str] = []
+        self.events: List[dict] = []
+        self.createdAt = time.time()
+        self.updatedAt = self.createdAt
+        self.task: Optional[asyncio.Task] = None
+        self.cancelRequested = False
+        # Replaced on every update, subscribers wait on the current one
+        self.changed: Optional[asyncio.Event] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def toDict(self) -> dict:
+        return {
+            "id": self.id,
+            "question": self.question,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "cached": self.cached,
+            "sources": self.sources,
+            "events": self.events,
+            "created_at": self.createdAt,
+            "updated_at": self.updatedAt,
+        }
+
+
+class JobManager:
+    """
+    Runs questions in the background so a request only has to submit and then poll.
+
+    Jobs run on the worker's long-lived loop, at most max_workers at a time, and a question
+    already queued or running is not submitted twice. Every state change is mirrored to
+    Redis so status, events and cancellation work from any worker; runs for the same
+    question in different workers are coalesced by the controller's single-flight lease.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[str], AsyncIterator[dict]],
+        max_workers: Optional[int] = None,
+        ttl: Optional[int] = None,
+        store: Optional[JSONCache] = None,
+        cancel_flags: Optional[JSONCache] = None,
+        poll_interval: float = 0.5,
+    ):
+        self.runner = runner
+        self.max_workers = max_workers or int(os.getenv("JOB_WORKERS", 4))
+        self.ttl = ttl or int(os.getenv("JOB_TTL", 60 * 60))
+        self.store = store or JSONCache("job", ttl=self.ttl, metrics=False)
+        # No local tier, a cancel written by another worker has to be seen here
+        self.cancel_flags = cancel_flags or JSONCache("jobcancel", ttl=self.ttl, metrics=False)
+        self.poll_interval = poll_interval
+        self.jobs: Dict[str, Job] = {}
+        self.active: Dict[str, str] = {}
+        self.lock = threading.Lock()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def submit(self, question: str) -> Job:
+        """
+        Queue a question and return its job, or the job already working on the same question.
+        """
+        job = Job(question)
+        with self.lock:
+            existing = self.active.get(job.key)
+            if existing and existing in self.jobs:
+                logger.info(f"Question '{question}' is already job {existing}")
+                return self.jobs[existing]
+            self.jobs[job.id] = job
+            self.active[job.key] = job.id
+
+        self.save(job)
+        asyncio.run_coroutine_threadsafe(self.run(job), get_loop())
+        return job
+
+    def get(self, jobId: str) -> Optional[dict]:
+        job = self.jobs.get(jobId)
+        if job is not None:
+            return job.toDict()
+        return self.store.get(jobId)
+
+    def cancel(self, jobId: str) -> bool:
+        job = self.jobs.get(jobId)
+        if job is None:
+            # Owned by another worker, which checks the flag between events
+            state = self.store.get(jobId)
+            if not state or state["status"] in FINISHED:
+                return False
+            self.cancel_flags.set(jobId, True)
+            return True
+
+        if job.finished:
+            return False
+        get_loop().call_soon_threadsafe(self._cancelLocal, job)
+        return True
+
+    def _cancelLocal(self, job: Job) -> None:
+        # On the loop, a job that has not started yet is cancelled when it does
+        job.cancelRequested = True
+        if job.task is not None:
+            job.task.cancel()
+
+    async def run(self, job: Job) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        job.task = asyncio.current_task()
+
+        try:
+            if job.cancelRequested:
+                raise asyncio.CancelledError()
+            async with self._semaphore:
+                await self.update(job, status=RUNNING)
+                tokens = []
+                events = self.runner(job.question)
+                try:
+                    async for event in events:
+                        if event["event"] == "token":
+                            # Tokens are joined into the result instead of being kept one by one
+                            tokens.append(event["data"]["text"])
+                            continue
+                        if event["event"] == "answer":
+                            job.result = event["data"]["answer"]
+                            job.cached = event["data"].get("cached", False)
+                        if event["event"] == "sources":
+                            job.sources = event["data"]["sources"]
+                        if event["event"] == "error":
+                            job.error = event["data"].get("message")
+                        await self.update(job, event=event)
+
+                        if await self.remoteCancel(job):
+                            raise asyncio.CancelledError()
+                finally:
+                    await events.aclose()
+
+                # Tokens of a stream that failed part way are a truncated answer
+                if tokens and not job.error:
+                    job.result = "".join(tokens)
+                await self.update(job, status=DONE if job.result else FAILED)
+        except asyncio.CancelledError:
+            await self.update(job, status=CANCELLED)
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {e}")
+            job.error = str(e)
+            await self.update(job, status=FAILED)
+        finally:
+            job.task = None
+            with self.lock:
+                if self.active.get(job.key) == job.id:
+                    del self.active[job.key]
+            self.prune()
+
+    async def update(self, job: Job, status: Optional[str] = None, event: Optional[dict] = None) -> None:
+        if status is not None:
+            job.status = status
+        if event is not None:
+            job.events.append(event)
+        job.updatedAt = time.time()
+
+        if job.changed is not None:
+            job.changed.set()
+        job.changed = asyncio.Event()
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.save, job)
+
+    async def remoteCancel(self, job: Job) -> bool:
+        loop = asyncio.get_running_loop()
+        return bool(await loop.run_in_executor(None, self.cancel_flags.get, job.id))
+
+    def save(self, job: Job) -> None:
+        self.store.set(job.id, job.toDict())
+
+    def prune(self) -> None:
+        # Drop finished jobs from memory once Redis has expired them too
+        cutoff = time.time() - self.ttl
+        with self.lock:
+            for jobId in [jobId for jobId, job in self.jobs.items() if job.finished and job.updatedAt < cutoff]:
+                del self.jobs[jobId]
+
+    async def subscribe(self, jobId: str) -> AsyncIterator[dict]:
+        """
+        Yield a job's events as they happen, then a final "job" event with its state.
+
+        Must run on the worker's loop (iterate_sync). Jobs owned by another worker are polled.
+        """
+        loop = asyncio.get_running_loop()
+        sent = 0
+        while True:
+            job = self.jobs.get(jobId)
+            if job is not None:
+                if job.changed is None:
+                    job.changed = asyncio.Event()
+                changed = job.changed
+                state = job.toDict()
+            else:
+                changed = None
+                state = await loop.run_in_executor(None, self.store.get, jobId)
+                if state is None:
+                    return
+
+            for event in state["events"][sent:]:
+                yield event
+            sent = len(state["events"])
+
+            if state["status"] in FINISHED:
+                state = dict(state)
+                state.pop("events")
+                yield {"event": "job", "data": state}
+                return
+
+            if changed is not None:
+                await changed.wait()
+            else:
+                await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,183 @@
+import logging
+import re
+from typing import List, Optional
+
+from searchapp.utils.ranking import BM25, estimateTokens, topK
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def splitChunks(markdown: str, maxTokens: int = 200) -> List[str]:
+    """
+    Split markdown into chunks of roughly maxTokens, keeping paragraphs together where possible.
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    currentTokens = 0
+
+    for paragraph in re.split(r"\n\s*\n", markdown):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+
+        # Paragraphs that are too long on their own are split on sentences, then words
+        pieces = [paragraph]
+        if estimateTokens(paragraph) > maxTokens:
+            pieces = _splitLong(paragraph, maxTokens)
+
+        for piece in pieces:
+            tokens = estimateTokens(piece)
+            if current and currentTokens + tokens > maxTokens:
+                chunks.append("\n\n".join(current))
+                current, currentTokens = [], 0
+            current.append(piece)
+            currentTokens += tokens
+
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _splitLong(text: str, maxTokens: int) -> List[str]:
+    pieces: List[str] = []
+    current = ""
+    for sentence in SENTENCE_END.split(text):
+        if estimateTokens(sentence) > maxTokens:
+            words = sentence.split()
+            step = max(1, maxTokens * 3 // 4)  # roughly 0.75 English words per token
+            parts = [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+        else:
+            parts = [sentence]
+
+        for part in parts:
+            if current and estimateTokens(current) + estimateTokens(part) > maxTokens:
+                pieces.append(current)
+                current = ""
+            current = f"{current} {part}".strip()
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def selectChunks(
+    question: str,
+    markdown: str,
+    tokenBudget: int = 1500,
+    topKChunks: int = 8,
+    chunkTokens: int = 200,
+) -> str:
+    """
+    Keep only the chunks of a page that best match the question, within tokenBudget.
+
+    Pages already under the budget are returned unchanged. The "source:" line written by
+    the extractor is always kept so the model can still cite the page.
+    """
+    if estimateTokens(markdown) <= tokenBudget:
+        return markdown
+
+    header = ""
+    body = markdown
+    if markdown.startswith("source:"):
+        header, _, body = markdown.partition("\n")
+
+    chunks = splitChunks(body, chunkTokens)
+    if not chunks:
+        return markdown
+
+    scores = BM25(chunks).scores(question or "")
+    selected: List[int] = []
+    used = estimateTokens(header)
+    for index in topK(scores, topKChunks):
+        tokens = estimateTokens(chunks[index])
+        if used + tokens > tokenBudget:
+            continue
+        selected.append(index)
+        used += tokens
+
+    # Nothing matched, the start of the page is the best guess
+    if not selected or scores.max() <= 0:
+        selected = []
+        used = estimateTokens(header)
+        for index, chunk in enumerate(chunks):
+            if used + estimateTokens(chunk) > tokenBudget:
+                break
+            selected.append(index)
+            used += estimateTokens(chunk)
+
+    # Put the chunks back in page order and mark the gaps
+    parts = []
+    previous = None
+    for index in sorted(selected):
+        if previous is not None and index != previous + 1:
+            parts.append("[...]")
+        parts.append(chunks[index])
+        previous = index
+
+    logger.debug(f"Selected {len(selected)} of {len(chunks)} chunks, ~{used} tokens")
+    content = "\n\n".join(parts)
+    return f"{header}\n{content}" if header else content
+
+
+def splitSentences(markdown: str) -> List[str]:
+    """
+    Sentences of a page in order. Headings, list items and table rows count as one sentence each.
+    """
+    sentences: List[str] = []
+    for line in markdown.splitlines():
+        line = line.strip().lstrip("#>*-| ").strip()
+        if not line:
+            continue
+        sentences.extend(sentence.strip() for sentence in SENTENCE_END.split(line) if sentence.strip())
+    return sentences
+
+
+def extractPassages(
+    question: str,
+    markdown: str,
+    topKSentences: int = 6,
+    tokenBudget: int = 400,
+    minWords: int = 4,
+) -> Optional[str]:
+    """
+    The sentences of a page that best match the question (BM25), in page order and within
+    tokenBudget, as a local stand-in for an LLM summary of the page.
+
+    Returns None when no sentence shares a term with the question. The "source:" line is
+    kept in front so the answer can cite the page.
+    """
+    header = ""
+    body = markdown or ""
+    if body.startswith("source:"):
+        header, _, body = body.partition("\n")
+
+    # Fragments such as navigation links or captions only add noise
+    sentences = [sentence for sentence in splitSentences(body) if len(sentence.split()) >= minWords]
+    if not sentences:
+        return None
+
+    scores = BM25(sentences).scores(question or "")
+    selected: List[int] = []
+    used = 0
+    for index in topK(scores, topKSentences):
+        if scores[index] <= 0:
+            break
+        tokens = estimateTokens(sentences[index])
+        if used + tokens > tokenBudget:
+            continue
+        selected.append(index)
+        used += tokens
+    if not selected:
+        return None
+
+    parts = []
+    previous = None
+    for index in sorted(selected):
+        if previous is not None and index != previous + 1:
+            parts.append("[...]")
+        parts.append(sentences[index])
+        previous = index
+
+    content = " ".join(parts)
+    return f"{header}\n{content}" if header else content
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import AsyncIterator, Optional, Tuple
+
+import aiohttp
+
+from searchapp.utils.aio import SharedSession, add_shutdown_hook
+from searchapp.utils.ratelimit import parse_retry_after
+from searchapp.utils.resilience import ResiliencePolicy, UpstreamError, shared_policy
+
+logger = logging.getLogger(__name__)
+
+
+class LLMClient:
+    """
+    Process-wide client for the chat completions endpoint.
+
+    Keeps one keep-alive connection pool per event loop and caps the number of
+    requests in flight with a semaphore, so every Inference in the worker shares it.
+    Calls go through the "llm" resilience policy: a timeout per attempt, retries of 429
+    and 5xx, optional hedging (LLM_HEDGE) and a circuit breaker.
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None, pool_size: Optional[int] = None):
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", 10))
+        self.pool_size = pool_size or int(os.getenv("LLM_POOL_SIZE", 20))
+        self.shared = SharedSession(
+            limit=self.pool_size,
+            keepalive_timeout=60,
+            max_concurrency=self.max_concurrency,
+        )
+        self.policy: ResiliencePolicy = shared_policy("llm", timeout=30)
+
+    async def postJson(
+        self, url: str, headers: dict, payload: dict, timeout: Optional[float] = None
+    ) -> Tuple[int, Optional[dict]]:
+        """
+        POST a JSON payload and return (status, decoded body). The body is None for non-200 responses.
+
+        Connection errors, timeouts and CircuitOpenError are raised to the caller once the retries are spent.
+        """
+        timeout = timeout or self.policy.timeout
+
+        async def attempt() -> dict:
+            async with self.shared.session.post(
+                url,
+                headers=headers,
+                json=payload,
+                timeout=aiohttp.ClientTimeout(total=timeout),
+            ) as response:
+                if response.status != 200:
+                    logger.debug(f"Response content: {await response.text()}")
+                    raise UpstreamError(response.status, retryAfter(response))
+                return await response.json(content_type=None)
+
+        # Waiting for a concurrency slot is local queueing, it must not count against the upstream
+        try:
+            return 200, await self.policy.call(attempt, timeout=timeout, gate=lambda: self.shared.semaphore)
+        except UpstreamError as e:
+            return e.status, None
+
+    async def streamJson(
+        self, url: str, headers: dict, payload: dict, timeout: float = 60
+    ) -> AsyncIterator[dict]:
+        """
+        POST a payload with "stream": true and yield each server-sent JSON chunk.
+
+        Failures before the first chunk are retried under the policy; after that the stream
+        cannot be resumed. Raises aiohttp.ClientResponseError for non-200 responses.
+        """
+        attempt = 0
+        while True:
+            self.policy.check()
+            started = False
+            try:
+                async with self.shared.semaphore:
+                    async with self.shared.session.post(
+                        url,
+                        headers=headers,
+                        json=dict(payload, stream=True),
+                        timeout=aiohttp.ClientTimeout(total=timeout),
+                    ) as response:
+                        if response.status != 200:
+                            error = UpstreamError(response.status, retryAfter(response), message=await response.text())
+                            delay = self.policy.retryDelay(error, attempt)
+                            self.policy.failed(error)
+                            if delay is None:
+                                raise aiohttp.ClientResponseError(
+                                    response.request_info,
+                                    response.history,
+                                    status=response.status,
+                                    message=str(error),
+                                )
+                            raise error
+
+                        async for rawLine in response.content:
+                            line = rawLine.decode("utf-8").strip()
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[len("data:"):].strip()
+                            if data == "[DONE]":
+                                break
+                            if not started:
+                                started = True
+                                self.policy.succeeded()
+                            yield json.loads(data)
+                if not started:
+                    self.policy.succeeded()
+                return
+            except (UpstreamError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if not isinstance(e, UpstreamError):
+                    self.policy.failed(e)
+                delay = None if started else self.policy.retryDelay(e, attempt)
+                if delay is None:
+                    raise
+                logger.warning(f"Chat stream failed ({e!r}), retry {attempt + 1} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def close(self) -> None:
+        await self.shared.close()
+
+
+def retryAfter(response: aiohttp.ClientResponse) -> Optional[float]:
+    header = response.headers.get("Retry-After")
+    return parse_retry_after(header) if header else None
+
+
+_client: Optional[LLMClient] = None
+_clientLock = threading.Lock()
+
+
+def getClient() -> LLMClient:
+    global _client
+    with _clientLock:
+        if _client is None:
+            _client = LLMClient()
+            add_shutdown_hook(closeClient)
+        return _client
+
+
+async def closeClient() -> None:
+    global _client
+    client, _client = _client, None
+    if client is not None:
+        await client.close()
@@ -4,22 +4,70 @@ import os
 import asyncio
 import aiohttp
 import requests
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional, Tuple
+
+from searchapp.utils.caching import JSONCache, shared_json_cache
+from searchapp.utils.keys import question_key
+from searchapp.utils.ratelimit import parse_retry_after
+from searchapp.utils.resilience import CircuitOpenError, UpstreamError
+from searchapp.utils.telemetry import record_upstream_error, stage, status_kind
+from .chunking import extractPassages, selectChunks
+from .client import LLMClient, getClient
+from .summary_cache import SummaryCache, getSummaryCache
+from .tokens import TokenBudget, TokenBudgetExceeded, TokenUsage, countMessageTokens, countTokens
 
 logger = logging.getLogger(__name__)
 
+# Instructions and system message around a page in a summary prompt
+SUMMARY_PROMPT_TOKENS = 200
+# Pages that would have to be cut shorter than this to fit the budget are skipped
+MIN_PAGE_TOKENS = 200
+
 class Inference:
     def __init__(self):
         self.base_url = "http://localhost:1234/v1/chat/completions"
         self.api_key = os.getenv("OPENAI_API_KEY")
         self.pagesInMD = []
         self.pageRelevantResponses = []
+        self.summarySources: List[Optional[str]] = []  # Page URL of each summary
+        self.sourcesUsed: List[str] = []  # URLs of the summaries the final answer was given
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}",
         }
-        self.tokensUsedInput = 0  # Track tokens within the class
-        self.semaphore = asyncio.Semaphore(10)
+        self.tokensUsedInput = 0  # Prompt tokens of every chat call for this question
+        self.tokensUsedOutput = 0
+        self.usage = TokenUsage()
+        # Prompt and completion tokens one question may spend, 0 for no limit
+        self.tokenBudget = TokenBudget(int(os.getenv("QUESTION_TOKEN_BUDGET", 32000)))
+        # Kept back from page summaries so the final answer always fits
+        self.answerTokenReserve = int(os.getenv("ANSWER_TOKEN_RESERVE", 4000))
+        self.summaryTokens = 300  # Expected length of a page summary
+        # Final answers are longer than the other calls, they get their own timeout
+        self.answerTimeout = float(os.getenv("ANSWER_TIMEOUT", 60))
+        # Why finalAnswerStream stopped early, None when the stream finished. The tokens it
+        # yielded are then a truncated answer that must not be stored or shared
+        self.answerError: Optional[str] = None
+        self.client: LLMClient = getClient()  # Shared connection pool and concurrency limit
+        self.summaryConcurrency = 5  # Per-question limit on page summaries in flight
+        self.pageQueueSize = 5  # Pages waiting for a summarizer before the fetcher is held back
+        # Stop summarizing after this many useful summaries (0 waits for every page), or at
+        # summaryDeadline (event loop time) when the caller set a latency budget
+        self.summaryTarget = int(os.getenv("SUMMARY_TARGET", 0))
+        self.summaryDeadline: Optional[float] = None
+        self.pageTokenBudget = int(os.getenv("PAGE_TOKEN_BUDGET", 1500))  # 0 sends whole pages
+        self.pageTopChunks = int(os.getenv("PAGE_TOP_CHUNKS", 8))
+        # Fast mode replaces the per-page LLM summaries with the best matching sentences of
+        # each page, so a question costs two chat calls: the query rewrite and the answer
+        self.fastMode = os.getenv("FAST_MODE", "0").lower() in ("1", "true", "yes")
+        self.fastSentences = int(os.getenv("FAST_MODE_SENTENCES", 6))  # Sentences kept per page
+        self.fastPageTokens = int(os.getenv("FAST_MODE_PAGE_TOKENS", 400))
+        self.summaryCache: Optional[SummaryCache] = getSummaryCache()
+        self.summaryCacheHits = 0
+        queryCacheTTL = int(os.getenv("QUERY_CACHE_TTL", 7 * 24 * 60 * 60))  # 0 disables it
+        self.queryCache: Optional[JSONCache] = (
+            shared_json_cache("query", ttl=queryCacheTTL) if queryCacheTTL else None
+        )
         self.lock = asyncio.Lock()  # Lock for thread safety
         self.question: Optional[str] = None
         self.formattedQuestion: Optional[str] = None
@@ -30,54 +78,46 @@ class Inference:
         logger.debug(f"Formatted question: {self.formattedQuestion}")
 
     def populatePageResponses(self) -> None:
-        for page in self.pagesInMD:
-            response = self.relevantPageResponse(page)
+        for index, page in enumerate(self.pagesInMD):
+            if self.fastMode:
+                passages = self.extractPage(page)
+                if passages is not None:
+                    self.addSummary(index, passages)
+                continue
+            try:
+                response = self.relevantPageResponse(page)
+            except (CircuitOpenError, TokenBudgetExceeded, requests.RequestException) as e:
+                logger.error(f"Error: Unable to summarize {self.sourceOf(index)}: {e}")
+                continue
             if response.status_code == 200:
-                self.pageRelevantResponses.append(
-                    response.json()["choices"][0]["message"]["content"]
-                )
+                self.addSummary(index, response.json()["choices"][0]["message"]["content"])
             else:
                 logger.error(
-                    f"Error: Unable to access {page['url']} (status code: {response.status_code})"
+                    f"Error: Unable to summarize {self.sourceOf(index)} (status code: {response.status_code})"
                 )
 
     def finalAnswer(self, searchResults="No results were found in the search"):
+        """
+        Blocking final answer. Raises TokenBudgetExceeded when the prompt does not fit the budget.
+        """
         if len(self.pageRelevantResponses) == 0:
             logger.error("No relevant pages found.")
 
         logger.debug(f"Search results: {len(self.pageRelevantResponses)}")
         logger.debug(f"Search results: {self.pageRelevantResponses}")
 
-        preparedPrompt = f"""
-        You are helping a user search the internet and answer a question. Here are the results of their internet search. Only answer the questions based on the search results. Mention the website if the answer came from a website. Format the answer in markdown:
-
-        Search results:
-
-        {self.pageRelevantResponses}
-
-        Based on the search results, what is the answer to the user's question?
-        Here's their question: {self.question}
-        """
-
-        response = requests.post(
-            headers=self.headers,
-            url=self.base_url,
-            json={
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "You helping to answer a query from a user. You are specifically good with searching the internet for results.",
-                        "role": "user",
-                        "content": preparedPrompt,
-                    }
-                ],
-                "model": "gpt-4o-mini",
-                "temperature": 0.2,
-            },
+        return self.postChat(
+            self.finalAnswerPrompt(), purpose="final_answer", timeout=self.answerTimeout, limitCompletion=True
         )
-        return response
 
     def relevantPageResponse(self, pageInMD="No details were available for the page"):
+        # Same page reservation and trimming as relevantPageResponseAsync
+        tokenLimit, reserved = self.reservePageTokens()
+        if tokenLimit is not None and tokenLimit < MIN_PAGE_TOKENS:
+            raise TokenBudgetExceeded("Question token budget reached, skipping a page")
+        if tokenLimit and pageInMD:
+            pageInMD = selectChunks(self.question, pageInMD, tokenLimit, self.pageTopChunks)
+
         preparedPrompt = f"""
         You are helping a user search the internet and answer a question. Here's the raw page formatted in markdown. Based on this data, generate a summary of why this question relates to the user's question. If it answers the user's question, provide the answer and also mention the website it came from:
 
@@ -87,83 +127,353 @@ class Inference:
         {pageInMD}
         """
 
-        response = requests.post(
-            headers=self.headers,
-            url=self.base_url,
-            json={
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "You helping to answer a query from a user. You are specifically good with searching the internet for results.",
-                        "role": "user",
-                        "content": preparedPrompt,
-                    }
-                ],
-                "model": "gpt-4o-mini",
-                "temperature": 0.2,
-            },
-        )
-        return response
+        # Covered by the page's reservation
+        try:
+            return self.postChat(preparedPrompt, purpose="summarize", reserve=False)
+        finally:
+            self.tokenBudget.settle(reserved, 0)
 
     def formatQuestion(self, question=""):
-        preparedPrompt = f"""
-        You are helping a user search the internet and answer a question. Here's the question from the user. Based on the question, can you reformat the question into a good query for a search engine? For example, if the user's question is "I am having trouble with my computer overheating. What should I do?" you could reformat it as "How to prevent computer overheating". Respond only with the reformatted question. Do not use the site keyword in the query:
+        preparedPrompt = self.formatQuestionPrompt(question)
 
-        user's question: {question}
-        """
-
-        response = requests.post(
-            headers=self.headers,
-            url=self.base_url,
-            json={
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "You helping to answer a query from a user. You are specifically good with searching the internet for results.",
-                        "role": "user",
-                        "content": preparedPrompt,
-                    }
-                ],
-                "model": "gpt-4o-mini",
-                "temperature": 0.2,
-            },
-        )
+        # Fall back to the raw question so the search can still run
+        try:
+            response = self.postChat(preparedPrompt, purpose="format_question")
+        except (CircuitOpenError, TokenBudgetExceeded, requests.RequestException) as e:
+            logger.error(f"Unable to format the question, searching with the raw question: {e}")
+            return question
+        if response.status_code != 200:
+            logger.error(f"Unable to format the question (status code: {response.status_code})")
+            return question
+        return response.json()["choices"][0]["message"]["content"]
 
-        if response.status_code == 200:
-            return response.json()["choices"][0]["message"]["content"]
-        return response
+    def postChat(
+        self,
+        preparedPrompt: str,
+        purpose: str = "chat",
+        reserve: bool = True,
+        timeout: Optional[float] = None,
+        limitCompletion: bool = False,
+    ) -> requests.Response:
+        """
+        Blocking chat request under the LLM client's timeout, retries and circuit breaker,
+        counted against the question's token budget like postChatAsync.
 
-    async def populatePageResponsesAsync(self):
-        # List of async tasks for each page in Markdown format
-        tasks = [self.relevantPageResponseAsync(page) for page in self.pagesInMD]
+        Returns the last response whatever its status; connection errors, timeouts and
+        CircuitOpenError are raised once the retries are spent, and TokenBudgetExceeded
+        without sending anything when the prompt does not fit the budget. With
+        limitCompletion the reply is capped at what is left of the budget.
+        """
+        policy = self.client.policy
+        payload = self.buildPayload(preparedPrompt)
+        promptTokens = countMessageTokens(payload["messages"], payload["model"])
+        reserved = promptTokens if reserve else 0
+        if reserve and not self.tokenBudget.reserve(promptTokens):
+            raise TokenBudgetExceeded(f"Token budget exhausted, skipping the {purpose} call ({promptTokens} prompt tokens)")
+        if limitCompletion and not self.setCompletionLimit(payload):
+            self.tokenBudget.settle(reserved, 0)
+            raise TokenBudgetExceeded(f"No token budget left for the {purpose} reply")
 
-        # Run all tasks asynchronously and gather results
-        results = await asyncio.gather(*tasks)
+        def attempt() -> requests.Response:
+            response = requests.post(
+                headers=self.headers,
+                url=self.base_url,
+                json=payload,
+                timeout=timeout or policy.timeout,
+            )
+            if response.status_code == 429 or response.status_code >= 500:
+                retry_after = response.headers.get("Retry-After")
+                raise UpstreamError(
+                    response.status_code, parse_retry_after(retry_after) if retry_after else None, response=response
+                )
+            return response
 
-        for result in results:
-            if result and result.status == 200:
+        spent = 0
+        try:
+            try:
+                response = policy.callSync(attempt)
+            except UpstreamError as e:
+                response = e.response
+            if response.status_code == 200:
                 try:
-                    # Read the response content as text
-                    raw_content = await result.text()
-                    logger.debug(f"Raw response content: {raw_content}")
-
-                    # Attempt to parse it as JSON
-                    json_resp = await result.json()
-                    self.pageRelevantResponses.append(
-                        json_resp["choices"][0]["message"]["content"]
+                    body = response.json()
+                    spent = self.recordUsage(
+                        purpose, promptTokens, body["choices"][0]["message"]["content"], body.get("usage")
                     )
-                except aiohttp.ClientConnectionError:
-                    logger.error("Error parsing JSON: Connection closed")
-                except Exception as e:
+                except (KeyError, IndexError, ValueError) as e:
                     logger.error(f"Error parsing JSON: {e}")
+                    record_upstream_error("llm", "decode")
+            return response
+        finally:
+            self.tokenBudget.settle(reserved, spent)
+
+    async def setQuestionAsync(self, question: str) -> None:
+        self.question = question
+        with stage("format_question"):
+            self.formattedQuestion = await self.formatQuestionAsync(self.question)
+        logger.debug(f"Formatted question: {self.formattedQuestion}")
+
+    async def formatQuestionAsync(self, question="") -> str:
+        loop = asyncio.get_running_loop()
+        cacheKey = question_key(question, namespace="q")
+        if self.queryCache is not None:
+            cached = await loop.run_in_executor(None, self.queryCache.get, cacheKey)
+            if cached:
+                logger.debug(f"Formatted query cache hit for '{question}'")
+                return cached
+
+        content = await self.postChatAsync(self.formatQuestionPrompt(question), purpose="format_question")
+
+        # Fall back to the raw question so the search can still run
+        if content is None:
+            logger.error("Unable to format the question, searching with the raw question")
+            return question
+
+        content = content.strip()
+        if self.queryCache is not None:
+            await loop.run_in_executor(None, self.queryCache.set, cacheKey, content)
+        return content
+
+    async def finalAnswerAsync(self) -> Optional[str]:
+        if len(self.pageRelevantResponses) == 0:
+            logger.error("No relevant pages found.")
+
+        logger.debug(f"Search results: {len(self.pageRelevantResponses)}")
+
+        with stage("final_answer"):
+            return await self.postChatAsync(
+                self.finalAnswerPrompt(), purpose="final_answer", timeout=self.answerTimeout, limitCompletion=True
+            )
+
+    async def finalAnswerStream(self) -> AsyncIterator[str]:
+        """
+        Yield the final answer token by token as the chat endpoint streams it.
+        """
+        if len(self.pageRelevantResponses) == 0:
+            logger.error("No relevant pages found.")
+
+        payload = self.buildPayload(self.finalAnswerPrompt())
+        # The last chunk then carries the usage of the whole stream
+        payload["stream_options"] = {"include_usage": True}
+        promptTokens = countMessageTokens(payload["messages"], payload["model"])
+        if not self.tokenBudget.reserve(promptTokens):
+            logger.warning(f"Token budget exhausted, skipping the final answer ({promptTokens} prompt tokens)")
+            return
+        if not self.setCompletionLimit(payload):
+            self.tokenBudget.settle(promptTokens, 0)
+            logger.warning("No token budget left for the final answer")
+            return
+
+        tokens: List[str] = []
+        usage: Optional[dict] = None
+        with stage("final_answer"):
+            try:
+                async for chunk in self.client.streamJson(
+                    self.base_url,
+                    headers=self.headers,
+                    payload=payload,
+                    timeout=self.answerTimeout,
+                ):
+                    usage = chunk.get("usage") or usage
+                    choices = chunk.get("choices") or [{}]
+                    token = choices[0].get("delta", {}).get("content")
+                    if token:
+                        tokens.append(token)
+                        yield token
+            except aiohttp.ClientResponseError as e:
+                logger.error(f"Error: Chat completion failed (status code: {e.status})")
+                record_upstream_error("llm", status_kind(e.status))
+                self.answerError = f"Chat completion failed (status code: {e.status})"
+            except aiohttp.ClientConnectionError as e:
+                logger.error(f"Connection error while streaming the answer: {e}")
+                record_upstream_error("llm", "connection")
+                self.answerError = "Connection to the chat endpoint was lost"
+            except asyncio.TimeoutError:
+                logger.error("Streaming the answer timed out.")
+                record_upstream_error("llm", "timeout")
+                self.answerError = "Streaming the answer timed out"
+            except CircuitOpenError as e:
+                logger.error(f"Skipping the final answer: {e}")
+                self.answerError = str(e)
+            except ValueError as e:
+                logger.error(f"Error parsing streamed JSON: {e}")
+                record_upstream_error("llm", "decode")
+                self.answerError = "The answer stream could not be parsed"
+            finally:
+                spent = self.recordUsage("final_answer", promptTokens, "".join(tokens), usage) if tokens else 0
+                self.tokenBudget.settle(promptTokens, spent)
+
+    async def iterPageResponsesAsync(
+        self, pages: Optional[AsyncIterator[str]] = None
+    ) -> AsyncIterator[Tuple[int, Optional[str]]]:
+        """
+        Summarize pages concurrently and yield (page index, summary) as each one finishes.
+
+        When pages is an async iterator (e.g. WebSearch.iterPagesContentsAsync) each page is
+        summarized as soon as it arrives; otherwise self.pagesInMD is used. A bounded queue
+        between the two stages applies backpressure to the producer.
+
+        Once summaryTarget useful summaries have arrived, or at summaryDeadline, the pages
+        still being fetched or summarized are cancelled so a slow page cannot hold up the answer.
+        """
+        if pages is None:
+            pages = self._iterPages(list(self.pagesInMD))
+            collect = False
+        else:
+            collect = True
+
+        workers = max(1, self.summaryConcurrency)
+        pending: asyncio.Queue = asyncio.Queue(maxsize=self.pageQueueSize)
+        finished: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        async def produce():
+            try:
+                index = 0
+                async for page in pages:
+                    if collect:
+                        self.pagesInMD.append(page)
+                    await pending.put((index, page))
+                    index += 1
+            except Exception as e:
+                logger.error(f"Error while reading pages: {e}")
+            finally:
+                # Closing the source cancels the page downloads no other question is waiting for
+                if hasattr(pages, "aclose"):
+                    await pages.aclose()
+            # Not reached when cancelled, nobody is left to read from a full queue then
+            for _ in range(workers):
+                await pending.put(done)
+
+        async def summarize():
+            try:
+                while True:
+                    item = await pending.get()
+                    if item is done:
+                        break
+                    index, page = item
+                    with stage("extract" if self.fastMode else "summarize"):
+                        summary = await self.relevantPageResponseAsync(page)
+                    await finished.put((index, summary))
+            finally:
+                await finished.put(done)
+
+        tasks = [asyncio.ensure_future(produce())]
+        tasks += [asyncio.ensure_future(summarize()) for _ in range(workers)]
+        loop = asyncio.get_running_loop()
+        useful = 0
+        try:
+            remaining = workers
+            while remaining:
+                timeout = None
+                if self.summaryDeadline is not None:
+                    timeout = max(0, self.summaryDeadline - loop.time())
+                try:
+                    # Summaries that already finished are used even once the deadline has passed
+                    item = finished.get_nowait()
+                except asyncio.QueueEmpty:
+                    try:
+                        item = await asyncio.wait_for(finished.get(), timeout)
+                    except asyncio.TimeoutError:
+                        logger.warning(f"Summary deadline reached with {useful} summaries, cancelling the remaining pages")
+                        break
+                if item is done:
+                    remaining -= 1
+                    continue
+                yield item
+
+                if item[1] is not None:
+                    useful += 1
+                    if self.summaryTarget and useful >= self.summaryTarget:
+                        logger.debug(f"Got {useful} summaries, cancelling the remaining pages")
+                        break
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _iterPages(self, pages: List[str]) -> AsyncIterator[str]:
+        for page in pages:
+            yield page
+
+    async def populatePageResponsesAsync(self, pages: Optional[AsyncIterator[str]] = None):
+        results = [item async for item in self.iterPageResponsesAsync(pages)]
+
+        # Keep the summaries in page order regardless of which finished first
+        for index, result in sorted(results, key=lambda item: item[0]):
+            if result is not None:
+                self.addSummary(index, result)
             else:
-                logger.error(
-                    f"Error: Unable to process one of the pages (status code: {result.status if result else 'None'})"
-                )
+                logger.error("Error: Unable to process one of the pages")
+
+    def addSummary(self, index: int, summary: str) -> None:
+        self.pageRelevantResponses.append(summary)
+        self.summarySources.append(self.sourceOf(index))
+
+    def sourceOf(self, index: int) -> Optional[str]:
+        # The extractor starts every page with a "source: <url>" line
+        page = self.pagesInMD[index] if index < len(self.pagesInMD) else None
+        if not page or not page.startswith("source:"):
+            return None
+        return page.partition("\n")[0][len("source:"):].strip()
 
     async def relevantPageResponseAsync(
         self, pageInMD="No details were available for the page"
-    ):
+    ) -> Optional[str]:
+        if self.fastMode:
+            # Ranking is CPU work, keep it off the event loop for large pages
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.extractPage, pageInMD)
+
+        # Reserved before trimming so pages summarized at once cannot overshoot the budget together
+        tokenLimit, reserved = self.reservePageTokens()
+        if tokenLimit is not None and tokenLimit < MIN_PAGE_TOKENS:
+            logger.warning("Question token budget reached, skipping a page")
+            return None
+        try:
+            return await self.summarizePageAsync(pageInMD, tokenLimit)
+        finally:
+            self.tokenBudget.settle(reserved, 0)
+
+    def extractPage(self, pageInMD: str) -> Optional[str]:
+        """
+        Fast mode's page summary: the page's sentences that best match the question, or None when none do.
+        """
+        passages = extractPassages(self.question, pageInMD, self.fastSentences, self.fastPageTokens)
+        if passages is None:
+            logger.debug("No sentence of the page matches the question")
+        return passages
+
+    def reservePageTokens(self) -> Tuple[Optional[int], int]:
+        """
+        Reserve the budget for one page summary and return (page token limit, tokens reserved).
+
+        The limit is None when pages are sent whole, and under MIN_PAGE_TOKENS when the page should be skipped.
+        """
+        remaining = self.tokenBudget.remaining
+        if remaining is None:
+            return self.pageTokenBudget or None, 0
+
+        available = remaining - self.answerTokenReserve - SUMMARY_PROMPT_TOKENS - self.summaryTokens
+        tokenLimit = min(self.pageTokenBudget, available) if self.pageTokenBudget else available
+        if tokenLimit < MIN_PAGE_TOKENS:
+            return tokenLimit, 0
+
+        reserved = tokenLimit + SUMMARY_PROMPT_TOKENS + self.summaryTokens
+        self.tokenBudget.reserve(reserved)
+        return tokenLimit, reserved
+
+    async def summarizePageAsync(self, pageInMD: str, tokenLimit: Optional[int] = None) -> Optional[str]:
+        pageInMD = await self.selectPageContentAsync(pageInMD, tokenLimit)
+
+        # Only pages that are new or changed since the last run for this question go to the model
+        loop = asyncio.get_running_loop()
+        if self.summaryCache is not None:
+            cached = await loop.run_in_executor(None, self.summaryCache.get, self.question, pageInMD)
+            if cached is not None:
+                self.summaryCacheHits += 1
+                logger.debug("Summary cache hit")
+                return cached
+
         preparedPrompt = f"""
         You are helping a user search the internet and answer a question. Here's the raw page formatted in markdown. Based on this data, generate a summary of why this question relates to the user's question. If it answers the user's question, provide the answer:
 
@@ -173,32 +483,172 @@ class Inference:
         {pageInMD}
         """
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.post(
-                    self.base_url,
-                    headers=self.headers,
-                    json={
-                        "messages": [
-                            {
-                                "role": "system",
-                                "content": "You helping to answer a query from a user. You are specifically good with searching the internet for results.",
-                                "role": "user",
-                                "content": preparedPrompt,
-                            }
-                        ],
-                        "model": "gpt-4o-mini",  # need to fix this to a parameter
-                        "temperature": 0.2,
-                    },
-                    timeout=aiohttp.ClientTimeout(total=60),  # 30 seconds timeout
-                ) as response:
-                    logger.info(f"Response status: {response.status}")
-                    logger.debug(f"Response content: {await response.text()}")
-
-                    return response
-            except aiohttp.ClientConnectionError as e:
-                logger.error(f"Connection error while processing page: {e}")
+        # Covered by the page's reservation
+        summary = await self.postChatAsync(preparedPrompt, purpose="summarize", reserve=False)
+        if summary is not None and self.summaryCache is not None:
+            await loop.run_in_executor(None, self.summaryCache.put, self.question, pageInMD, summary)
+        return summary
+
+    async def selectPageContentAsync(self, pageInMD: str, tokenLimit: Optional[int] = None) -> str:
+        """
+        Trim a page down to the chunks most relevant to the question before it goes into a prompt.
+        """
+        tokenLimit = tokenLimit or self.pageTokenBudget
+        if not tokenLimit or not pageInMD:
+            return pageInMD
+
+        # Ranking is CPU work, keep it off the event loop for large pages
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, selectChunks, self.question, pageInMD, tokenLimit, self.pageTopChunks
+        )
+
+    async def postChatAsync(
+        self,
+        preparedPrompt: str,
+        purpose: str = "chat",
+        reserve: bool = True,
+        timeout: Optional[float] = None,
+        limitCompletion: bool = False,
+    ) -> Optional[str]:
+        """
+        Send a chat completion request and return the message content, or None on failure.
+
+        The prompt is counted before it is sent and skipped if it does not fit the question's
+        token budget (unless reserve is False, when the caller already reserved it). With
+        limitCompletion the reply is capped at what is left of the budget.
+        """
+        payload = self.buildPayload(preparedPrompt)
+        promptTokens = countMessageTokens(payload["messages"], payload["model"])
+        reserved = promptTokens if reserve else 0
+        if reserve and not self.tokenBudget.reserve(promptTokens):
+            logger.warning(f"Token budget exhausted, skipping the {purpose} call ({promptTokens} prompt tokens)")
+            return None
+        if limitCompletion and not self.setCompletionLimit(payload):
+            self.tokenBudget.settle(reserved, 0)
+            logger.warning(f"No token budget left for the {purpose} reply")
+            return None
+
+        spent = 0
+        try:
+            status, json_resp = await self.client.postJson(
+                self.base_url,
+                headers=self.headers,
+                payload=payload,
+                timeout=timeout,
+            )
+            logger.info(f"Response status: {status}")
+            if json_resp is None:
+                logger.error(f"Error: Chat completion failed (status code: {status})")
+                record_upstream_error("llm", status_kind(status))
                 return None
-            except asyncio.TimeoutError:
-                logger.error(f"Request timed out for the page.")
-                return None
\ No newline at end of file
+
+            logger.debug(f"Response content: {json_resp}")
+            content = json_resp["choices"][0]["message"]["content"]
+            spent = self.recordUsage(purpose, promptTokens, content, json_resp.get("usage"))
+            return content
+        except aiohttp.ClientConnectionError as e:
+            logger.error(f"Connection error while calling the chat endpoint: {e}")
+            record_upstream_error("llm", "connection")
+            return None
+        except asyncio.TimeoutError:
+            logger.error("Request to the chat endpoint timed out.")
+            record_upstream_error("llm", "timeout")
+            return None
+        except CircuitOpenError as e:
+            logger.error(f"Skipping the {purpose} call: {e}")
+            return None
+        except (KeyError, IndexError, ValueError) as e:
+            logger.error(f"Error parsing JSON: {e}")
+            record_upstream_error("llm", "decode")
+            return None
+        finally:
+            self.tokenBudget.settle(reserved, spent)
+
+    def recordUsage(self, purpose: str, promptTokens: int, completion: str, usage: Optional[dict] = None) -> int:
+        """
+        Record a call's tokens, preferring the usage reported by the chat endpoint, and return the total.
+        """
+        completionTokens = countTokens(completion)
+        if usage:
+            promptTokens = usage.get("prompt_tokens", promptTokens)
+            completionTokens = usage.get("completion_tokens", completionTokens)
+
+        self.usage.record(purpose, promptTokens, completionTokens)
+        self.tokensUsedInput += promptTokens
+        self.tokensUsedOutput += completionTokens
+        return promptTokens + completionTokens
+
+    def setCompletionLimit(self, payload: dict) -> bool:
+        """
+        Cap a reply at what is left of the budget once its prompt is reserved, so the final
+        answer cannot overshoot it. False when nothing is left.
+        """
+        remaining = self.tokenBudget.remaining
+        if remaining is None:
+            return True
+        if remaining <= 0:
+            return False
+        payload["max_tokens"] = remaining
+        return True
+
+    def buildPayload(self, preparedPrompt: str) -> dict:
+        return {
+            "messages": [
+                {
+                    "role": "system",
+                    "content": "You helping to answer a query from a user. You are specifically good with searching the internet for results.",
+                },
+                {
+                    "role": "user",
+                    "content": preparedPrompt,
+                },
+            ],
+            "model": "gpt-4o-mini",  # need to fix this to a parameter
+            "temperature": 0.2,
+        }
+
+    def formatQuestionPrompt(self, question="") -> str:
+        return f"""
+        You are helping a user search the internet and answer a question. Here's the question from the user. Based on the question, can you reformat the question into a good query for a search engine? For example, if the user's question is "I am having trouble with my computer overheating. What should I do?" you could reformat it as "How to prevent computer overheating". Respond only with the reformatted question. Do not use the site keyword in the query:
+
+        user's question: {question}
+        """
+
+    def summariesWithinBudget(self) -> List[str]:
+        """
+        The page summaries for the final answer, dropping the last ones while the prompt would
+        not fit the budget with answerTokenReserve left over for the reply.
+        """
+        summaries = list(self.pageRelevantResponses)
+        remaining = self.tokenBudget.remaining
+        if remaining is None:
+            self.sourcesUsed = [source for source in self.summarySources if source]
+            return summaries
+
+        available = remaining - self.answerTokenReserve
+        while summaries:
+            messages = self.buildPayload(self.finalAnswerPrompt(summaries))["messages"]
+            if countMessageTokens(messages) <= available:
+                break
+            summaries.pop()
+        if len(summaries) < len(self.pageRelevantResponses):
+            logger.warning(
+                f"Token budget fits {len(summaries)} of {len(self.pageRelevantResponses)} page summaries in the final answer"
+            )
+        self.sourcesUsed = [source for source in self.summarySources[:len(summaries)] if source]
+        return summaries
+
+    def finalAnswerPrompt(self, summaries: Optional[List[str]] = None) -> str:
+        if summaries is None:
+            summaries = self.summariesWithinBudget()
+        return f"""
+        You are helping a user search the internet and answer a question. Here are the results of their internet search. Only answer the questions based on the search results. Mention the website if the answer came from a website. Format the answer in markdown:
+
+        Search results:
+
+        {summaries}
+
+        Based on the search results, what is the answer to the user's question?
+        Here's their question: {self.question}
+        """
@@ -0,0 +1,51 @@
+import logging
+import os
+import threading
+from typing import Optional
+
+from searchapp.utils.caching import JSONCache, shared_local_cache
+from searchapp.utils.keys import content_hash, question_key
+
+logger = logging.getLogger(__name__)
+
+
+class SummaryCache:
+    """
+    Per-page relevance summaries keyed by (normalized question, hash of the page content sent to the model).
+
+    A rerun of the same or an equivalent question only pays for pages that are new or changed.
+    """
+
+    def __init__(self, ttl: Optional[int] = None, cache: Optional[JSONCache] = None):
+        self.ttl = ttl or int(os.getenv("SUMMARY_CACHE_TTL", 24 * 60 * 60))
+        self.cache = cache or JSONCache(
+            "summary",
+            ttl=self.ttl,
+            local_cache=shared_local_cache("summaries"),
+        )
+
+    def key(self, question: str, content: str) -> str:
+        return f"{question_key(question, namespace='q')}:{content_hash(content)}"
+
+    def get(self, question: str, content: str) -> Optional[str]:
+        return self.cache.get(self.key(question, content))
+
+    def put(self, question: str, content: str, summary: str) -> None:
+        self.cache.set(self.key(question, content), summary)
+
+
+_summaryCache: Optional[SummaryCache] = None
+_summaryCacheLock = threading.Lock()
+
+
+def getSummaryCache() -> Optional[SummaryCache]:
+    """
+    Return the process-wide SummaryCache, or None when SUMMARY_CACHE is set to 0.
+    """
+    global _summaryCache
+    if os.getenv("SUMMARY_CACHE", "1").lower() in ("0", "false", "no"):
+        return None
+    with _summaryCacheLock:
+        if _summaryCache is None:
+            _summaryCache = SummaryCache()
+        return _summaryCache
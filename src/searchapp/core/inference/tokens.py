@@ -0,0 +1,135 @@
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from searchapp.utils.ranking import estimateTokens
+from searchapp.utils.telemetry import record_tokens
+
+try:
+    import tiktoken
+except ImportError:  # Optional, counts fall back to the four-characters-per-token estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Chat formatting adds a few tokens per message and to prime the reply
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+_encodings: Dict[str, object] = {}
+_encodingsLock = threading.Lock()
+
+
+def _encoding(model: str):
+    with _encodingsLock:
+        if model not in _encodings:
+            encoding = None
+            if tiktoken is not None:
+                try:
+                    try:
+                        encoding = tiktoken.encoding_for_model(model)
+                    except KeyError:
+                        encoding = tiktoken.get_encoding("o200k_base")
+                except Exception as e:
+                    # e.g. the encoding files cannot be downloaded
+                    logger.warning(f"tiktoken unavailable for {model}, estimating tokens: {e}")
+                    encoding = None
+            _encodings[model] = encoding
+        return _encodings[model]
+
+
+def countTokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """
+    Tokens in text for model, with tiktoken when it is installed and an estimate otherwise.
+    """
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimateTokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def countMessageTokens(messages: List[dict], model: str = "gpt-4o-mini") -> int:
+    """
+    Prompt tokens of a chat request, counted the way the chat endpoint bills them.
+    """
+    total = TOKENS_PER_REPLY
+    for message in messages:
+        total += TOKENS_PER_MESSAGE
+        total += countTokens(message.get("role", ""), model)
+        total += countTokens(message.get("content", ""), model)
+    return total
+
+
+class TokenUsage:
+    """
+    Prompt and completion tokens per stage of one question. Reported usage from the chat
+    endpoint is used when present, otherwise the local counts.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, int]] = {}
+
+    def record(self, stage: str, promptTokens: int, completionTokens: int) -> None:
+        totals = self.stages.setdefault(stage, {"calls": 0, "prompt": 0, "completion": 0})
+        totals["calls"] += 1
+        totals["prompt"] += promptTokens
+        totals["completion"] += completionTokens
+        record_tokens(stage, promptTokens, completionTokens)
+
+    @property
+    def promptTokens(self) -> int:
+        return sum(totals["prompt"] for totals in self.stages.values())
+
+    @property
+    def completionTokens(self) -> int:
+        return sum(totals["completion"] for totals in self.stages.values())
+
+    @property
+    def totalTokens(self) -> int:
+        return self.promptTokens + self.completionTokens
+
+    def toDict(self) -> dict:
+        return {
+            "prompt": self.promptTokens,
+            "completion": self.completionTokens,
+            "stages": self.stages,
+        }
+
+
+class TokenBudgetExceeded(Exception):
+    """
+    Raised by the blocking chat path instead of sending a call that does not fit the budget.
+    """
+
+
+class TokenBudget:
+    """
+    Tokens one question may spend across all of its chat calls; a limit of 0 is unlimited.
+
+    Calls reserve their expected tokens before they are sent and settle with the real count
+    afterwards, so concurrent page summaries cannot overshoot the budget together.
+    """
+
+    def __init__(self, limit: int = 0):
+        self.limit = limit
+        self.spent = 0
+        self.reserved = 0
+
+    @property
+    def remaining(self) -> Optional[int]:
+        if not self.limit:
+            return None
+        return max(0, self.limit - self.spent - self.reserved)
+
+    def reserve(self, tokens: int) -> bool:
+        remaining = self.remaining
+        if remaining is not None and tokens > remaining:
+            return False
+        self.reserved += tokens
+        return True
+
+    def settle(self, reserved: int, spent: int) -> None:
+        self.reserved = max(0, self.reserved - reserved)
+        self.spent += spent
@@ -1,18 +1,55 @@
+import asyncio
+from contextlib import asynccontextmanager
 import json
 import logging
+import os
+import aiohttp
 import dotenv
 import requests
 from requests import HTTPError
-from time import sleep
+from typing import Optional
+
+from searchapp.utils.aio import SharedSession, add_shutdown_hook
+from searchapp.utils.caching import JSONCache, shared_json_cache
+from searchapp.utils.keys import content_hash, normalize_question
+from searchapp.utils.ratelimit import TokenBucket, parse_retry_after, shared_token_bucket
+from searchapp.utils.resilience import CircuitOpenError, ResiliencePolicy, UpstreamError, shared_policy
+from searchapp.utils.telemetry import record_upstream_error, status_kind
 
 logger = logging.getLogger(__name__)
 
+# Keep-alive pool for the Bing endpoint, shared by every BingWebSearch in the process
+_session = SharedSession(limit=10, keepalive_timeout=60)
+add_shutdown_hook(_session.close)
+
 class BingWebSearch:
 
     def __init__(self) -> None:
         env = dotenv.dotenv_values()
         self.SUBSCRIPTION_KEY_ENV_VAR_NAME = "BING_SEARCH_V7_WEB_SEARCH_SUBSCRIPTION_KEY"
         self.subscription_key = env.get(self.SUBSCRIPTION_KEY_ENV_VAR_NAME)
+        # Overridable to point at a proxy or the local fakes in searchapp.devtools
+        self.endpoint = os.getenv("BING_SEARCH_V7_ENDPOINT", "https://api.bing.microsoft.com/v7.0/search")
+        cacheTTL = int(os.getenv("BING_CACHE_TTL", 60 * 60))  # 0 disables it
+        self.cache: Optional[JSONCache] = shared_json_cache("bing", ttl=cacheTTL) if cacheTTL else None
+        # Requests per second allowed by our Bing tier, shared by every worker through Redis
+        qps = float(os.getenv("BING_QPS", 3))
+        self.rate_limiter: TokenBucket = shared_token_bucket(
+            "bing", rate=qps, capacity=float(os.getenv("BING_BURST", qps))
+        )
+        self.max_retries = int(os.getenv("BING_MAX_RETRIES", 2))
+        # Timeout per attempt, backoff on 429 and 5xx and a circuit breaker shared in the process
+        self.policy: ResiliencePolicy = shared_policy("bing", timeout=10, max_retries=self.max_retries)
+
+    def cache_key(self, query, mkt="en-us", results_count=5) -> str:
+        return content_hash(json.dumps([normalize_question(query), mkt.lower(), results_count]))
+
+    def build_params(self, query, mkt="en-us", results_count=5) -> dict:
+        return {
+            "q": query,
+            "mkt": mkt,
+            "count": results_count,
+        }
 
     def web_search_basic(
         self, query, auth_header_name="Ocp-Apim-Subscription-Key", mkt="en-us", results_count=5
@@ -22,7 +59,8 @@ class BingWebSearch:
         This sample makes a call to the Bing Web Search API with a text query and returns relevant pages
         Documentation: https://docs.microsoft.com/en-us/bing/search-apis/bing-web-search/overview
 
-        May throw HTTPError in case of invalid parameters or a server error.
+        Waits on the shared BING_QPS rate limit and retries 429 responses after their
+        Retry-After delay. HTTP errors are logged and the response is returned as is.
 
         Args:
             subscription_key (str): Azure subscription key of Bing Web Search service
@@ -30,25 +68,98 @@ class BingWebSearch:
             query (str): Query to search for
             mkt (str): Market to search in
         """
-        # safety catch
-        sleep(1)
-
         # Construct a request
-        endpoint = "https://api.bing.microsoft.com/v7.0/search"
-        params = {
-            "q": query, 
-            "mkt": mkt,
-            "count": results_count,
-            }
+        endpoint = self.endpoint
+        params = self.build_params(query, mkt, results_count)
         headers = {auth_header_name: self.subscription_key}
 
-        # Call the API
+        # Call the API, backing off on 429 for as long as Bing asks and on 5xx with jitter
+        def attempt() -> requests.Response:
+            self.rate_limiter.acquireSync()
+            response = requests.get(endpoint, headers=headers, params=params, timeout=self.policy.timeout)
+            if response.status_code == 429:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                self.rate_limiter.block(retry_after)
+                raise UpstreamError(429, retry_after, response=response)
+            if response.status_code >= 500:
+                raise UpstreamError(response.status_code, response=response)
+            return response
+
+        try:
+            response = self.policy.callSync(attempt, retries=self.max_retries)
+        except UpstreamError as ex:
+            response = ex.response
+
         try:
-            response = requests.get(endpoint, headers=headers, params=params, timeout=10)
             response.raise_for_status()
-            return response
         except HTTPError as ex:
             logger.error(f"HTTPError: {ex}")
-            print(ex)
-            print("++The above exception was thrown and handled succesfully++")
-            return response
\ No newline at end of file
+            # Once per search, not per attempt
+            kind = "rate_limited" if response.status_code == 429 else status_kind(response.status_code)
+            record_upstream_error("bing", kind)
+        return response
+
+    async def web_search_async(
+        self, query, auth_header_name="Ocp-Apim-Subscription-Key", mkt="en-us", results_count=5
+    ) -> Optional[dict]:
+        """Non-blocking version of web_search_basic
+
+        Returns the decoded JSON response, or None if the call failed. Successful responses
+        are cached per (query, mkt, count) for BING_CACHE_TTL seconds.
+        """
+        loop = asyncio.get_running_loop()
+        key = self.cache_key(query, mkt, results_count)
+        if self.cache is not None:
+            cached = await loop.run_in_executor(None, self.cache.get, key)
+            if cached is not None:
+                logger.debug(f"Bing cache hit for '{query}'")
+                return cached
+
+        params = self.build_params(query, mkt, results_count)
+        # aiohttp rejects None header values, requests used to drop them silently
+        headers = {auth_header_name: self.subscription_key} if self.subscription_key else {}
+
+        @asynccontextmanager
+        async def rateLimited():
+            await self.rate_limiter.acquire()
+            yield
+
+        async def attempt() -> dict:
+            async with _session.session.get(
+                self.endpoint,
+                headers=headers,
+                params=params,
+                timeout=aiohttp.ClientTimeout(total=self.policy.timeout),
+            ) as response:
+                if response.status == 429:
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    await loop.run_in_executor(None, self.rate_limiter.block, retry_after)
+                    raise UpstreamError(429, retry_after)
+                if response.status != 200:
+                    raise UpstreamError(response.status)
+                return await response.json(content_type=None)
+
+        # 429 and 5xx are retried with backoff, the rate limiter also holds back other callers
+        try:
+            # The rate limiter wait is outside the timeout, only the request itself is timed
+            results = await self.policy.call(attempt, retries=self.max_retries, gate=rateLimited)
+        except UpstreamError as ex:
+            logger.error(f"Error: Unable to access Bing Search API (status code: {ex.status})")
+            # Once the retries are spent, so one failed search counts once
+            record_upstream_error("bing", "rate_limited" if ex.status == 429 else status_kind(ex.status))
+            return None
+        except CircuitOpenError as ex:
+            logger.error(f"Skipping Bing search: {ex}")
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+            logger.error(f"Error while calling Bing Search API: {ex}")
+            record_upstream_error("bing", "timeout" if isinstance(ex, asyncio.TimeoutError) else "connection")
+            return None
+        except ValueError as ex:
+            logger.error(f"JSON decode error: {ex}")
+            record_upstream_error("bing", "decode")
+            return None
+
+        if self.cache is not None:
+            await loop.run_in_executor(None, self.cache.set, key, results)
+        return results
@@ -0,0 +1,211 @@
+import atexit
+import logging
+import os
+import re
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, Optional, Type
+
+import html2text
+from bs4 import BeautifulSoup, Tag
+
+logger = logging.getLogger(__name__)
+
+
+class Extractor:
+    """
+    Turns a page's HTML into markdown. Subclasses register themselves by name in EXTRACTORS.
+    """
+
+    name = ""
+
+    def extract(self, html: str) -> str:
+        raise NotImplementedError
+
+
+class Html2TextExtractor(Extractor):
+    """
+    Converts the whole document with html2text, boilerplate included.
+    """
+
+    name = "html2text"
+
+    def extract(self, html: str) -> str:
+        # HTML2Text keeps state between calls, so each page gets its own instance
+        h = html2text.HTML2Text()
+
+        # Ignore converting links (optional)
+        h.ignore_links = True
+        h.ignore_images = True
+        h.ignore_mailto_links = True
+        h.skip_internal_links = True
+
+        return h.handle(html)
+
+
+class MainContentExtractor(Extractor):
+    """
+    Strips navigation, footers, banners and scripts, picks the main content block and renders it as compact markdown.
+    """
+
+    name = "main"
+
+    # Removed wherever they appear
+    DROP_TAGS = [
+        "script", "style", "noscript", "iframe", "svg", "canvas", "template", "nav",
+        "footer", "header", "aside", "form", "button", "input", "select", "textarea",
+        "img", "picture", "video", "audio", "object", "embed",
+    ]
+
+    # Matched against id/class tokens to catch boilerplate in plain divs
+    BOILERPLATE = re.compile(
+        r"^(cookie|cookies|consent|gdpr|banner|nav|navbar|navigation|menu|footer|"
+        r"sidebar|social|share|sharing|advert|ads|ad|promo|newsletter|subscribe|breadcrumb|"
+        r"breadcrumbs|popup|modal|related|comments?|skip|masthead|toolbar)$",
+        re.IGNORECASE,
+    )
+
+    BLOCK_TAGS = ["p", "h1", "h2", "h3", "h4", "h5", "h6", "li", "pre", "blockquote", "tr", "dt", "dd"]
+
+    # Below this much text the main block is probably wrong, fall back to the whole body
+    MIN_CONTENT_CHARS = 200
+
+    def extract(self, html: str) -> str:
+        soup = BeautifulSoup(html, "html.parser")
+
+        for tag in soup.find_all(self.DROP_TAGS) + soup.find_all(self.isBoilerplate):
+            # Children of an already removed tag are gone with it
+            if not tag.decomposed:
+                tag.decompose()
+
+        root = soup.body or soup
+        main = self.findMainContent(root)
+        markdown = self.render(main) if main is not None else ""
+        if len(markdown) < self.MIN_CONTENT_CHARS:
+            markdown = self.render(root)
+        if len(markdown) < self.MIN_CONTENT_CHARS:
+            # Pages built from bare divs have no block tags to render
+            lines = (re.sub(r"\s+", " ", line).strip() for line in root.get_text("\n").splitlines())
+            markdown = "\n".join(line for line in lines if line)
+        return markdown
+
+    def isBoilerplate(self, tag: Tag) -> bool:
+        if tag.name in ("html", "body", "main", "article"):
+            return False
+        if tag.get("role") in ("navigation", "banner", "contentinfo", "complementary", "dialog"):
+            return True
+        if tag.get("aria-hidden") == "true" or tag.has_attr("hidden"):
+            return True
+
+        tokens = []
+        for value in [tag.get("id") or ""] + list(tag.get("class") or []):
+            tokens.extend(re.split(r"[-_\s]+", value))
+        return any(self.BOILERPLATE.match(token) for token in tokens if token)
+
+    def findMainContent(self, root: Tag) -> Optional[Tag]:
+        explicit = root.find("main") or root.find(attrs={"role": "main"}) or root.find("article")
+        if explicit is not None:
+            return explicit
+
+        # Otherwise take the container holding the most paragraph text, penalised by link density
+        best, bestScore = None, 0.0
+        for candidate in root.find_all(["div", "section", "td"]):
+            paragraphs = candidate.find_all("p", recursive=False)
+            if not paragraphs:
+                continue
+            text = sum(len(p.get_text(" ", strip=True)) for p in paragraphs)
+            links = sum(len(a.get_text(" ", strip=True)) for a in candidate.find_all("a"))
+            total = len(candidate.get_text(" ", strip=True)) or 1
+            score = text * (1 - links / total)
+            if score > bestScore:
+                best, bestScore = candidate, score
+        return best
+
+    def render(self, root: Tag) -> str:
+        markdown = ""
+        previous = None
+        for tag in root.find_all(self.BLOCK_TAGS):
+            # Nested blocks are already part of their outermost block's text
+            if self.hasBlockAncestor(tag, root):
+                continue
+
+            if tag.name == "pre":
+                line = f"```\n{tag.get_text().strip()}\n```"
+            elif tag.name == "tr":
+                cells = [self.inlineText(cell) for cell in tag.find_all(["td", "th"])]
+                line = " | ".join(cell for cell in cells if cell)
+            else:
+                line = self.inlineText(tag)
+            if not line:
+                continue
+
+            if tag.name[0] == "h" and tag.name[1:].isdigit():
+                line = f"{'#' * int(tag.name[1:])} {line}"
+            elif tag.name == "li":
+                line = f"- {line}"
+            elif tag.name == "blockquote":
+                line = f"> {line}"
+
+            # List items and table rows stay on consecutive lines
+            if markdown:
+                markdown += "\n" if tag.name == previous and tag.name in ("li", "tr") else "\n\n"
+            markdown += line
+            previous = tag.name
+
+        return markdown
+
+    def hasBlockAncestor(self, tag: Tag, root: Tag) -> bool:
+        for parent in tag.parents:
+            if parent is root:
+                return False
+            if parent.name in self.BLOCK_TAGS:
+                return True
+        return False
+
+    def inlineText(self, tag: Tag) -> str:
+        return re.sub(r"\s+", " ", tag.get_text(" ")).strip()
+
+
+EXTRACTORS: Dict[str, Type[Extractor]] = {
+    Html2TextExtractor.name: Html2TextExtractor,
+    MainContentExtractor.name: MainContentExtractor,
+}
+
+DEFAULT_EXTRACTOR = os.getenv("EXTRACTOR", MainContentExtractor.name)
+
+
+def getExtractor(name: Optional[str] = None) -> Extractor:
+    name = name or DEFAULT_EXTRACTOR
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown extractor '{name}', expected one of {sorted(EXTRACTORS)}")
+    return EXTRACTORS[name]()
+
+
+def convert(html: str, url: str, engine: Optional[str] = None) -> str:
+    """
+    Convert a page to markdown with the given engine. Module-level so it can run in a process pool.
+    """
+    return f"source: {url} \n{getExtractor(engine).extract(html)}"
+
+
+_executor: Optional[Executor] = None
+_executorLock = threading.Lock()
+
+
+def getConversionExecutor() -> Optional[Executor]:
+    """
+    Return the process pool used for conversion, or None to use the loop's default thread pool.
+
+    Set EXTRACT_PROCESSES to the number of worker processes to enable it.
+    """
+    global _executor
+    processes = int(os.getenv("EXTRACT_PROCESSES", 0))
+    if processes <= 0:
+        return None
+
+    with _executorLock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=processes)
+            atexit.register(_executor.shutdown)
+            logger.debug(f"Started conversion process pool with {processes} workers")
+        return _executor
@@ -0,0 +1,202 @@
+import asyncio
+import codecs
+import logging
+import os
+import re
+import threading
+from typing import Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from searchapp.utils.aio import SharedSession, add_shutdown_hook
+from searchapp.utils.telemetry import record_upstream_error, status_kind
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
+
+# Only these are worth converting to markdown
+TEXT_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+
+# Skipped by extension before any request is made
+BINARY_EXTENSIONS = (
+    ".7z", ".avi", ".bin", ".bmp", ".dmg", ".doc", ".docx", ".exe", ".gif", ".gz",
+    ".ico", ".iso", ".jpeg", ".jpg", ".mkv", ".mov", ".mp3", ".mp4", ".ogg", ".pdf",
+    ".png", ".ppt", ".pptx", ".rar", ".svg", ".tar", ".tgz", ".wav", ".webm", ".webp",
+    ".xls", ".xlsx", ".zip",
+)
+
+META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_\-]+)""", re.IGNORECASE)
+
+
+class FetchResult:
+    def __init__(
+        self,
+        url: str,
+        status: int,
+        text: str,
+        content_type: str = "",
+        encoding: str = "utf-8",
+        truncated: bool = False,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ):
+        self.url = url
+        self.status = status
+        self.text = text
+        self.content_type = content_type
+        self.encoding = encoding
+        self.truncated = truncated
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def notModified(self) -> bool:
+        return self.status == 304
+
+
+class PageFetcher:
+    """
+    Async page downloader shared by every WebSearch in the process.
+
+    Connections are pooled with a per-host cap, non-text content is skipped before the body is
+    read, and bodies are cut off after max_bytes so one huge page cannot stall a question.
+    """
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        per_host_limit: Optional[int] = None,
+        timeout: float = 5,
+    ):
+        self.max_bytes = max_bytes or int(os.getenv("FETCH_MAX_BYTES", 2 * 1024 * 1024))
+        self.per_host_limit = per_host_limit or int(os.getenv("FETCH_PER_HOST_LIMIT", 4))
+        self.timeout = timeout
+        self.chunk_size = 64 * 1024
+        self.shared = SharedSession(
+            limit=100,
+            limit_per_host=self.per_host_limit,
+            keepalive_timeout=30,
+            max_concurrency=int(os.getenv("FETCH_MAX_CONCURRENCY", 20)),
+        )
+
+    def isSkippedURL(self, url: str) -> bool:
+        path = urlsplit(url).path.lower()
+        return path.endswith(BINARY_EXTENSIONS)
+
+    async def fetch(
+        self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None
+    ) -> Optional[FetchResult]:
+        """
+        Download a page and return its decoded text, or None if it was skipped or failed.
+
+        With etag / last_modified the request is conditional, and an unchanged page comes
+        back as a FetchResult with status 304 and no text.
+        """
+        if self.isSkippedURL(url):
+            logger.debug(f"Skipping binary URL {url}")
+            return None
+
+        headers = {"User-Agent": USER_AGENT}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        try:
+            async with self.shared.semaphore:
+                async with self.shared.session.get(
+                    url,
+                    headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=self.timeout),
+                ) as response:
+                    if response.status == 304:
+                        return FetchResult(
+                            url=url,
+                            status=304,
+                            text="",
+                            etag=response.headers.get("ETag", etag),
+                            last_modified=response.headers.get("Last-Modified", last_modified),
+                        )
+                    if response.status != 200:
+                        logger.error(f"Error: Unable to access {url} status code: {response.status}")
+                        record_upstream_error("web", status_kind(response.status))
+                        return None
+
+                    content_type = response.content_type or ""
+                    if content_type and content_type not in TEXT_CONTENT_TYPES:
+                        logger.debug(f"Skipping {url} with content type {content_type}")
+                        return None
+
+                    body, truncated = await self.readBody(response)
+                    encoding = self.sniffEncoding(body, response.charset)
+                    return FetchResult(
+                        url=url,
+                        status=response.status,
+                        text=body.decode(encoding, errors="replace"),
+                        content_type=content_type,
+                        encoding=encoding,
+                        truncated=truncated,
+                        etag=response.headers.get("ETag"),
+                        last_modified=response.headers.get("Last-Modified"),
+                    )
+        except asyncio.TimeoutError:
+            logger.error(f"Timeout error while accessing {url}")
+            record_upstream_error("web", "timeout")
+        except aiohttp.ClientError as e:
+            logger.error(f"Error while accessing {url}: {e}")
+            record_upstream_error("web", "connection")
+        return None
+
+    async def readBody(self, response: aiohttp.ClientResponse):
+        chunks = []
+        size = 0
+        async for chunk in response.content.iter_chunked(self.chunk_size):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= self.max_bytes:
+                logger.debug(f"Body of {response.url} exceeded {self.max_bytes} bytes, truncating")
+                return b"".join(chunks)[: self.max_bytes], True
+        return b"".join(chunks), False
+
+    def sniffEncoding(self, body: bytes, declared: Optional[str] = None) -> str:
+        # Header charset first, then a BOM, then <meta charset>, then utf-8
+        candidates = [declared]
+        if body.startswith(codecs.BOM_UTF8):
+            candidates.append("utf-8-sig")
+        match = META_CHARSET.search(body[:4096])
+        if match:
+            candidates.append(match.group(1).decode("ascii", errors="ignore"))
+
+        for candidate in candidates:
+            if not candidate:
+                continue
+            try:
+                return codecs.lookup(candidate).name
+            except LookupError:
+                continue
+        return "utf-8"
+
+    async def close(self) -> None:
+        await self.shared.close()
+
+
+_fetcher: Optional[PageFetcher] = None
+_fetcherLock = threading.Lock()
+
+
+def getFetcher() -> PageFetcher:
+    global _fetcher
+    with _fetcherLock:
+        if _fetcher is None:
+            _fetcher = PageFetcher()
+            add_shutdown_hook(closeFetcher)
+        return _fetcher
+
+
+async def closeFetcher() -> None:
+    global _fetcher
+    fetcher, _fetcher = _fetcher, None
+    if fetcher is not None:
+        await fetcher.close()
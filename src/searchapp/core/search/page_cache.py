@@ -0,0 +1,124 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from searchapp.utils.caching import JSONCache, shared_local_cache
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that never change the page content
+TRACKING_PARAMS = ("utm_", "gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "ref_src")
+
+
+def canonical_url(url: str) -> str:
+    """
+    Normalize a URL so that trivially different links to the same page share a cache entry.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+
+    query = sorted(
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.lower().startswith(TRACKING_PARAMS)
+    )
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+
+class CachedPage:
+    def __init__(self, url: str, markdown: str, etag: Optional[str], last_modified: Optional[str], fetched_at: float, extractor: str):
+        self.url = url
+        self.markdown = markdown
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.extractor = extractor
+
+    def canRevalidate(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+    def toDict(self) -> dict:
+        return {
+            "url": self.url,
+            "markdown": self.markdown,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "fetched_at": self.fetched_at,
+            "extractor": self.extractor,
+        }
+
+
+class PageCache:
+    """
+    Converted markdown per canonical URL, with the validators needed for conditional GETs.
+
+    Entries younger than fresh_for are used without touching the site. Older entries are
+    revalidated with If-None-Match / If-Modified-Since, and a 304 skips download and
+    conversion. Entries expire from Redis after ttl seconds; the per-worker tier holds at
+    most PAGE_CACHE_L1_SIZE pages and pages over max_entry_bytes are not cached.
+    """
+
+    def __init__(
+        self,
+        ttl: Optional[int] = None,
+        fresh_for: Optional[int] = None,
+        max_entry_bytes: Optional[int] = None,
+        cache: Optional[JSONCache] = None,
+    ):
+        self.ttl = ttl or int(os.getenv("PAGE_CACHE_TTL", 24 * 60 * 60))
+        self.fresh_for = fresh_for if fresh_for is not None else int(os.getenv("PAGE_CACHE_FRESH", 60 * 60))
+        self.max_entry_bytes = max_entry_bytes or int(os.getenv("PAGE_CACHE_MAX_ENTRY_BYTES", 256 * 1024))
+        self.cache = cache or JSONCache(
+            "page",
+            ttl=self.ttl,
+            local_cache=shared_local_cache("pages", maxsize=int(os.getenv("PAGE_CACHE_L1_SIZE", 256))),
+        )
+
+    def key(self, url: str) -> str:
+        return hashlib.sha1(canonical_url(url).encode("utf-8")).hexdigest()
+
+    def get(self, url: str, extractor: str) -> Optional[CachedPage]:
+        entry = self.cache.get(self.key(url))
+        if not entry or entry.get("extractor") != extractor:
+            return None
+        return CachedPage(**entry)
+
+    def isFresh(self, page: CachedPage) -> bool:
+        return time.time() - page.fetched_at < self.fresh_for
+
+    def put(self, url: str, markdown: str, extractor: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        if len(markdown.encode("utf-8")) > self.max_entry_bytes:
+            logger.debug(f"Not caching {url}, markdown exceeds {self.max_entry_bytes} bytes")
+            return
+        page = CachedPage(canonical_url(url), markdown, etag, last_modified, time.time(), extractor)
+        self.cache.set(self.key(url), page.toDict())
+
+    def touch(self, url: str, page: CachedPage) -> None:
+        # A 304 confirms the cached copy, restart its freshness window
+        page.fetched_at = time.time()
+        self.cache.set(self.key(url), page.toDict())
+
+
+_pageCache: Optional[PageCache] = None
+_pageCacheLock = threading.Lock()
+
+
+def getPageCache() -> Optional[PageCache]:
+    """
+    Return the process-wide PageCache, or None when PAGE_CACHE is set to 0.
+    """
+    global _pageCache
+    if os.getenv("PAGE_CACHE", "1").lower() in ("0", "false", "no"):
+        return None
+    with _pageCacheLock:
+        if _pageCache is None:
+            _pageCache = PageCache()
+        return _pageCache
@@ -1,31 +1,66 @@
+import asyncio
 import json
 import logging
+import os
 import requests
 from bs4 import BeautifulSoup
-import html2text
 from urllib.parse import urljoin
 import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from time import time
-from typing import List, Optional, Set
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+from searchapp.utils.aio import run_sync
+from searchapp.utils.ranking import BM25, termCoverage, topK
+from searchapp.utils.resilience import CircuitOpenError
+from searchapp.utils.telemetry import stage
 from .bing import BingWebSearch
+from .extract import DEFAULT_EXTRACTOR, convert, getConversionExecutor
+from .fetcher import PageFetcher, getFetcher
+from .page_cache import PageCache, canonical_url, getPageCache
 
 logger = logging.getLogger(__name__)
 
+
+class _PageInFlight:
+    """
+    A page being fetched and converted, and how many questions are waiting for it.
+    """
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Future"):
+        self.task = task
+        self.waiters = 0
+
+
+# Pages being fetched and converted right now, so concurrent questions citing the same URL share the work
+_pagesInFlight: Dict[Tuple[str, str], _PageInFlight] = {}
+
 class WebSearch:
     def __init__(self):
         self.query = ""
         self.provider = "bing"
         self.pdfProvider = "PyPDF2"
         self.pages = None
-        self.pagesContentsHTML = []
         self.pagesContentsMD = []
         self.response = None
+        self.resultsCount = int(os.getenv("SEARCH_RESULTS", 10))  # Candidates requested from Bing
+        # Candidates fetched after ranking their snippets, and how far to widen when the
+        # snippets match the question poorly (0 fetches every candidate / never widens)
+        self.fetchCount = int(os.getenv("FETCH_TOP_N", 5))
+        self.widenCount = int(os.getenv("FETCH_WIDEN_TO", 10))
+        self.minSnippetCoverage = float(os.getenv("SNIPPET_MIN_COVERAGE", 0.5))
+        self.fetchConcurrency = 10
+        self.fetcher: PageFetcher = getFetcher()
+        self.extractor = DEFAULT_EXTRACTOR  # Name of the extraction engine, see extract.EXTRACTORS
+        self.pageCache: Optional[PageCache] = getPageCache()
 
     def searchAPI(self, query):
         mySearch = BingWebSearch()
 
-        response = mySearch.web_search_basic(query, results_count=5)
+        try:
+            response = mySearch.web_search_basic(query, results_count=self.resultsCount)
+        except (CircuitOpenError, requests.RequestException) as e:
+            logger.error(f"Error: Unable to access Bing Search API: {e}")
+            return
         if response.status_code != 200:
             logger.error(
                 f"Error: Unable to access Bing Search API (status code: {response.status_code})"
@@ -38,15 +73,110 @@ class WebSearch:
             logger.error(f"JSON decode error: {e}")
             self.pages = {}
 
-        start_time = time()
         if self.pages:
-            self.populatePagesContentsMulti()
-            logger.debug(
-                f"Populated pages contents in {time() - start_time:.2f} seconds"
-            )
+            self.pages = self.rankResults(self.pages, query)
+            with stage("populate_pages"):
+                self.populatePagesContentsMulti()
         else:
             logger.error("No search results found.")
 
+    async def searchResultsAsync(self, query) -> Optional[dict]:
+        mySearch = BingWebSearch()
+
+        with stage("bing_search", query=query) as span:
+            pages = await mySearch.web_search_async(query, results_count=self.resultsCount)
+            span.set(results=len(pages["webPages"]["value"]) if pages and "webPages" in pages else 0)
+        logger.debug(f"Bing API Response for '{query}': {json.dumps(pages, indent=2)}")
+        return pages
+
+    async def searchAPIAsync(self, query):
+        self.pages = await self.searchResultsAsync(query)
+
+        if self.pages:
+            with stage("populate_pages"):
+                await self.populatePagesContentsAsync()
+        else:
+            logger.error("No search results found.")
+
+    def mergeResults(self, *resultSets: Optional[dict]) -> Dict:
+        """
+        Combine several Bing responses into one, keeping the first occurrence of each URL.
+        """
+        merged = []
+        seen = set()
+        for resultSet in resultSets:
+            if not resultSet or "value" not in resultSet.get("webPages", {}):
+                continue
+            for page in resultSet["webPages"]["value"]:
+                if page["url"] in seen:
+                    continue
+                seen.add(page["url"])
+                merged.append(page)
+
+        return {"webPages": {"value": merged[: self.resultsCount]}}
+
+    def rankResults(self, results: Optional[dict], *queries: str) -> Optional[dict]:
+        """
+        Keep the fetchCount search results whose title and snippet best match the queries
+        (BM25, Bing's order breaking ties), so only pages likely to help are fetched and
+        summarized. When even the best of them covers less than minSnippetCoverage of the
+        query terms the snippets say little, and up to widenCount results are kept instead.
+        """
+        if not results or "value" not in results.get("webPages", {}):
+            return results
+        candidates = results["webPages"]["value"]
+        if not self.fetchCount or len(candidates) <= self.fetchCount:
+            return results
+
+        query = " ".join(q for q in queries if q)
+        documents = [f"{page.get('name', '')}\n{page.get('snippet', '')}" for page in candidates]
+        with stage("rank_snippets", candidates=len(candidates)) as span:
+            order = topK(BM25(documents).scores(query), len(candidates))
+            keep = self.fetchCount
+            bestCoverage = max(termCoverage(query, documents[index]) for index in order[:keep])
+            if bestCoverage < self.minSnippetCoverage and self.widenCount > keep:
+                logger.debug(f"Weak snippet matches for '{query}' ({bestCoverage:.2f}), widening to {self.widenCount} results")
+                keep = self.widenCount
+            span.set(kept=min(keep, len(candidates)), coverage=round(bestCoverage, 2))
+
+        return {"webPages": {"value": [candidates[index] for index in order[:keep]]}}
+
+    async def populatePagesContentsAsync(self):
+        async for _ in self.iterPagesContentsAsync():
+            pass
+
+    async def iterPagesContentsAsync(self) -> AsyncIterator[str]:
+        """
+        Fetch and convert the search results concurrently, yielding each page's markdown as soon as it is ready.
+        """
+        if not self.pages or "value" not in self.pages.get("webPages", {}):
+            logger.error("No search results found.")
+            return
+
+        semaphore = asyncio.Semaphore(self.fetchConcurrency)
+
+        async def process(page):
+            async with semaphore:
+                return await self.processPageAsync(page)
+
+        tasks = [
+            asyncio.ensure_future(process(page))
+            for page in self.pages["webPages"]["value"]
+        ]
+        try:
+            for task in asyncio.as_completed(tasks):
+                try:
+                    page_markdown = await task
+                except Exception as e:
+                    logger.error(f"Error processing page: {e}")
+                    continue
+                if page_markdown:
+                    self.pagesContentsMD.append(page_markdown)
+                    yield page_markdown
+        finally:
+            for task in tasks:
+                task.cancel()
+
     def populatePagesContentsMulti(self):
         if not self.pages:
             logger.error("No search results found.")
@@ -62,26 +192,88 @@ class WebSearch:
             )
             return
 
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            futures = []
+        # Same async fetcher as the pipeline, run on the worker's background loop
+        run_sync(self.populatePagesContentsAsync())
 
-            for page in self.pages["webPages"]["value"]:
-                # Download the page HTML and convert to markdown concurrently
-                future = executor.submit(self.processPageMulti, page)
-                futures.append(future)
+    async def processPageAsync(self, page) -> Optional[str]:
+        """
+        Return a page's markdown, joining an in-flight fetch of the same URL if there is one.
+        """
+        loop = asyncio.get_running_loop()
+        key = (canonical_url(page["url"]), self.extractor)
 
-            # Wait for all futures to complete
-            for future in as_completed(futures):
-                try:
-                    page_markdown = future.result()
-                    self.pagesContentsMD.append(page_markdown)
-                except Exception as e:
-                    logger.error(f"Error processing page: {e}")
+        inFlight = _pagesInFlight.get(key)
+        if inFlight is None or inFlight.task.get_loop() is not loop:
+            inFlight = _PageInFlight(asyncio.ensure_future(self.fetchPageAsync(page)))
+            _pagesInFlight[key] = inFlight
+
+            def forget(future, key=key, inFlight=inFlight):
+                if _pagesInFlight.get(key) is inFlight:
+                    del _pagesInFlight[key]
+
+            inFlight.task.add_done_callback(forget)
+        else:
+            logger.debug(f"Sharing in-flight fetch of {page['url']}")
+
+        # One question giving up must not cancel the fetch for the others, but once every
+        # waiter has gone the download only holds fetcher and per-host slots
+        inFlight.waiters += 1
+        try:
+            return await asyncio.shield(inFlight.task)
+        finally:
+            inFlight.waiters -= 1
+            if inFlight.waiters == 0 and not inFlight.task.done():
+                logger.debug(f"No question is waiting for {page['url']} any more, cancelling the fetch")
+                if _pagesInFlight.get(key) is inFlight:
+                    del _pagesInFlight[key]
+                inFlight.task.cancel()
+
+    async def fetchPageAsync(self, page) -> Optional[str]:
+        url = page["url"]
+        loop = asyncio.get_running_loop()
+
+        cached = None
+        if self.pageCache is not None:
+            # Redis is a blocking client, keep it off the event loop
+            cached = await loop.run_in_executor(None, self.pageCache.get, url, self.extractor)
+            if cached is not None and self.pageCache.isFresh(cached):
+                logger.debug(f"Page cache hit for {url}")
+                return cached.markdown
+
+        with stage("fetch", url=url) as span:
+            result = await self.fetcher.fetch(
+                url,
+                etag=cached.etag if cached else None,
+                last_modified=cached.last_modified if cached else None,
+            )
+            span.set(status=result.status if result is not None else None)
+        if result is None:
+            # Serve the stale copy rather than nothing if the site is failing
+            return cached.markdown if cached else None
+
+        if result.notModified and cached is not None:
+            logger.debug(f"Page not modified, reusing cached markdown for {url}")
+            await loop.run_in_executor(None, self.pageCache.touch, url, cached)
+            return cached.markdown
+
+        # Conversion is CPU-bound, run it in the process pool when one is configured
+        with stage("convert", url=url):
+            page_markdown = await loop.run_in_executor(
+                getConversionExecutor(), convert, result.text, url, self.extractor
+            )
+
+        if self.pageCache is not None:
+            await loop.run_in_executor(
+                None,
+                lambda: self.pageCache.put(
+                    url, page_markdown, self.extractor, result.etag, result.last_modified
+                ),
+            )
+        return page_markdown
 
     def processPageMulti(self, page):
         response = self.downloadURL(page["url"])
         if response and response.status_code == 200:
-            self.pagesContentsHTML.append(response)
             return self.convert_html_to_markdown(pageHTML=response, pageURL=page["url"])
         else:
             logger.error(f"Error: Unable to access {page['url']}")
@@ -91,7 +283,6 @@ class WebSearch:
         for page in self.pages["webPages"]["value"]:
             response = self.downloadURL(page["url"])
             if response and response.status_code == 200:
-                self.pagesContentsHTML.append(response)
                 self.pagesContentsMD.append(
                     self.convert_html_to_markdown(
                         pageHTML=response, pageURL=page["url"]
@@ -172,23 +363,11 @@ class WebSearch:
 
         return pdf_links
 
-    def convert_html_to_markdown(self, pageHTML: requests.Response, pageURL: str) -> str:
-        start_time = time()
-
-        html_content = pageHTML.text
-
-        # Create an html2text object
-        h = html2text.HTML2Text()
-
-        # Ignore converting links (optional)
-        h.ignore_links = True
-        h.ignore_images = True
-        h.ignore_mailto_links = True
-        h.skip_internal_links = True
-
-        # Convert the HTML content to Markdown
-        markdown_content = f"source: {pageURL} \n{h.handle(html_content)}"
+    def convert_html_to_markdown(self, pageHTML, pageURL: str) -> str:
+        # Accepts either a requests.Response or HTML that was already decoded
+        html_content = pageHTML if isinstance(pageHTML, str) else pageHTML.text
 
-        logger.debug(f"Converted HTML to Markdown in {time() - start_time:.2f} seconds")
+        with stage("convert", url=pageURL):
+            markdown_content = convert(html_content, pageURL, self.extractor)
 
         return markdown_content
\ No newline at end of file
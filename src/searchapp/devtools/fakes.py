@@ -0,0 +1,420 @@
+"""
+Local stand-ins for every upstream: an OpenAI-compatible chat endpoint, Bing Web Search v7
+and a static web corpus, with configurable latency, token-rate streaming and failures.
+
+    python -m searchapp.devtools.fakes --latency 200 --token-rate 50 --error-rate 0.05
+
+Then point the app at them with the variables it prints (OPENAI_CHAT_URL and
+BING_SEARCH_V7_ENDPOINT). Responses are deterministic for a given seed.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from email.utils import formatdate
+from typing import List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+WORDS = (
+    "python search engine answer question page content result language model cache latency "
+    "token request server client network data index query rank source document summary"
+).split()
+
+
+class LatencyModel:
+    """
+    Response delay in milliseconds drawn from "fixed", "uniform" (mean +/- jitter) or
+    "lognormal" (median mean, spread jitter/mean) distributions.
+    """
+
+    def __init__(self, mean: float = 0, jitter: float = 0, distribution: str = "lognormal", seed: int = 0):
+        if distribution not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.mean = mean
+        self.jitter = jitter
+        self.distribution = distribution
+        self.rng = random.Random(seed)
+
+    def sample(self) -> float:
+        """Return a delay in seconds."""
+        if self.mean <= 0:
+            return 0.0
+        if self.distribution == "fixed" or self.jitter <= 0:
+            delay = self.mean
+        elif self.distribution == "uniform":
+            delay = self.rng.uniform(self.mean - self.jitter, self.mean + self.jitter)
+        else:
+            delay = self.rng.lognormvariate(0, self.jitter / self.mean) * self.mean
+        return max(0.0, delay) / 1000
+
+    async def wait(self) -> None:
+        delay = self.sample()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class FailureInjector:
+    """
+    Decide per request whether to fail: a 500, a 429 with Retry-After, or a hang longer
+    than any client timeout.
+    """
+
+    def __init__(self, error_rate: float = 0, rate_limit_rate: float = 0, timeout_rate: float = 0, hang: float = 30, seed: int = 0):
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+        self.rng = random.Random(seed)
+
+    async def failure(self) -> Optional[web.Response]:
+        roll = self.rng.random()
+        if roll < self.error_rate:
+            return web.json_response({"error": {"message": "Injected failure"}}, status=500)
+        roll -= self.error_rate
+        if roll < self.rate_limit_rate:
+            return web.json_response({"error": {"message": "Injected rate limit"}}, status=429, headers={"Retry-After": "1"})
+        roll -= self.rate_limit_rate
+        if roll < self.timeout_rate:
+            await asyncio.sleep(self.hang)
+        return None
+
+
+class Endpoint:
+    def __init__(self, latency: Optional[LatencyModel] = None, failures: Optional[FailureInjector] = None):
+        self.latency = latency or LatencyModel()
+        self.failures = failures or FailureInjector()
+        self.requests = 0
+
+    async def begin(self) -> Optional[web.Response]:
+        # Count, wait, then maybe fail, in that order for every request
+        self.requests += 1
+        await self.latency.wait()
+        return await self.failures.failure()
+
+
+def seeded(*parts) -> random.Random:
+    digest = hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+class FakeOpenAI:
+    """
+    POST /v1/chat/completions. The reply is a deterministic function of the prompt, and
+    streamed replies are sent as SSE chunks at token_rate tokens per second.
+    """
+
+    def __init__(self, endpoint: Optional[Endpoint] = None, token_rate: float = 0, reply_words: int = 40, seed: int = 0):
+        self.endpoint = endpoint or Endpoint()
+        self.token_rate = token_rate
+        self.reply_words = reply_words
+        self.seed = seed
+
+    def reply(self, messages: List[dict]) -> str:
+        prompt = messages[-1].get("content", "") if messages else ""
+        rng = seeded(self.seed, prompt)
+        return " ".join(rng.choice(WORDS) for _ in range(self.reply_words))
+
+    def usage(self, messages: List[dict], reply: str) -> dict:
+        # Roughly four characters per token, like the app's own estimate
+        prompt_tokens = sum(len(message.get("content", "")) for message in messages) // 4
+        completion_tokens = len(reply) // 4
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        failure = await self.endpoint.begin()
+        if failure is not None:
+            return failure
+
+        payload = await request.json()
+        messages = payload.get("messages", [])
+        reply = self.reply(messages)
+        model = payload.get("model", "fake")
+        created = int(time.time())
+
+        if not payload.get("stream"):
+            return web.json_response({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": self.usage(messages, reply),
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for index, word in enumerate(reply.split(" ")):
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word if index == 0 else f" {word}"}, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            if self.token_rate > 0:
+                await asyncio.sleep(1 / self.token_rate)
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            # Like OpenAI, the usage of a stream comes in a last chunk without choices
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [],
+                "usage": self.usage(messages, reply),
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+class FakeWeb:
+    """
+    GET /page/<n> for n in [0, size). Pages are HTML with navigation, a main article and a
+    footer, carry ETag and Last-Modified, and answer conditional requests with 304.
+    """
+
+    def __init__(self, endpoint: Optional[Endpoint] = None, size: int = 100, paragraphs: int = 20, seed: int = 0):
+        self.endpoint = endpoint or Endpoint()
+        self.size = size
+        self.paragraphs = paragraphs
+        self.seed = seed
+        self.lastModified = formatdate(0, usegmt=True)
+
+    def html(self, number: int) -> str:
+        rng = seeded(self.seed, "page", number)
+        title = sentence(rng, 6)
+        nav = "".join(f"<li><a href='/page/{i}'>Section {i}</a></li>" for i in range(10))
+        body = "".join(
+            f"<h2>{sentence(rng, 5)}</h2><p>{' '.join(sentence(rng, rng.randint(8, 20)) for _ in range(4))}</p>"
+            for _ in range(self.paragraphs)
+        )
+        return (
+            f"<html><head><title>{title}</title><script>var tracking = 1;</script></head>"
+            f"<body><nav><ul>{nav}</ul></nav><main><article><h1>{title}</h1>{body}</article></main>"
+            f"<footer>Fake corpus page {number}</footer></body></html>"
+        )
+
+    def etag(self, number: int) -> str:
+        return f'"{self.seed}-{number}"'
+
+    async def page(self, request: web.Request) -> web.Response:
+        failure = await self.endpoint.begin()
+        if failure is not None:
+            return failure
+
+        try:
+            number = int(request.match_info["number"])
+        except ValueError:
+            raise web.HTTPNotFound()
+        if not 0 <= number < self.size:
+            raise web.HTTPNotFound()
+
+        headers = {"ETag": self.etag(number), "Last-Modified": self.lastModified}
+        if request.headers.get("If-None-Match") == self.etag(number):
+            return web.Response(status=304, headers=headers)
+        return web.Response(text=self.html(number), content_type="text/html", headers=headers)
+
+
+class FakeBing:
+    """
+    GET /v7.0/search. Results are corpus pages picked deterministically from the query,
+    spread over the corpus sites so per-host limits behave as they would on the web. About
+    half of the snippets quote the query, so snippet ranking has matches to find.
+    """
+
+    def __init__(self, corpus: FakeWeb, endpoint: Optional[Endpoint] = None, seed: int = 0):
+        self.corpus = corpus
+        self.endpoint = endpoint or Endpoint()
+        self.seed = seed
+        self.siteURLs: List[str] = []
+
+    def results(self, query: str, count: int) -> List[dict]:
+        rng = seeded(self.seed, "search", query.lower())
+        numbers = rng.sample(range(self.corpus.size), min(count, self.corpus.size))
+        results = []
+        for rank, number in enumerate(numbers):
+            site = self.siteURLs[number % len(self.siteURLs)]
+            pageRng = seeded(self.corpus.seed, "page", number)
+            snippet = sentence(rng, 25)
+            if rng.random() < 0.5:
+                snippet = f"{query} {snippet}"
+            results.append({
+                "id": f"https://api.bing.microsoft.com/api/v7/#WebPages.{rank}",
+                "name": sentence(pageRng, 6),
+                "url": f"{site}/page/{number}",
+                "snippet": snippet,
+            })
+        return results
+
+    async def search(self, request: web.Request) -> web.Response:
+        failure = await self.endpoint.begin()
+        if failure is not None:
+            return failure
+
+        query = request.query.get("q", "")
+        count = int(request.query.get("count", 10))
+        return web.json_response({
+            "_type": "SearchResponse",
+            "queryContext": {"originalQuery": query},
+            "webPages": {"value": self.results(query, count)},
+        })
+
+
+class FakeUpstreams:
+    """
+    Serves the chat and search endpoints on one port and the web corpus on `sites` more
+    ports, so corpus pages look like they come from different hosts.
+
+    Use `async with FakeUpstreams() as fakes:` inside a loop, or start()/stop() from sync
+    code, which runs the servers on a thread of their own.
+    """
+
+    def __init__(
+        self,
+        openai: Optional[FakeOpenAI] = None,
+        corpus: Optional[FakeWeb] = None,
+        bing: Optional[FakeBing] = None,
+        sites: int = 5,
+        host: str = "127.0.0.1",
+    ):
+        self.openai = openai or FakeOpenAI()
+        self.corpus = corpus or FakeWeb()
+        self.bing = bing or FakeBing(self.corpus)
+        self.sites = sites
+        self.host = host
+        self.baseURL: Optional[str] = None
+        self._runners: List[web.AppRunner] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def chatURL(self) -> str:
+        return f"{self.baseURL}/v1/chat/completions"
+
+    @property
+    def bingURL(self) -> str:
+        return f"{self.baseURL}/v7.0/search"
+
+    def environ(self) -> dict:
+        """Environment variables pointing the app at these servers."""
+        return {"OPENAI_CHAT_URL": self.chatURL, "BING_SEARCH_V7_ENDPOINT": self.bingURL}
+
+    async def _serve(self, app: web.Application) -> str:
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, self.host, 0)
+        await site.start()
+        self._runners.append(runner)
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{self.host}:{port}"
+
+    async def startAsync(self) -> "FakeUpstreams":
+        api = web.Application()
+        api.router.add_post("/v1/chat/completions", self.openai.chat)
+        api.router.add_get("/v7.0/search", self.bing.search)
+        self.baseURL = await self._serve(api)
+
+        self.bing.siteURLs = []
+        for _ in range(self.sites):
+            corpus = web.Application()
+            corpus.router.add_get("/page/{number}", self.corpus.page)
+            self.bing.siteURLs.append(await self._serve(corpus))
+        logger.info(f"Fake upstreams listening on {self.baseURL}")
+        return self
+
+    async def stopAsync(self) -> None:
+        for runner in self._runners:
+            await runner.cleanup()
+        self._runners = []
+
+    async def __aenter__(self) -> "FakeUpstreams":
+        return await self.startAsync()
+
+    async def __aexit__(self, *exc) -> None:
+        await self.stopAsync()
+
+    def start(self) -> "FakeUpstreams":
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fake-upstreams", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.startAsync(), self._loop).result()
+        return self
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.stopAsync(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+
+def endpoint_from_args(args, prefix: str, seed: int) -> Endpoint:
+    def option(name):
+        value = getattr(args, f"{prefix}_{name}", None)
+        return getattr(args, name) if value is None else value
+
+    return Endpoint(
+        LatencyModel(option("latency"), option("jitter"), args.distribution, seed=seed),
+        FailureInjector(option("error_rate"), option("rate_limit_rate"), option("timeout_rate"), seed=seed),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=100, help="mean latency in ms for every endpoint")
+    parser.add_argument("--jitter", type=float, default=30, help="latency spread in ms")
+    parser.add_argument("--distribution", choices=("fixed", "uniform", "lognormal"), default="lognormal")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0, help="fraction answered with a 429")
+    parser.add_argument("--timeout-rate", type=float, default=0, help="fraction that hang past client timeouts")
+    for prefix in ("llm", "bing", "web"):
+        parser.add_argument(f"--{prefix}-latency", type=float, default=None)
+        parser.add_argument(f"--{prefix}-jitter", type=float, default=None)
+        parser.add_argument(f"--{prefix}-error-rate", type=float, default=None)
+        parser.add_argument(f"--{prefix}-rate-limit-rate", type=float, default=None)
+        parser.add_argument(f"--{prefix}-timeout-rate", type=float, default=None)
+    parser.add_argument("--token-rate", type=float, default=50, help="streamed tokens per second")
+    parser.add_argument("--corpus-size", type=int, default=100)
+    parser.add_argument("--sites", type=int, default=5, help="ports the corpus is spread over")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = FakeWeb(endpoint_from_args(args, "web", args.seed), size=args.corpus_size, seed=args.seed)
+    fakes = FakeUpstreams(
+        openai=FakeOpenAI(endpoint_from_args(args, "llm", args.seed), token_rate=args.token_rate, seed=args.seed),
+        corpus=corpus,
+        bing=FakeBing(corpus, endpoint_from_args(args, "bing", args.seed), seed=args.seed),
+        sites=args.sites,
+    ).start()
+
+    for name, value in fakes.environ().items():
+        print(f"export {name}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fakes.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import asyncio
+import atexit
+import logging
+import queue
+import threading
+from typing import AsyncIterator, Awaitable, Callable, Iterator, List, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_thread: Optional[threading.Thread] = None
+_loopLock = threading.Lock()
+_shutdownHooks: List[Callable[[], Awaitable[None]]] = []
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the long-lived event loop for this process, starting it on first use.
+
+    Sync callers (Flask views, Dash callbacks) submit coroutines to this loop so that
+    shared clients and their connection pools survive between requests.
+    """
+    global _loop, _thread
+    with _loopLock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(
+                target=_loop.run_forever, name="searchapp-loop", daemon=True
+            )
+            _thread.start()
+            logger.debug("Started background event loop")
+        return _loop
+
+
+def run_sync(coro: Awaitable, timeout: Optional[float] = None):
+    """
+    Run a coroutine on the background loop and block until it returns.
+    """
+    loop = get_loop()
+    if threading.current_thread() is _thread:
+        raise RuntimeError("run_sync() cannot be called from the background loop itself")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+
+def iterate_sync(agen: AsyncIterator, timeout: Optional[float] = None) -> Iterator:
+    """
+    Drive an async generator on the background loop and yield its items to a sync caller.
+
+    Closing the returned iterator (e.g. the client disconnected) cancels the generator.
+    """
+    loop = get_loop()
+    items: "queue.Queue" = queue.Queue()
+    done = object()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put((item, None))
+        except Exception as e:
+            items.put((done, e))
+        else:
+            items.put((done, None))
+
+    future = asyncio.run_coroutine_threadsafe(pump(), loop)
+    try:
+        while True:
+            item, error = items.get(timeout=timeout)
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        future.cancel()
+
+
+def add_shutdown_hook(hook: Callable[[], Awaitable[None]]) -> None:
+    # Hooks are awaited on the background loop when the process exits
+    if hook not in _shutdownHooks:
+        _shutdownHooks.append(hook)
+
+
+async def run_shutdown_hooks() -> None:
+    """
+    Close the shared clients on the running loop, for servers that own their loop (ASGI).
+    """
+    for hook in list(_shutdownHooks):
+        try:
+            await hook()
+        except Exception as e:
+            logger.error(f"Error in shutdown hook: {e}")
+
+
+def shutdown(timeout: float = 5) -> None:
+    """
+    Run the shutdown hooks and stop the background loop.
+    """
+    global _loop, _thread
+    with _loopLock:
+        loop, thread = _loop, _thread
+        _loop, _thread = None, None
+
+    if loop is None or loop.is_closed():
+        return
+
+    try:
+        asyncio.run_coroutine_threadsafe(run_shutdown_hooks(), loop).result(timeout)
+    except Exception as e:
+        logger.error(f"Error while shutting down the background loop: {e}")
+
+    loop.call_soon_threadsafe(loop.stop)
+    if thread is not None:
+        thread.join(timeout)
+    if not loop.is_running():
+        loop.close()
+
+
+atexit.register(shutdown)
+
+
+class SharedSession:
+    """
+    A pooled aiohttp session that is created lazily and reused by every caller on the same loop.
+
+    aiohttp sessions are bound to the loop they were created on, so a new session is opened
+    if the object is used from a different loop (e.g. one asyncio.run() per call).
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 0,
+        keepalive_timeout: float = 30,
+        max_concurrency: int = 10,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.max_concurrency = max_concurrency
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _bind(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._session is not None and not self._session.closed and self._loop is loop:
+            return
+
+        if self._session is not None and not self._session.closed:
+            logger.debug("Event loop changed, opening a new pooled session")
+
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+        self._session = aiohttp.ClientSession(connector=connector)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._loop = loop
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        self._bind()
+        return self._session
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        self._bind()
+        return self._semaphore
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._semaphore = None
+        self._loop = None
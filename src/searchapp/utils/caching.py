@@ -1,21 +1,126 @@
 import redis
 import json
+import os
+import threading
 import time
 import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
 from faker import Faker
 
+from searchapp.utils.telemetry import record_cache
+
 logger = logging.getLogger(__name__)
 
+class LocalCache:
+    """
+    Bounded in-process cache with LRU eviction and a TTL per entry. Safe to share between threads.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl or ttl)
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+_localCaches: Dict[str, LocalCache] = {}
+_localCachesLock = threading.Lock()
+
+
+def shared_local_cache(name: str, maxsize: Optional[int] = None, ttl: Optional[float] = None) -> LocalCache:
+    """
+    Return the per-process LocalCache registered under name, creating it on first use.
+
+    Defaults come from CACHE_L1_SIZE and CACHE_L1_TTL.
+    """
+    with _localCachesLock:
+        if name not in _localCaches:
+            _localCaches[name] = LocalCache(
+                maxsize=maxsize or int(os.getenv("CACHE_L1_SIZE", 1024)),
+                ttl=ttl if ttl is not None else float(os.getenv("CACHE_L1_TTL", 300)),
+            )
+        return _localCaches[name]
+
+
 class RedisHelper:
 
-    def __init__(self, host='localhost', port=6379, db=0):
+    def __init__(
+        self,
+        host='localhost',
+        port=6379,
+        db=0,
+        local_cache: Optional[LocalCache] = None,
+        default_ttl: Optional[int] = None,
+        name: Optional[str] = None,
+        **client_options,
+    ):
         # Initialize Redis connection
         self.redis_client = redis.StrictRedis(
             host=host,
             port=port,
             db=db,
-            decode_responses=True  # Ensures values are returned as strings
+            decode_responses=True,  # Ensures values are returned as strings
+            **client_options,
         )
+        # Optional in-process tier checked before Redis, and a TTL applied to every write
+        self.local_cache = local_cache
+        self.default_ttl = default_ttl
+        # Lookups are counted under this cache name in the metrics when given
+        self.name = name
     
     def connectionStatus(self):
         # Check if the connection is successful
@@ -24,17 +129,33 @@ class RedisHelper:
         except redis.ConnectionError:
             return False
     
-    def store(self, key: str, value: str):
-        # Store the result in Redis with the key
-        self.redis_client.set(key, value)
+    def store(self, key: str, value: str, ttl: Optional[int] = None):
+        # Store the result in Redis with the key, expiring after ttl seconds if given
+        ttl = ttl if ttl is not None else self.default_ttl
+        if ttl:
+            self.redis_client.set(key, value, ex=ttl)
+        else:
+            self.redis_client.set(key, value)
+
+        if self.local_cache is not None:
+            self.local_cache.set(key, value, ttl=ttl or None)
 
     def lookup(self, key: str) -> str:
+        # Check the in-process tier before going to Redis
+        if self.local_cache is not None:
+            result = self.local_cache.get(key)
+            if result is not None:
+                if self.name:
+                    record_cache(self.name, "l1_hit")
+                return result
+
         # Look up the key in Redis
-        start_time = time.time()
         result = self.redis_client.get(key)
-        time_taken_ms = (time.time() - start_time) * 1000
-        # show the time taken to retrieve the key in milliseconds
-        logger.info(f"Time taken to retrieve key in ms: {time_taken_ms}")
+        if self.name:
+            record_cache(self.name, "miss" if result is None else "hit")
+
+        if result is not None and self.local_cache is not None:
+            self.local_cache.set(key, result)
         return result
     
     def exists(self, key: str) -> bool:
@@ -45,14 +166,59 @@ class RedisHelper:
         # Get the number of keys in the Redis database
         return self.redis_client.dbsize()
 
+    def add_to_sets(self, keys: List[str], member: str, ttl: Optional[int] = None):
+        # Add one member to several sets in a single round trip
+        pipe = self.redis_client.pipeline()
+        for key in keys:
+            pipe.sadd(key, member)
+            if ttl:
+                pipe.expire(key, ttl)
+        pipe.execute()
+
+    def union_sets(self, keys: List[str]) -> Set[str]:
+        if not keys:
+            return set()
+        return self.redis_client.sunion(keys)
+
     def delete(self, key: str):
         # Optionally implement a delete method if you want to invalidate cache
         self.redis_client.delete(key)
+        if self.local_cache is not None:
+            self.local_cache.delete(key)
 
     def flush(self):
         # Clears all keys in the Redis database (use with caution)
         logger.info("Flushing Redis database...")
         self.redis_client.flushdb()
+        if self.local_cache is not None:
+            self.local_cache.clear()
+
+    def set_memory_limit(self, maxmemory: str, policy: str = "allkeys-lru") -> bool:
+        # Bound Redis memory, managed Redis services may not allow CONFIG SET
+        try:
+            self.redis_client.config_set("maxmemory", maxmemory)
+            self.redis_client.config_set("maxmemory-policy", policy)
+            return True
+        except redis.RedisError as e:
+            logger.warning(f"Unable to set Redis memory limit: {e}")
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        # Eviction and expiry counters for both tiers
+        stats: Dict[str, Any] = {}
+        if self.local_cache is not None:
+            stats["local"] = self.local_cache.stats()
+        try:
+            info = self.redis_client.info("stats")
+            stats["redis"] = {
+                "evicted_keys": info.get("evicted_keys", 0),
+                "expired_keys": info.get("expired_keys", 0),
+                "keyspace_hits": info.get("keyspace_hits", 0),
+                "keyspace_misses": info.get("keyspace_misses", 0),
+            }
+        except redis.RedisError as e:
+            logger.warning(f"Unable to read Redis stats: {e}")
+        return stats
 
     def populate_dummy_data(self, num_entries: int):
         # Use Faker to generate dummy data
@@ -70,4 +236,120 @@ class RedisHelper:
             # Store the value as a JSON string
             self.store(key, json.dumps(value))
         
-        logger.info(f"Inserted {num_entries} key-value pairs into Redis.")
\ No newline at end of file
+        logger.info(f"Inserted {num_entries} key-value pairs into Redis.")
+
+
+class JSONCache:
+    """
+    Namespaced JSON values in Redis, optionally behind a LocalCache.
+
+    Meant for optional caches on the request path: errors are logged rather than raised,
+    and after a Redis error only the local tier is used for retry_after seconds so a
+    missing Redis costs nothing per call.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl: Optional[int] = None,
+        local_cache: Optional[LocalCache] = None,
+        redis_helper: Optional[RedisHelper] = None,
+        retry_after: float = 30,
+        metrics: bool = True,
+    ):
+        self.namespace = namespace
+        # Stores that are not caches, e.g. job state, stay out of the hit/miss counters
+        self.metrics = metrics
+        self.ttl = ttl
+        self.local_cache = local_cache
+        # Short timeouts and no retries, a cache miss is cheaper than waiting on Redis
+        self.redis = redis_helper or RedisHelper(
+            socket_connect_timeout=0.5, socket_timeout=0.5, retry=None
+        )
+        self.retry_after = retry_after
+        self._skipRedisUntil = 0.0
+
+    def key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _redisAvailable(self) -> bool:
+        return time.monotonic() >= self._skipRedisUntil
+
+    def _redisFailed(self, e: Exception) -> None:
+        logger.warning(f"Redis unavailable for '{self.namespace}' cache, retrying in {self.retry_after}s: {e}")
+        self._skipRedisUntil = time.monotonic() + self.retry_after
+
+    def _record(self, result: str) -> None:
+        if self.metrics:
+            record_cache(self.namespace, result)
+
+    def get(self, key: str) -> Optional[Any]:
+        key = self.key(key)
+        if self.local_cache is not None:
+            value = self.local_cache.get(key)
+            if value is not None:
+                self._record("l1_hit")
+                return value
+
+        if not self._redisAvailable():
+            self._record("miss")
+            return None
+        try:
+            raw = self.redis.lookup(key)
+        except redis.RedisError as e:
+            self._redisFailed(e)
+            self._record("miss")
+            return None
+        if raw is None:
+            self._record("miss")
+            return None
+        self._record("hit")
+
+        try:
+            value = json.loads(raw)
+        except ValueError as e:
+            logger.error(f"Invalid cache entry for {key}: {e}")
+            return None
+        if self.local_cache is not None:
+            self.local_cache.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        key = self.key(key)
+        ttl = ttl if ttl is not None else self.ttl
+        if self.local_cache is not None:
+            self.local_cache.set(key, value, ttl=ttl)
+
+        if not self._redisAvailable():
+            return
+        try:
+            self.redis.store(key, json.dumps(value), ttl=ttl)
+        except redis.RedisError as e:
+            self._redisFailed(e)
+
+    def delete(self, key: str) -> None:
+        key = self.key(key)
+        if self.local_cache is not None:
+            self.local_cache.delete(key)
+        if not self._redisAvailable():
+            return
+        try:
+            self.redis.delete(key)
+        except redis.RedisError as e:
+            self._redisFailed(e)
+
+
+_jsonCaches: Dict[str, JSONCache] = {}
+_jsonCachesLock = threading.Lock()
+
+
+def shared_json_cache(namespace: str, ttl: Optional[int] = None) -> JSONCache:
+    """
+    Return the per-process JSONCache for namespace, with its own LocalCache tier.
+    """
+    with _jsonCachesLock:
+        if namespace not in _jsonCaches:
+            _jsonCaches[namespace] = JSONCache(
+                namespace, ttl=ttl, local_cache=shared_local_cache(namespace)
+            )
+        return _jsonCaches[namespace]
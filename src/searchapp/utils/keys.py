@@ -0,0 +1,128 @@
+import hashlib
+import json
+import logging
+import unicodedata
+import zlib
+from typing import List, Optional
+
+import numpy as np
+
+from searchapp.utils.ranking import STOPWORDS
+
+logger = logging.getLogger(__name__)
+
+
+# Sentence punctuation and quotes around words. Anything else, such as the symbols in
+# "c++", "c#", "3.14", "-5" or "$100", changes what is being asked and is kept
+LEADING_PUNCTUATION = "\"'([{¿¡«“‘"
+TRAILING_PUNCTUATION = ".,;:!?…\"')]}»”’。、"
+
+
+def normalize_question(question: str) -> str:
+    """
+    Canonical form of a question for cache lookups: Unicode NFKC, case-folded, sentence
+    punctuation stripped from the ends of words, whitespace collapsed.
+    """
+    text = unicodedata.normalize("NFKC", question or "").casefold()
+    words = (word.lstrip(LEADING_PUNCTUATION).rstrip(TRAILING_PUNCTUATION) for word in text.split())
+    return " ".join(word for word in words if word)
+
+
+def question_key(question: str, namespace: str = "answer") -> str:
+    # Hash the normalized text so keys stay short whatever the question length
+    digest = hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()[:32]
+    return f"{namespace}:{digest}"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:32]
+
+
+class MinHasher:
+    """
+    MinHash signatures over word unigrams and bigrams, with LSH banding.
+
+    Two questions share at least one band with high probability when their Jaccard
+    similarity is above roughly (1 / bands) ** (1 / rows).
+    """
+
+    PRIME = (1 << 31) - 1
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, self.PRIME, size=num_perm, dtype=np.int64)
+        self.b = rng.randint(0, self.PRIME, size=num_perm, dtype=np.int64)
+
+    def shingles(self, text: str) -> List[str]:
+        # The question key's words, so "c++" and "c#" or "-5" and "5" stay different shingles
+        words = [word for word in normalize_question(text).split() if word not in STOPWORDS]
+        return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+    def signature(self, text: str) -> np.ndarray:
+        shingles = self.shingles(text)
+        if not shingles:
+            return np.full(self.num_perm, self.PRIME, dtype=np.int64)
+
+        hashes = np.array([zlib.crc32(s.encode("utf-8")) for s in shingles], dtype=np.int64)
+        # (a * x + b) mod p for every permutation and shingle at once, then the minimum per permutation
+        permuted = (self.a[:, None] * hashes[None, :] + self.b[:, None]) % self.PRIME
+        return permuted.min(axis=1)
+
+    def band_keys(self, signature: np.ndarray) -> List[str]:
+        keys = []
+        for band in range(self.bands):
+            rows = signature[band * self.rows:(band + 1) * self.rows]
+            digest = hashlib.blake2b(rows.tobytes(), digest_size=8).hexdigest()
+            keys.append(f"{band}:{digest}")
+        return keys
+
+    def similarity(self, first: np.ndarray, second: np.ndarray) -> float:
+        return float(np.mean(first == second))
+
+
+class NearDuplicateIndex:
+    """
+    LSH index in Redis mapping question signatures to the cache keys of their answers.
+
+    Band buckets live in "lsh:<namespace>:<band>:<hash>" sets and each signature in
+    "minhash:<cache key>", so every worker sees the same index.
+    """
+
+    def __init__(self, redis_helper, threshold: float = 0.8, namespace: str = "answer", hasher: Optional[MinHasher] = None):
+        self.redis = redis_helper
+        self.threshold = threshold
+        self.namespace = namespace
+        self.hasher = hasher or MinHasher()
+
+    def _bucketKeys(self, signature: np.ndarray) -> List[str]:
+        return [f"lsh:{self.namespace}:{band}" for band in self.hasher.band_keys(signature)]
+
+    def add(self, question: str, key: str, ttl: Optional[int] = None) -> None:
+        signature = self.hasher.signature(question)
+        self.redis.store(f"minhash:{key}", json.dumps(signature.tolist()), ttl=ttl)
+        self.redis.add_to_sets(self._bucketKeys(signature), key, ttl=ttl)
+
+    def query(self, question: str) -> Optional[str]:
+        """
+        Return the cache key of the most similar indexed question above the threshold, if any.
+        """
+        signature = self.hasher.signature(question)
+        candidates = self.redis.union_sets(self._bucketKeys(signature))
+
+        best, bestScore = None, self.threshold
+        for candidate in candidates:
+            stored = self.redis.lookup(f"minhash:{candidate}")
+            if not stored:
+                continue
+            score = self.hasher.similarity(signature, np.asarray(json.loads(stored), dtype=np.int64))
+            if score >= bestScore:
+                best, bestScore = candidate, score
+
+        if best:
+            logger.debug(f"Near-duplicate match for '{question}' with similarity {bestScore:.2f}")
+        return best
@@ -0,0 +1,97 @@
+import math
+import re
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+TOKEN = re.compile(r"\w+", re.UNICODE)
+
+# Kept short on purpose: question words like "how" or "why" still carry little weight through IDF
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "was", "were", "with",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25:
+    """
+    Okapi BM25 over a small in-memory corpus (page chunks, snippets, sentences).
+
+    Documents are stored as one flat array of term ids so scoring a query is a couple of
+    NumPy bincounts rather than a Python loop per document.
+    """
+
+    def __init__(self, documents: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: Dict[str, int] = {}
+
+        termIds: List[int] = []
+        docIds: List[int] = []
+        lengths = np.zeros(len(documents), dtype=np.float64)
+        for docId, document in enumerate(documents):
+            tokens = tokenize(document)
+            lengths[docId] = len(tokens)
+            for token in tokens:
+                termIds.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+            docIds.extend([docId] * len(tokens))
+
+        self.termIds = np.asarray(termIds, dtype=np.int64)
+        self.docIds = np.asarray(docIds, dtype=np.int64)
+        self.lengths = lengths
+        self.avgLength = lengths.mean() if len(documents) and lengths.mean() > 0 else 1.0
+        self.size = len(documents)
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        Return one score per document, in corpus order.
+        """
+        queryTerms = [self.vocabulary[t] for t in dict.fromkeys(tokenize(query)) if t in self.vocabulary]
+        if not queryTerms or self.size == 0:
+            return np.zeros(self.size)
+
+        # Position of each query term in queryTerms, -1 for everything else
+        position = np.full(len(self.vocabulary), -1, dtype=np.int64)
+        position[queryTerms] = np.arange(len(queryTerms))
+        termPosition = position[self.termIds]
+        mask = termPosition >= 0
+
+        # Term frequency matrix, documents x query terms
+        tf = np.bincount(
+            self.docIds[mask] * len(queryTerms) + termPosition[mask],
+            minlength=self.size * len(queryTerms),
+        ).reshape(self.size, len(queryTerms)).astype(np.float64)
+
+        df = (tf > 0).sum(axis=0)
+        idf = np.log((self.size - df + 0.5) / (df + 0.5) + 1.0)
+        norm = self.k1 * (1 - self.b + self.b * self.lengths / self.avgLength)
+        return ((tf * (self.k1 + 1)) / (tf + norm[:, None]) * idf).sum(axis=1)
+
+
+def topK(scores: np.ndarray, k: int) -> List[int]:
+    """
+    Indices of the k highest scores, best first. Ties keep corpus order.
+    """
+    if k <= 0 or len(scores) == 0:
+        return []
+    order = np.argsort(-scores, kind="stable")
+    return order[: min(k, len(order))].tolist()
+
+
+def termCoverage(query: str, document: str) -> float:
+    """
+    Fraction of the query's distinct terms that appear in document, 1.0 for an empty query.
+    """
+    terms = set(tokenize(query))
+    if not terms:
+        return 1.0
+    return len(terms.intersection(tokenize(document))) / len(terms)
+
+
+def estimateTokens(text: str) -> int:
+    # Roughly four characters per token for English text
+    return math.ceil(len(text) / 4)
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import redis
+
+from searchapp.utils.caching import RedisHelper
+
+logger = logging.getLogger(__name__)
+
+# Refill and take tokens atomically using the Redis server clock, so every worker shares one budget.
+# Returns the seconds to wait as a string (Lua numbers are truncated to integers otherwise).
+TOKEN_BUCKET_SCRIPT = """
+local blocked = redis.call('PTTL', KEYS[2])
+if blocked > 0 then
+    return tostring(blocked / 1000)
+end
+
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+# Pause the bucket for ARGV[1] milliseconds unless a longer pause is already set, so a short
+# Retry-After seen by one worker cannot cut short a longer one seen by another
+BLOCK_SCRIPT = """
+local pause = tonumber(ARGV[1])
+if redis.call('PTTL', KEYS[1]) < pause then
+    redis.call('SET', KEYS[1], '1', 'PX', pause)
+    return 1
+end
+return 0
+"""
+
+
+def parse_retry_after(value: Optional[str], default: float = 1.0) -> float:
+    """
+    Seconds to wait from a Retry-After header, given either as seconds or as an HTTP date.
+    """
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class RateLimitTimeout(Exception):
+    pass
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` requests per second with bursts up to `capacity`.
+
+    The bucket lives in Redis so all gunicorn workers draw from the same budget. If Redis is
+    unavailable each worker falls back to a local bucket for retry_after seconds. Callers only
+    wait when the budget is exhausted or an upstream Retry-After is in force.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        capacity: Optional[float] = None,
+        use_redis: bool = True,
+        redis_helper: Optional[RedisHelper] = None,
+        retry_after: float = 30,
+    ):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.retry_after = retry_after
+
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blockedUntil = 0.0
+        self._skipRedisUntil = 0.0
+
+        self.redis: Optional[RedisHelper] = None
+        self._script = None
+        self._blockScript = None
+        if use_redis:
+            # Short timeouts and no retries, a local decision beats waiting on Redis
+            self.redis = redis_helper or RedisHelper(
+                socket_connect_timeout=0.5, socket_timeout=0.5, retry=None
+            )
+            self._script = self.redis.redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+            self._blockScript = self.redis.redis_client.register_script(BLOCK_SCRIPT)
+
+    @property
+    def bucketKey(self) -> str:
+        return f"ratelimit:{self.name}"
+
+    @property
+    def blockedKey(self) -> str:
+        return f"ratelimit:{self.name}:blocked"
+
+    def _redisAvailable(self) -> bool:
+        return self._script is not None and time.monotonic() >= self._skipRedisUntil
+
+    def _redisFailed(self, e: Exception) -> None:
+        logger.warning(f"Redis unavailable for '{self.name}' rate limit, using a local bucket for {self.retry_after}s: {e}")
+        self._skipRedisUntil = time.monotonic() + self.retry_after
+
+    def tryAcquire(self, tokens: float = 1) -> float:
+        """
+        Take tokens if available. Returns 0 on success, otherwise the seconds to wait before retrying.
+        """
+        if self._redisAvailable():
+            try:
+                return float(
+                    self._script(
+                        keys=[self.bucketKey, self.blockedKey],
+                        args=[self.rate, self.capacity, tokens],
+                    )
+                )
+            except redis.RedisError as e:
+                self._redisFailed(e)
+
+        with self._lock:
+            now = time.monotonic()
+            if self._blockedUntil > now:
+                return self._blockedUntil - now
+
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    async def acquire(self, tokens: float = 1, timeout: Optional[float] = None) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            # The Redis script is a blocking call, keep it off the event loop
+            wait = await loop.run_in_executor(None, self.tryAcquire, tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(self._boundedWait(wait, deadline))
+
+    def acquireSync(self, tokens: float = 1, timeout: Optional[float] = None) -> None:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.tryAcquire(tokens)
+            if wait <= 0:
+                return
+            time.sleep(self._boundedWait(wait, deadline))
+
+    def _boundedWait(self, wait: float, deadline: Optional[float]) -> float:
+        if deadline is None:
+            return wait
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or wait > remaining:
+            raise RateLimitTimeout(f"Rate limit '{self.name}' would wait {wait:.2f}s")
+        return wait
+
+    def block(self, seconds: float) -> None:
+        """
+        Pause the bucket for every worker, e.g. after a 429 with Retry-After.
+        """
+        if seconds <= 0:
+            return
+        logger.warning(f"Rate limit '{self.name}' paused for {seconds:.2f}s")
+        with self._lock:
+            self._blockedUntil = max(self._blockedUntil, time.monotonic() + seconds)
+
+        if self._redisAvailable():
+            try:
+                # Redis rejects PX 0, a sub-millisecond pause still blocks for one
+                self._blockScript(keys=[self.blockedKey], args=[max(1, int(seconds * 1000))])
+            except redis.RedisError as e:
+                self._redisFailed(e)
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_bucketsLock = threading.Lock()
+
+
+def shared_token_bucket(name: str, rate: float, capacity: Optional[float] = None) -> TokenBucket:
+    """
+    Return the per-process TokenBucket for name, backed by the shared Redis bucket.
+    """
+    with _bucketsLock:
+        if name not in _buckets:
+            _buckets[name] = TokenBucket(name, rate, capacity)
+        return _buckets[name]
@@ -0,0 +1,342 @@
+"""
+Timeouts, retries with jittered backoff, hedged requests and a circuit breaker for calls
+to upstream services, shared by the LLM client and Bing.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import AsyncContextManager, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+import aiohttp
+import requests
+
+from searchapp.utils.telemetry import percentile, record_upstream_error
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class UpstreamError(Exception):
+    """
+    A response the caller could not use. 429 and 5xx are retried, other statuses are not.
+    """
+
+    def __init__(self, status: int, retry_after: Optional[float] = None, response=None, message: str = ""):
+        super().__init__(message or f"Upstream returned status {status}")
+        self.status = status
+        self.retry_after = retry_after
+        self.response = response
+
+    @property
+    def retryable(self) -> bool:
+        return self.status == 429 or self.status >= 500
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised without calling the upstream while its circuit breaker is open.
+    """
+
+
+# Errors that mean the upstream is struggling: retried, and counted by the circuit breaker
+TRANSIENT_ERRORS = (
+    aiohttp.ClientConnectionError,
+    asyncio.TimeoutError,
+    requests.ConnectionError,
+    requests.Timeout,
+)
+
+
+def isTransient(error: BaseException) -> bool:
+    if isinstance(error, UpstreamError):
+        return error.retryable
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def backoffDelay(attempt: int, base: float = 0.5, cap: float = 8.0, rng: random.Random = random) -> float:
+    """
+    Full-jitter exponential backoff: a random delay up to base * 2**attempt, capped.
+    """
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and fails calls fast for
+    reset_timeout seconds, then lets a single trial call through to decide whether to close.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.openedAt = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            # One trial call, the others keep failing fast until it reports back. A trial
+            # that never reports (e.g. cancelled) is replaced after another reset_timeout
+            if time.monotonic() - self.openedAt >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self.openedAt = time.monotonic()
+                return True
+            return False
+
+    def recordSuccess(self) -> None:
+        with self.lock:
+            if self.state != CLOSED:
+                logger.info(f"Circuit for {self.name} closed")
+            self.state = CLOSED
+            self.failures = 0
+
+    def recordFailure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                if self.state == CLOSED:
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.state = OPEN
+                self.openedAt = time.monotonic()
+
+
+class LatencyWindow:
+    """
+    Recent successful call durations, used to decide when a call is slow enough to hedge.
+    """
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.samples: Deque[float] = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.samples) < self.min_samples:
+            return None
+        return percentile(list(self.samples), q)
+
+
+class ResiliencePolicy:
+    """
+    How calls to one upstream are made: a timeout per attempt, retries of 429, 5xx,
+    connection errors and timeouts with jittered exponential backoff (or the server's
+    Retry-After), an optional hedged duplicate when an attempt runs past the recent p95,
+    and a circuit breaker shared by every caller in the process.
+
+    Hedging sends the same request twice, only enable it for idempotent calls.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout: float = 30,
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 8.0,
+        hedge: bool = False,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker(name)
+        self.latency = LatencyWindow()
+
+    def check(self) -> None:
+        if not self.breaker.allow():
+            record_upstream_error(self.name, "circuit_open")
+            raise CircuitOpenError(f"Circuit for {self.name} is open")
+
+    def succeeded(self, seconds: Optional[float] = None) -> None:
+        self.breaker.recordSuccess()
+        if seconds is not None:
+            self.latency.record(seconds)
+
+    def failed(self, error: BaseException) -> None:
+        # Client errors such as 400 and rate limiting say nothing about the upstream's health
+        if isTransient(error) and getattr(error, "status", None) != 429:
+            self.breaker.recordFailure()
+
+    def retryDelay(self, error: BaseException, attempt: int, retries: Optional[int] = None) -> Optional[float]:
+        """
+        Seconds to wait before retrying after error, or None when it should not be retried.
+        """
+        retries = self.max_retries if retries is None else retries
+        if attempt >= retries or not isTransient(error):
+            return None
+        delay = backoffDelay(attempt, self.backoff_base, self.backoff_cap)
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        hedge: Optional[bool] = None,
+        gate: Optional[Callable[[], AsyncContextManager]] = None,
+    ) -> T:
+        """
+        Await fn() under the policy and return its result, or raise the last error.
+
+        gate, when given, returns an async context manager entered around each attempt for
+        local admission such as a rate limiter or a concurrency semaphore. Time spent waiting
+        to enter it is not part of the timeout, the latency window or the breaker's view.
+        """
+        timeout = timeout or self.timeout
+        hedge = self.hedge if hedge is None else hedge
+        attempt = 0
+        while True:
+            self.check()
+            try:
+                if hedge:
+                    result, seconds = await self._hedged(fn, timeout, gate)
+                else:
+                    result, seconds = await self._timed(fn, timeout, gate)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed(e)
+                delay = self.retryDelay(e, attempt, retries)
+                if delay is None:
+                    raise
+                logger.warning(f"{self.name} call failed ({e!r}), retry {attempt + 1} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.succeeded(seconds)
+            return result
+
+    async def _timed(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        timeout: float,
+        gate: Optional[Callable[[], AsyncContextManager]] = None,
+        admitted: Optional[asyncio.Event] = None,
+    ) -> Tuple[T, float]:
+        # One request in its own gate slot, timed from when the gate let it through
+        if gate is None:
+            return await self._run(fn, timeout, admitted)
+        async with gate():
+            return await self._run(fn, timeout, admitted)
+
+    async def _run(
+        self, fn: Callable[[], Awaitable[T]], timeout: float, admitted: Optional[asyncio.Event]
+    ) -> Tuple[T, float]:
+        if admitted is not None:
+            admitted.set()
+        start = time.monotonic()
+        result = await asyncio.wait_for(fn(), timeout)
+        return result, time.monotonic() - start
+
+    async def _hedged(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        timeout: float,
+        gate: Optional[Callable[[], AsyncContextManager]] = None,
+    ) -> Tuple[T, float]:
+        # Without enough history there is no p95 to hedge at
+        hedgeAfter = self.latency.percentile(95)
+        admitted = asyncio.Event()
+        primary = asyncio.ensure_future(self._timed(fn, timeout, gate, admitted))
+        if hedgeAfter is None:
+            return await primary
+
+        tasks = [primary]
+        try:
+            # The hedge clock starts once the primary is through the gate, not while it queues
+            waiter = asyncio.ensure_future(admitted.wait())
+            tasks.append(waiter)
+            await asyncio.wait([primary, waiter], return_when=asyncio.FIRST_COMPLETED)
+            tasks.remove(waiter)
+            waiter.cancel()
+
+            done, _ = await asyncio.wait([primary], timeout=hedgeAfter)
+            if not done:
+                logger.debug(f"{self.name} call slower than p95 ({hedgeAfter:.2f}s), sending a hedged request")
+                # The duplicate takes a gate slot of its own, so hedging stays within the concurrency limit
+                tasks.append(asyncio.ensure_future(self._timed(fn, max(0.001, timeout - hedgeAfter), gate)))
+
+            error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def callSync(self, fn: Callable[[], T], retries: Optional[int] = None) -> T:
+        """
+        Blocking version of call() for the requests-based code paths, without hedging.
+        The timeout has to be applied by fn itself.
+        """
+        attempt = 0
+        while True:
+            self.check()
+            start = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                self.failed(e)
+                delay = self.retryDelay(e, attempt, retries)
+                if delay is None:
+                    raise
+                logger.warning(f"{self.name} call failed ({e!r}), retry {attempt + 1} in {delay:.2f}s")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.succeeded(time.monotonic() - start)
+            return result
+
+
+_policies: Dict[str, ResiliencePolicy] = {}
+_policiesLock = threading.Lock()
+
+
+def shared_policy(name: str, timeout: float = 30, max_retries: int = 2, hedge: bool = False) -> ResiliencePolicy:
+    """
+    One policy, and so one circuit breaker, per upstream in the process.
+
+    The defaults can be overridden from the environment with the upper-cased name as
+    prefix, e.g. LLM_TIMEOUT, LLM_MAX_RETRIES, LLM_HEDGE, LLM_BREAKER_THRESHOLD and LLM_BREAKER_RESET.
+    """
+    with _policiesLock:
+        if name not in _policies:
+            prefix = name.upper()
+            _policies[name] = ResiliencePolicy(
+                name,
+                timeout=float(os.getenv(f"{prefix}_TIMEOUT", timeout)),
+                max_retries=int(os.getenv(f"{prefix}_MAX_RETRIES", max_retries)),
+                hedge=os.getenv(f"{prefix}_HEDGE", "1" if hedge else "0").lower() in ("1", "true", "yes"),
+                breaker=CircuitBreaker(
+                    name,
+                    failure_threshold=int(os.getenv(f"{prefix}_BREAKER_THRESHOLD", 5)),
+                    reset_timeout=float(os.getenv(f"{prefix}_BREAKER_RESET", 30)),
+                ),
+            )
+        return _policies[name]
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import os
+import threading
+import uuid
+from typing import Callable, Dict, Optional
+
+import redis
+
+from searchapp.utils.caching import RedisHelper
+
+logger = logging.getLogger(__name__)
+
+# Only the holder of the lease may release or extend it
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+REFRESH_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Token used when Redis is unreachable and the worker leads on its own
+LOCAL_TOKEN = "local"
+
+
+class Flight:
+    """
+    One caller's place in a single-flight group.
+
+    If result is set another caller already produced it. Otherwise the caller must compute
+    the value, store it where lookup() finds it, then call finish() so waiters are released.
+    """
+
+    def __init__(
+        self,
+        group: "SingleFlight",
+        key: str,
+        token: Optional[str] = None,
+        future: Optional[asyncio.Future] = None,
+        result: Optional[str] = None,
+    ):
+        self.group = group
+        self.key = key
+        self.token = token
+        self.future = future
+        self.result = result
+        self._heartbeat: Optional[asyncio.Task] = None
+        if token and token != LOCAL_TOKEN:
+            self._heartbeat = asyncio.ensure_future(group._keepLease(key, token))
+
+    @property
+    def isLeader(self) -> bool:
+        return self.token is not None
+
+    async def finish(self, result: Optional[str] = None) -> None:
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+        if self.token and self.token != LOCAL_TOKEN:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.group._releaseLease, self.key, self.token)
+        self.token = None
+        if self.future is not None:
+            self.group._resolve(self.key, self.future, result)
+            self.future = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent computations of the same key, within a worker and across workers.
+
+    Callers in the same worker share an asyncio future. Across workers the first caller takes
+    a Redis lease ("lease:<key>", SET NX PX) and the others poll lookup() until the leader has
+    stored its result. The leader keeps the lease alive while it works, so if it dies the lease
+    expires after lease_ttl seconds and a waiter takes over. Waiters give up after wait_timeout
+    seconds and compute the value themselves.
+    """
+
+    def __init__(
+        self,
+        redis_helper: Optional[RedisHelper] = None,
+        lease_ttl: float = 30,
+        wait_timeout: float = 120,
+        poll_interval: float = 0.25,
+    ):
+        # Short timeouts and no retries, without Redis every worker simply leads on its own
+        self.redis = redis_helper or RedisHelper(
+            socket_connect_timeout=0.5, socket_timeout=0.5, retry=None
+        )
+        self.lease_ttl = lease_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._release = self.redis.redis_client.register_script(RELEASE_SCRIPT)
+        self._refresh = self.redis.redis_client.register_script(REFRESH_SCRIPT)
+
+    def leaseKey(self, key: str) -> str:
+        return f"lease:{key}"
+
+    async def join(self, key: str, lookup: Callable[[], Optional[str]]) -> Flight:
+        """
+        Wait for a result for key, or return a leading Flight if this caller has to compute it.
+
+        lookup is a blocking callable returning the stored result, or None if there is none yet.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait_timeout
+
+        while True:
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            # Another request in this worker is already on it
+            try:
+                result = await asyncio.wait_for(asyncio.shield(future), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                logger.warning(f"Gave up waiting for in-flight '{key}', computing it again")
+                return Flight(self, key)
+            if result is not None:
+                return Flight(self, key, result=result)
+            # The leader failed, compete again
+
+        # This request represents the worker, local callers wait on its future
+        future = loop.create_future()
+        self._inflight[key] = future
+
+        try:
+            attempt = 0
+            while True:
+                token = await loop.run_in_executor(None, self._acquireLease, key)
+                if token:
+                    # On takeover the previous leader may have finished just before its lease went away
+                    result = await loop.run_in_executor(None, lookup) if attempt else None
+                    if result is None:
+                        return Flight(self, key, token=token, future=future)
+                    await loop.run_in_executor(None, self._releaseLease, key, token)
+                else:
+                    result = await loop.run_in_executor(None, lookup)
+
+                if result is not None:
+                    self._resolve(key, future, result)
+                    return Flight(self, key, result=result)
+
+                if loop.time() >= deadline:
+                    logger.warning(f"Gave up waiting for the lease on '{key}', computing it without one")
+                    return Flight(self, key, future=future)
+
+                attempt += 1
+                await asyncio.sleep(self.poll_interval)
+        except BaseException:
+            self._resolve(key, future, None)
+            raise
+
+    def _resolve(self, key: str, future: asyncio.Future, result: Optional[str]) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if not future.done():
+            future.set_result(result)
+
+    def _acquireLease(self, key: str) -> Optional[str]:
+        token = uuid.uuid4().hex
+        try:
+            acquired = self.redis.redis_client.set(
+                self.leaseKey(key), token, nx=True, px=int(self.lease_ttl * 1000)
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Redis unavailable for single-flight lease on '{key}': {e}")
+            return LOCAL_TOKEN
+        return token if acquired else None
+
+    def _releaseLease(self, key: str, token: str) -> None:
+        try:
+            self._release(keys=[self.leaseKey(key)], args=[token])
+        except redis.RedisError as e:
+            logger.warning(f"Unable to release single-flight lease on '{key}': {e}")
+
+    def _refreshLease(self, key: str, token: str) -> bool:
+        try:
+            return bool(self._refresh(keys=[self.leaseKey(key)], args=[token, int(self.lease_ttl * 1000)]))
+        except redis.RedisError as e:
+            logger.warning(f"Unable to refresh single-flight lease on '{key}': {e}")
+            return True
+
+    async def _keepLease(self, key: str, token: str) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            if not await loop.run_in_executor(None, self._refreshLease, key, token):
+                logger.warning(f"Lost single-flight lease on '{key}'")
+                return
+
+
+_singleFlight: Optional[SingleFlight] = None
+_singleFlightLock = threading.Lock()
+
+
+def getSingleFlight() -> Optional[SingleFlight]:
+    """
+    Return the process-wide SingleFlight, or None when SINGLE_FLIGHT is set to 0.
+    """
+    global _singleFlight
+    if os.getenv("SINGLE_FLIGHT", "1").lower() in ("0", "false", "no"):
+        return None
+    with _singleFlightLock:
+        if _singleFlight is None:
+            _singleFlight = SingleFlight(
+                lease_ttl=float(os.getenv("SINGLE_FLIGHT_LEASE_TTL", 30)),
+                wait_timeout=float(os.getenv("SINGLE_FLIGHT_WAIT", 120)),
+            )
+        return _singleFlight
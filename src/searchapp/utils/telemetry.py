@@ -0,0 +1,339 @@
+"""
+One instrumentation surface for the pipeline: spans per request, latency histograms and
+counters, rendered in the Prometheus text format by the /metrics endpoints.
+
+Set TELEMETRY=0 to turn spans and metrics off; stage() then costs two clock reads.
+"""
+import json
+import logging
+import math
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("TELEMETRY", "1").lower() not in ("0", "false", "no")
+
+# Requests slower than this are logged with their full span breakdown
+SLOW_TRACE_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", 20))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+
+def set_enabled(enabled: bool) -> None:
+    global ENABLED
+    ENABLED = enabled
+
+
+def _labelText(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self.values.get(tuple(str(labels.get(name, "")) for name in self.labelnames), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_labelText(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: a count per bucket (non-cumulative), then the sum and total count
+        self.values: Dict[Tuple[str, ...], List[float]] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = len(self.buckets)
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = position
+                break
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels) -> int:
+        series = self.values.get(tuple(str(labels.get(name, "")) for name in self.labelnames))
+        return series[-1] if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, series in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (math.inf,), series):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == math.inf else f'le="{float(bound)}"'
+                    lines.append(f"{self.name}_bucket{_labelText(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labelText(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_labelText(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = REGISTRY.register(
+    Histogram("searchapp_stage_seconds", "Latency of pipeline stages in seconds.", ["stage"])
+)
+CACHE_REQUESTS = REGISTRY.register(
+    Counter("searchapp_cache_requests_total", "Cache lookups by cache and result (l1_hit, hit, miss).", ["cache", "result"])
+)
+UPSTREAM_ERRORS = REGISTRY.register(
+    Counter("searchapp_upstream_errors_total", "Failed calls to upstream services by kind.", ["upstream", "kind"])
+)
+LLM_TOKENS = REGISTRY.register(
+    Counter("searchapp_llm_tokens_total", "Chat completion tokens by stage and kind (prompt, completion).", ["stage", "kind"])
+)
+
+
+def record_cache(cache: str, result: str) -> None:
+    if ENABLED:
+        CACHE_REQUESTS.inc(cache=cache, result=result)
+
+
+def record_upstream_error(upstream: str, kind: str) -> None:
+    if ENABLED:
+        UPSTREAM_ERRORS.inc(upstream=upstream, kind=kind)
+
+
+def record_tokens(stage: str, prompt: int, completion: int) -> None:
+    if ENABLED:
+        LLM_TOKENS.inc(prompt, stage=stage, kind="prompt")
+        LLM_TOKENS.inc(completion, stage=stage, kind="completion")
+
+
+def status_kind(status: int) -> str:
+    # Status classes keep the label set small
+    return f"http_{status // 100}xx"
+
+
+class Span:
+    __slots__ = ("name", "attributes", "start", "end")
+
+    def __init__(self, name: str, attributes: Optional[dict] = None):
+        self.name = name
+        self.attributes = attributes or {}
+        self.start = perf_counter()
+        self.end: Optional[float] = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def finish(self) -> None:
+        self.end = perf_counter()
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else perf_counter()) - self.start
+
+
+class _NoopSpan:
+    attributes: dict = {}
+
+    def set(self, **attributes) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """
+    The spans of one request, kept so slow requests can be logged with their breakdown.
+    """
+
+    def __init__(self, root: Span):
+        self.root = root
+        self.spans: List[Span] = []
+
+    def toDict(self) -> dict:
+        return {
+            "name": self.root.name,
+            "duration": round(self.root.duration, 4),
+            "attributes": self.root.attributes,
+            "spans": [
+                {
+                    "name": span.name,
+                    "offset": round(span.start - self.root.start, 4),
+                    "duration": round(span.duration, 4),
+                    "attributes": span.attributes,
+                }
+                for span in sorted(self.spans, key=lambda span: span.start)
+            ],
+        }
+
+
+class StageTimings:
+    """
+    Durations in seconds per pipeline stage, collected for one request or benchmark run.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, List[float]] = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.stages.setdefault(stage, []).append(seconds)
+
+    def merge(self, other: "StageTimings") -> None:
+        for stage, durations in other.stages.items():
+            self.stages.setdefault(stage, []).extend(durations)
+
+    def summary(self) -> Dict[str, dict]:
+        return {stage: summarize(durations) for stage, durations in self.stages.items()}
+
+
+# Tasks copy the context when they are created, so pages summarized concurrently record
+# into the same trace and StageTimings as the request that started them
+_timings: ContextVar[Optional[StageTimings]] = ContextVar("stage_timings", default=None)
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+# The slowest recent requests, for inspection from a shell or debugger
+slow_traces: Deque[dict] = deque(maxlen=20)
+
+
+@contextmanager
+def collect(timings: Optional[StageTimings] = None) -> Iterator[StageTimings]:
+    """
+    Record every stage() entered in this context, and in tasks started from it, into timings.
+    """
+    timings = timings if timings is not None else StageTimings()
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+@contextmanager
+def trace(name: str, **attributes) -> Iterator[Span]:
+    """
+    Root span of a request. Stages inside it become its child spans, and the request is
+    logged with all of them when it takes longer than TRACE_SLOW_SECONDS.
+    """
+    root = Span(name, attributes)
+    if not ENABLED:
+        try:
+            yield root
+        finally:
+            root.finish()
+        return
+
+    current = Trace(root)
+    token = _trace.set(current)
+    try:
+        yield root
+    except BaseException as e:
+        root.set(error=type(e).__name__)
+        raise
+    finally:
+        root.finish()
+        try:
+            _trace.reset(token)
+        except ValueError:
+            # Finalized from another context, e.g. an abandoned async generator
+            pass
+        STAGE_SECONDS.observe(root.duration, stage=name)
+        if root.duration >= SLOW_TRACE_SECONDS:
+            slow_traces.append(current.toDict())
+            logger.warning(f"Slow request: {json.dumps(current.toDict())}")
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Trace: {json.dumps(current.toDict())}")
+
+
+@contextmanager
+def stage(name: str, **attributes) -> Iterator:
+    """
+    Time a pipeline stage. Yields a span whose attributes (e.g. status) can be set inside.
+    """
+    timings = _timings.get()
+    current = _trace.get() if ENABLED else None
+    span = Span(name, attributes)
+    try:
+        yield span if current is not None else NOOP_SPAN
+    except BaseException as e:
+        span.set(error=type(e).__name__)
+        raise
+    finally:
+        span.finish()
+        if current is not None:
+            current.spans.append(span)
+        if ENABLED:
+            STAGE_SECONDS.observe(span.duration, stage=name)
+        if timings is not None:
+            timings.record(name, span.duration)
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """
+    Nearest-rank percentile, q in [0, 100].
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(durations: Sequence[float]) -> dict:
+    return {
+        "count": len(durations),
+        "mean": sum(durations) / len(durations) if durations else 0.0,
+        "p50": percentile(durations, 50),
+        "p95": percentile(durations, 95),
+        "p99": percentile(durations, 99),
+    }
@@ -0,0 +1,166 @@
+"""
+ASGI entry point. Handlers await the pipeline on the server's own event loop, so no
+worker thread is held while a question is answered and the pooled clients live as long
+as the process.
+
+    uvicorn searchapp.web.asgi_app:app --workers 4
+"""
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qsl
+
+from searchapp.api.controller import InputController
+from searchapp.utils.aio import run_shutdown_hooks
+from searchapp.utils.telemetry import METRICS_CONTENT_TYPE, REGISTRY
+from searchapp.web.sse import format_sse
+
+logger = logging.getLogger(__name__)
+
+# Form posts and JSON bodies are small, anything bigger is rejected
+MAX_BODY_BYTES = 64 * 1024
+
+
+async def read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ConnectionError("Client disconnected")
+        body += message.get("body", b"")
+        if len(body) > MAX_BODY_BYTES:
+            raise ValueError("Request body too large")
+        if not message.get("more_body"):
+            return body
+
+
+async def read_question(scope, receive) -> str:
+    # Like request.values in Flask: query string first, then a form or JSON body
+    values = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+    if scope["method"] == "POST":
+        body = await read_body(receive)
+        headers = dict(scope.get("headers", []))
+        if headers.get(b"content-type", b"").startswith(b"application/json"):
+            values.update(json.loads(body or b"{}"))
+        else:
+            values.update(parse_qsl(body.decode("utf-8")))
+    return str(values.get("question", "")).strip()
+
+
+async def send_json(send, payload, status=200):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json")],
+    })
+    await send({"type": "http.response.body", "body": json.dumps(payload).encode("utf-8")})
+
+
+async def send_metrics(send):
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", METRICS_CONTENT_TYPE.encode("ascii"))],
+    })
+    await send({"type": "http.response.body", "body": REGISTRY.render().encode("utf-8")})
+
+
+async def ask(question, receive, send):
+    controller = InputController()
+    final_answer = await controller.runAsync(question)
+    await send_json(send, {"answer": final_answer, "sources": controller.sources})
+
+
+async def ask_stream(question, receive, send):
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ],
+    })
+
+    async def events():
+        async for event in InputController().stream(question):
+            await send({
+                "type": "http.response.body",
+                "body": format_sse(event["event"], event["data"]).encode("utf-8"),
+                "more_body": True,
+            })
+
+    async def disconnected():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    # Stop the pipeline as soon as the client goes away
+    streaming = asyncio.ensure_future(events())
+    watcher = asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait([streaming, watcher], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        streaming.cancel()
+        watcher.cancel()
+
+    if streaming.done() and not streaming.cancelled():
+        streaming.result()
+        await send({"type": "http.response.body", "body": b""})
+
+
+ROUTES = {
+    ("POST", "/ask"): ask,
+    ("GET", "/ask/stream"): ask_stream,
+    ("POST", "/ask/stream"): ask_stream,
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            # Close the pooled sessions on the loop they were opened on
+            await run_shutdown_hooks()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    if (scope["method"], scope["path"]) == ("GET", "/metrics"):
+        await send_metrics(send)
+        return
+
+    handler = ROUTES.get((scope["method"], scope["path"]))
+    if handler is None:
+        await send_json(send, {"error": "not found"}, status=404)
+        return
+
+    try:
+        question = await read_question(scope, receive)
+    except ConnectionError:
+        return
+    except ValueError as e:
+        logger.error(f"Bad request to {scope['path']}: {e}")
+        await send_json(send, {"error": str(e)}, status=400)
+        return
+
+    if not question:
+        await send_json(send, {"error": "question is required"}, status=400)
+        return
+    await handler(question, receive, send)
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("The ASGI server needs uvicorn: pip install 'searchapp[asgi]'")
+    uvicorn.run("searchapp.web.asgi_app:app", host='0.0.0.0', port=4545)
@@ -1,4 +1,4 @@
-from dash import Dash, dcc, html, callback, Input, Output, State
+from dash import Dash, dcc, html, callback, ctx, no_update, Input, Output, State
 import dash_bootstrap_components as dbc
 from searchapp.core.inference.inference import Inference
 from searchapp.core.search.web import WebSearch
@@ -105,6 +105,9 @@ app.layout = dbc.Container(
                 ),
             )
         ),
+        # The question runs as a background job, the page polls it instead of holding a server worker
+        dcc.Store(id="job-id"),
+        dcc.Interval(id="job-poll", interval=1000, disabled=True),
     ],
     fluid=True,  # Makes the container responsive
     style={
@@ -136,35 +139,58 @@ def update_search_opacity(search_formatted):
 
 @callback(
     Output("search-formatted", "children"),
+    Output("job-id", "data"),
+    Output("job-poll", "disabled"),
     Input("search-button", "n_clicks"),
+    Input("job-poll", "n_intervals"),
     State("search-input", "value"),
+    State("job-id", "data"),
     prevent_initial_call=True,
 )
-def update_search_formatted(n_clicks, search_input):
-    if n_clicks and search_input.strip():
-        # Initialize the InputController and run the search
-        controller = InputController()
-        try:
-            search_results = controller.run(search_input)
+def update_search_formatted(n_clicks, n_intervals, search_input, job_id):
+    controller = InputController()
 
-            # Check if search_results is a string
-            if isinstance(search_results, str):
-                # Format the output with markdown syntax
-                markdown_content = f"\n{search_results}\n"
-            else:
-                # Handle unexpected types
-                markdown_content = "Unexpected result format."
+    if ctx.triggered_id == "search-button":
+        if n_clicks and search_input.strip():
+            try:
+                # Submit and return straight away, the interval below picks up the answer
+                job = controller.submitJob(search_input)
+            except Exception as e:
+                return f"An error occurred during the search: {str(e)}", None, True
+            return "Searching...", job["id"], False
+        elif n_clicks:
+            return "Please enter a valid search query.", None, True
+        return "No search performed yet.", None, True
 
-        except Exception as e:
-            # Handle exceptions and provide user feedback
-            markdown_content = f"An error occurred during the search: {str(e)}"
+    if not job_id:
+        return no_update, no_update, True
 
-        return markdown_content, ""
+    try:
+        job = controller.jobStatus(job_id)
+    except Exception as e:
+        return f"An error occurred during the search: {str(e)}", None, True
 
-    elif n_clicks:
-        return "Please enter a valid search query."
+    if job is None:
+        return "The search expired, please try again.", None, True
 
-    return "No search performed yet."
+    if job["status"] == "done":
+        # Check if the result is a string
+        if isinstance(job["result"], str):
+            # Format the output with markdown syntax
+            markdown_content = f"\n{job['result']}\n"
+        else:
+            # Handle unexpected types
+            markdown_content = "Unexpected result format."
+        return markdown_content, None, True
+
+    if job["status"] in ("failed", "cancelled"):
+        return f"An error occurred during the search: {job['error'] or job['status']}", None, True
+
+    # Still running, show how far the pipeline got
+    progress = [event["data"] for event in job["events"] if event["event"] == "page_summarized"]
+    if progress:
+        return f"Reading pages... {progress[-1]['completed']}/{progress[-1]['total']}", no_update, False
+    return "Searching...", no_update, False
 
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0")
\ No newline at end of file
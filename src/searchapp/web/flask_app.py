@@ -1,7 +1,8 @@
-from flask import Flask, render_template, request, jsonify
-import asyncio
-from searchapp.core.inference.inference import Inference
-from searchapp.core.search.web import WebSearch
+from flask import Flask, Response, render_template, request, jsonify
+from searchapp.api.controller import InputController
+from searchapp.utils.aio import iterate_sync, run_sync
+from searchapp.utils.telemetry import METRICS_CONTENT_TYPE, REGISTRY
+from searchapp.web.sse import format_sse
 
 app = Flask(__name__)
 
@@ -15,31 +16,88 @@ def home():
 def ask():
     question = request.form['question']
     
-    # Asynchronously process the question using your existing classes
-    final_answer = asyncio.run(handle_question(question))
+    # Run the pipeline on the worker's long-lived loop so pooled connections are reused
+    final_answer, sources = run_sync(handle_question(question))
 
-    return jsonify({'answer': final_answer})
+    return jsonify({'answer': final_answer, 'sources': sources})
 
-# Define the async function that runs the logic in your script
-async def handle_question(question):
-    web_search = WebSearch()
-    inference = Inference()
-    inference.base_url = "https://api.openai.com/v1/chat/completions"
-    inference.setQuestion(question)
+# Route to stream the answer as Server-Sent Events
+@app.route('/ask/stream', methods=['GET', 'POST'])
+def ask_stream():
+    question = request.values.get('question', '').strip()
+    if not question:
+        return jsonify({'error': 'question is required'}), 400
 
-    # Conduct web search based on the question
-    web_search.searchAPI(inference.formattedQuestion)
+    def events():
+        controller = InputController()
+        for event in iterate_sync(controller.stream(question)):
+            yield format_sse(event['event'], event['data'])
 
-    # Set pages from the search results
-    inference.pagesInMD = web_search.pagesContentsMD
+    return Response(
+        events(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
 
-    # Process the page responses asynchronously
-    await inference.populatePageResponsesAsync()
+# Routes to run questions as background jobs, the request returns as soon as the job is queued
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    question = request.values.get('question', '').strip()
+    if not question:
+        return jsonify({'error': 'question is required'}), 400
 
-    # Get the final answer after combining responses
-    final_answer = inference.finalAnswer()
-    
-    return final_answer.json()["choices"][0]["message"]["content"]
+    job = InputController().submitJob(question)
+    return jsonify({'id': job['id'], 'status': job['status']}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = InputController().jobStatus(job_id)
+    if job is None:
+        return jsonify({'error': 'job not found'}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = InputController().jobStatus(job_id)
+    if job is None:
+        return jsonify({'error': 'job not found'}), 404
+    if job['status'] == 'done':
+        return jsonify({'answer': job['result'], 'cached': job['cached'], 'sources': job.get('sources', [])})
+    if job['status'] in ('queued', 'running'):
+        return jsonify({'status': job['status']}), 202
+    return jsonify({'status': job['status'], 'error': job['error']}), 409
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    return jsonify({'cancelled': InputController().cancelJob(job_id)})
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    controller = InputController()
+    if controller.jobStatus(job_id) is None:
+        return jsonify({'error': 'job not found'}), 404
+
+    def events():
+        for event in iterate_sync(controller.subscribeJob(job_id)):
+            yield format_sse(event['event'], event['data'])
+
+    return Response(
+        events(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+# Prometheus scrape endpoint for stage latency, cache and upstream error metrics
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), mimetype=METRICS_CONTENT_TYPE)
+
+# Define the async function that runs the logic in your script
+async def handle_question(question):
+    controller = InputController()
+    # Cached answers are served from Redis and concurrent askers share one pipeline run
+    final_answer = await controller.runAsync(question)
+    return final_answer, controller.sources
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=4545)
\ No newline at end of file
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from searchapp.core.inference.client import LLMClient
+from searchapp.utils.resilience import ResiliencePolicy
+from searchapp.utils.aio import SharedSession, get_loop, run_sync
+
+
+class TestRunSync(unittest.TestCase):
+    def test_run_sync_reuses_loop(self):
+        async def current_loop():
+            return asyncio.get_running_loop()
+
+        first = run_sync(current_loop())
+        second = run_sync(current_loop())
+        self.assertIs(first, second)
+        self.assertIs(first, get_loop())
+
+
+class TestSharedSession(unittest.IsolatedAsyncioTestCase):
+    async def test_session_reused_on_same_loop(self):
+        shared = SharedSession()
+        try:
+            self.assertIs(shared.session, shared.session)
+        finally:
+            await shared.close()
+
+
+class TestLLMClient(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.peers = set()
+
+        async def chat(request):
+            self.peers.add(request.transport.get_extra_info("peername"))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.05)
+            self.in_flight -= 1
+            return web.json_response({"choices": [{"message": {"content": "ok"}}]})
+
+        async def chat_stream(request):
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            for token in ["Hel", "lo"]:
+                chunk = {"choices": [{"delta": {"content": token}}]}
+                await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await response.write(b"data: [DONE]\n\n")
+            return response
+
+        self.unavailable = 0
+
+        async def flaky(request):
+            if self.unavailable:
+                self.unavailable -= 1
+                return web.json_response({"error": {"message": "overloaded"}}, status=503)
+            if request.query.get("stream"):
+                return await chat_stream(request)
+            return await chat(request)
+
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", chat)
+        app.router.add_post("/v1/stream", chat_stream)
+        app.router.add_post("/v1/flaky", flaky)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.url = str(self.server.make_url("/v1/chat/completions"))
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    async def test_concurrency_limit_and_keepalive(self):
+        client = LLMClient(max_concurrency=2, pool_size=2)
+        try:
+            results = await asyncio.gather(
+                *[client.postJson(self.url, headers={}, payload={}) for _ in range(6)]
+            )
+        finally:
+            await client.close()
+
+        self.assertTrue(all(status == 200 for status, _ in results))
+        self.assertLessEqual(self.max_in_flight, 2)
+        # Six requests over a pool of two keep-alive connections
+        self.assertLessEqual(len(self.peers), 2)
+
+    async def test_streamJson(self):
+        client = LLMClient()
+        try:
+            chunks = [
+                chunk async for chunk in client.streamJson(
+                    str(self.server.make_url("/v1/stream")), headers={}, payload={}
+                )
+            ]
+        finally:
+            await client.close()
+
+        tokens = [chunk["choices"][0]["delta"]["content"] for chunk in chunks]
+        self.assertEqual(tokens, ["Hel", "lo"])
+
+    async def test_retries_unavailable_endpoint(self):
+        client = LLMClient()
+        client.policy = ResiliencePolicy("llm-test", backoff_base=0.01)
+        self.unavailable = 2
+        try:
+            status, body = await client.postJson(str(self.server.make_url("/v1/flaky")), headers={}, payload={})
+        finally:
+            await client.close()
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body["choices"][0]["message"]["content"], "ok")
+
+    async def test_stream_retried_before_first_chunk(self):
+        client = LLMClient()
+        client.policy = ResiliencePolicy("llm-test", backoff_base=0.01)
+        self.unavailable = 1
+        try:
+            chunks = [
+                chunk async for chunk in client.streamJson(
+                    str(self.server.make_url("/v1/flaky?stream=1")), headers={}, payload={}
+                )
+            ]
+        finally:
+            await client.close()
+
+        self.assertEqual(len(chunks), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
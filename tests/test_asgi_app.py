@@ -0,0 +1,84 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from searchapp.web.asgi_app import app
+
+
+async def call(method, path, query=b"", body=b"", content_type=b"application/x-www-form-urlencoded"):
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query,
+        "headers": [(b"content-type", content_type)],
+    }
+    requests = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        if requests:
+            return requests.pop(0)
+        # Keep the connection open until the response is finished
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    status = sent[0]["status"]
+    body = b"".join(message.get("body", b"") for message in sent[1:])
+    return status, body
+
+
+
+class TestAsgiApp(unittest.IsolatedAsyncioTestCase):
+    async def test_metrics(self):
+        status, body = await call("GET", "/metrics")
+
+        self.assertEqual(status, 200)
+        self.assertIn(b"# TYPE searchapp_upstream_errors_total counter", body)
+
+    @patch('searchapp.web.asgi_app.InputController')
+    async def test_ask_awaits_controller(self, mock_controller):
+        mock_controller.return_value.runAsync = AsyncMock(return_value="Python is a language")
+        mock_controller.return_value.sources = ["https://www.python.org/"]
+
+        status, body = await call("POST", "/ask", body=b"question=what+is+python")
+
+        self.assertEqual(status, 200)
+        self.assertEqual(
+            json.loads(body), {"answer": "Python is a language", "sources": ["https://www.python.org/"]}
+        )
+        mock_controller.return_value.runAsync.assert_awaited_once_with("what is python")
+
+    @patch('searchapp.web.asgi_app.InputController')
+    async def test_ask_stream_sends_events(self, mock_controller):
+        async def fake_stream(question):
+            yield {"event": "formatted_query", "data": {"query": question}}
+            yield {"event": "token", "data": {"text": "Hello"}}
+            yield {"event": "done", "data": {"cached": False}}
+
+        mock_controller.return_value.stream = fake_stream
+
+        status, body = await call(
+            "POST", "/ask/stream", body=b'{"question": "what is python"}', content_type=b"application/json"
+        )
+
+        self.assertEqual(status, 200)
+        messages = [m for m in body.decode("utf-8").split("\n\n") if m]
+        events = [m.split("\n")[0] for m in messages]
+        self.assertEqual(events, ["event: formatted_query", "event: token", "event: done"])
+
+    async def test_requires_question(self):
+        status, _ = await call("GET", "/ask/stream")
+        self.assertEqual(status, 400)
+
+    async def test_unknown_route(self):
+        status, _ = await call("GET", "/missing")
+        self.assertEqual(status, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
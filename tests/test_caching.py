@@ -1,16 +1,18 @@
 import unittest
-from unittest.mock import Mock, patch
-from searchapp.utils.caching import RedisHelper
+from unittest.mock import patch
+from searchapp.utils.caching import LocalCache, RedisHelper
 
 class TestRedisHelper(unittest.TestCase):
     def setUp(self):
+        # Patch the client class before RedisHelper creates its connection
+        patcher = patch('searchapp.utils.caching.redis.StrictRedis')
+        self.mock_redis = patcher.start()
+        self.addCleanup(patcher.stop)
         self.redis_helper = RedisHelper()
 
-    @patch('searchapp.utils.caching.redis.StrictRedis')
-    def test_store_and_lookup(self, mock_redis):
+    def test_store_and_lookup(self):
         # Mock Redis client
-        mock_client = Mock()
-        mock_redis.return_value = mock_client
+        mock_client = self.mock_redis.return_value
 
         # Test store
         self.redis_helper.store("test_key", "test_value")
@@ -22,11 +24,9 @@ class TestRedisHelper(unittest.TestCase):
         self.assertEqual(result, "test_value")
         mock_client.get.assert_called_once_with("test_key")
 
-    @patch('searchapp.utils.caching.redis.StrictRedis')
-    def test_exists(self, mock_redis):
+    def test_exists(self):
         # Mock Redis client
-        mock_client = Mock()
-        mock_redis.return_value = mock_client
+        mock_client = self.mock_redis.return_value
 
         # Test exists
         mock_client.exists.return_value = True
@@ -34,5 +34,52 @@ class TestRedisHelper(unittest.TestCase):
         self.assertTrue(result)
         mock_client.exists.assert_called_once_with("test_key")
 
+    def test_store_with_ttl(self):
+        mock_client = self.mock_redis.return_value
+
+        helper = RedisHelper(default_ttl=60)
+        helper.store("test_key", "test_value")
+        mock_client.set.assert_called_once_with("test_key", "test_value", ex=60)
+
+    def test_local_tier_in_front_of_redis(self):
+        mock_client = self.mock_redis.return_value
+        mock_client.get.return_value = "test_value"
+
+        helper = RedisHelper(local_cache=LocalCache(maxsize=10, ttl=60))
+        self.assertEqual(helper.lookup("test_key"), "test_value")
+        self.assertEqual(helper.lookup("test_key"), "test_value")
+        mock_client.get.assert_called_once_with("test_key")
+
+        helper.delete("test_key")
+        mock_client.get.return_value = None
+        self.assertIsNone(helper.lookup("test_key"))
+
+class TestLocalCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = LocalCache(maxsize=2, ttl=None)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    @patch('searchapp.utils.caching.time.monotonic')
+    def test_ttl_expiry(self, mock_monotonic):
+        mock_monotonic.return_value = 100.0
+        cache = LocalCache(maxsize=10, ttl=30)
+        cache.set("a", 1)
+        cache.set("b", 2, ttl=5)
+
+        mock_monotonic.return_value = 110.0
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+
+        mock_monotonic.return_value = 131.0
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["expirations"], 2)
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+
+from searchapp.core.inference.chunking import extractPassages, selectChunks, splitChunks, splitSentences
+from searchapp.utils.ranking import BM25, estimateTokens, termCoverage, topK
+
+
+class TestBM25(unittest.TestCase):
+    def test_matching_document_scores_highest(self):
+        documents = [
+            "The weather in Paris is mild in spring.",
+            "Python is a programming language created by Guido van Rossum.",
+            "Bananas are rich in potassium.",
+        ]
+        scores = BM25(documents).scores("who created the Python language")
+        self.assertEqual(topK(scores, 1), [1])
+        self.assertEqual(scores[2], 0)
+
+    def test_no_overlap(self):
+        scores = BM25(["alpha beta", "gamma"]).scores("delta")
+        self.assertEqual(scores.tolist(), [0, 0])
+
+    def test_termCoverage(self):
+        self.assertEqual(termCoverage("python language creator", "Python is a language"), 2 / 3)
+        self.assertEqual(termCoverage("the", "anything"), 1.0)
+
+
+class TestChunking(unittest.TestCase):
+    def setUp(self):
+        filler = " ".join(["Unrelated filler text about gardening and tomatoes."] * 20)
+        self.page = "source: http://example.com \n" + "\n\n".join(
+            [filler, "Python was created by Guido van Rossum and first released in 1991.", filler, filler]
+        )
+
+    def test_splitChunks_respects_size(self):
+        chunks = splitChunks(self.page, maxTokens=100)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(estimateTokens(chunk) <= 100 for chunk in chunks))
+
+    def test_small_page_unchanged(self):
+        page = "source: http://example.com \nShort page."
+        self.assertEqual(selectChunks("question", page, tokenBudget=100), page)
+
+    def test_selects_relevant_chunk_within_budget(self):
+        selected = selectChunks(
+            "When was Python first released?", self.page, tokenBudget=120, topKChunks=2, chunkTokens=60
+        )
+        self.assertTrue(selected.startswith("source: http://example.com \n"))
+        self.assertIn("first released in 1991", selected)
+        self.assertLessEqual(estimateTokens(selected), 130)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestExtractPassages(unittest.TestCase):
+    page = (
+        "source: http://example.com/python\n"
+        "# Python history\n\n"
+        "Python was created by Guido van Rossum in the late eighties. "
+        "It is named after a comedy group. The weather that year was mild in the Netherlands.\n\n"
+        "- Version 1.0 was released in January 1994 after years of work.\n"
+        "Bananas are rich in potassium and easy to carry around."
+    )
+
+    def test_splitSentences(self):
+        sentences = splitSentences("# Title\n\nFirst one. Second one!\n- item here")
+        self.assertEqual(sentences, ["Title", "First one.", "Second one!", "item here"])
+
+    def test_keeps_matching_sentences_with_source(self):
+        passages = extractPassages("who created Python", self.page, topKSentences=1)
+        self.assertEqual(passages, "source: http://example.com/python\nPython was created by Guido van Rossum in the late eighties.")
+
+    def test_gaps_marked_in_page_order(self):
+        passages = extractPassages("when was Python created and version 1.0 released", self.page, topKSentences=2)
+        body = passages.partition("\n")[2]
+        self.assertTrue(body.startswith("Python was created"))
+        self.assertIn("[...] Version 1.0", body)
+        self.assertNotIn("Bananas", body)
+
+    def test_no_match(self):
+        self.assertIsNone(extractPassages("quantum chromodynamics", self.page))
+        self.assertIsNone(extractPassages("anything", ""))
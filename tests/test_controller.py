@@ -0,0 +1,64 @@
+import asyncio
+import os
+import unittest
+from unittest.mock import patch
+
+from searchapp.api.controller import InputController
+
+class TestRunBatch(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patcher = patch('searchapp.api.controller.getSingleFlight', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.controller = InputController()
+
+    async def test_deduplicates_and_streams_results(self):
+        answered = []
+
+        def memoization(controller):
+            return "cached answer" if controller.question == "cached question" else None
+
+        async def coalescedMain(controller, question):
+            answered.append(question)
+            # The slow question finishes last even though it was asked first
+            await asyncio.sleep(0.05 if question == "slow question" else 0)
+            return f"answer to {question}"
+
+        with patch.object(InputController, 'memoization', memoization), \
+                patch.object(InputController, 'coalescedMain', coalescedMain):
+            results = [
+                result
+                async for result in self.controller.runBatch(
+                    ["slow question", "cached question", "fast question", "Fast question?", ""]
+                )
+            ]
+
+        self.assertEqual(sorted(answered), ["fast question", "slow question"])
+        self.assertEqual([result["index"] for result in results], [1, 2, 3, 0])
+        self.assertTrue(results[0]["cached"])
+        self.assertEqual(results[2]["answer"], "answer to fast question")
+        self.assertEqual(results[3]["answer"], "answer to slow question")
+
+    async def test_failed_question_yields_none(self):
+        async def coalescedMain(controller, question):
+            raise RuntimeError("upstream down")
+
+        with patch.object(InputController, 'memoization', lambda controller: None), \
+                patch.object(InputController, 'coalescedMain', coalescedMain):
+            results = [result async for result in self.controller.runBatch(["a question"])]
+
+        self.assertEqual(results, [{"index": 0, "question": "a question", "answer": None, "cached": False}])
+
+class TestNearDuplicateIndex(unittest.TestCase):
+    @patch.dict(os.environ, {"CACHE_NEAR_DUPLICATES": "1"})
+    @patch('searchapp.api.controller.getSingleFlight', return_value=None)
+    def test_index_does_not_share_the_answers_cache(self, _):
+        controller = InputController()
+        index = controller.nearDuplicates.redis
+
+        self.assertIsNot(index, controller.redis)
+        self.assertIsNone(index.name)
+        self.assertIsNone(index.local_cache)
+
+if __name__ == '__main__':
+    unittest.main()
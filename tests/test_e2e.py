@@ -0,0 +1,128 @@
+import asyncio
+import os
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+
+import aiohttp
+
+from searchapp.api.controller import InputController
+from searchapp.core.inference.client import LLMClient
+from searchapp.devtools.fakes import (
+    FailureInjector,
+    FakeOpenAI,
+    FakeUpstreams,
+    FakeWeb,
+    LatencyModel,
+)
+
+# Every cache off so each run goes through all the fakes
+NO_CACHES = {
+    "BING_CACHE_TTL": "0",
+    "QUERY_CACHE_TTL": "0",
+    "PAGE_CACHE": "0",
+    "SUMMARY_CACHE": "0",
+    "BING_QPS": "100",
+}
+
+class TestPipelineAgainstFakes(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.fakes = FakeUpstreams(sites=2)
+        await self.fakes.startAsync()
+        patcher = patch.dict(os.environ, dict(NO_CACHES, **self.fakes.environ()))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await self.fakes.stopAsync()
+
+    async def test_main_answers_from_fakes(self):
+        answer = await InputController().main("What is Python?")
+
+        self.assertTrue(answer)
+        # One query format, five page summaries and the final answer
+        self.assertEqual(self.fakes.openai.endpoint.requests, 7)
+        self.assertGreaterEqual(self.fakes.bing.endpoint.requests, 1)
+        self.assertEqual(self.fakes.corpus.endpoint.requests, 5)
+
+    async def test_fast_mode_makes_two_chat_calls(self):
+        with patch.dict(os.environ, {"FAST_MODE": "1"}):
+            controller = InputController()
+            answer = await controller.main("What is Python?")
+
+        self.assertTrue(answer)
+        # The query format and the final answer, pages are condensed locally
+        self.assertEqual(self.fakes.openai.endpoint.requests, 2)
+        self.assertTrue(controller.sources)
+
+    async def test_stream_emits_tokens(self):
+        events = [event async for event in InputController().pipeline("What is Python?", streamAnswer=True)]
+        names = [event["event"] for event in events]
+
+        self.assertEqual(names[:2], ["formatted_query", "search_done"])
+        self.assertEqual(names.count("page_summarized"), 5)
+        self.assertGreater(names.count("token"), 1)
+
+    async def test_cut_off_stream_is_not_stored_or_shared(self):
+        original = LLMClient.streamJson
+
+        async def dropping(client, *args, **kwargs):
+            chunks = 0
+            async for chunk in original(client, *args, **kwargs):
+                yield chunk
+                chunks += 1
+                if chunks == 3:
+                    raise aiohttp.ClientConnectionError("Connection reset by peer")
+
+        controller = InputController()
+        controller.memoization = Mock(return_value=None)
+        controller.storeResult = Mock()
+        flight = Mock(result=None, finish=AsyncMock())
+        controller.joinFlight = AsyncMock(return_value=flight)
+        with patch.object(LLMClient, "streamJson", dropping):
+            events = [event async for event in controller.stream("What is Python?")]
+
+        names = [event["event"] for event in events]
+        self.assertGreater(names.count("token"), 0)
+        self.assertEqual(names[-1], "error")
+        self.assertNotIn("done", names)
+        self.assertNotIn("sources", names)
+        controller.storeResult.assert_not_called()
+        flight.finish.assert_awaited_once_with(None)
+
+    async def test_answer_survives_failing_pages(self):
+        self.fakes.corpus.endpoint.failures = FailureInjector(error_rate=0.5, seed=3)
+        answer = await InputController().main("What is Python?")
+        self.assertTrue(answer)
+
+    async def test_deadline_answers_without_slow_pages(self):
+        self.fakes.corpus.endpoint.failures = FailureInjector(timeout_rate=0.5, hang=2, seed=1)
+        controller = InputController()
+
+        start = asyncio.get_running_loop().time()
+        events = [event async for event in controller.pipeline("What is Python?", deadline=1.0)]
+        elapsed = asyncio.get_running_loop().time() - start
+
+        names = [event["event"] for event in events]
+        sources = events[-1]["data"]["sources"]
+        self.assertLess(elapsed, 1.5)
+        self.assertEqual(names[-2:], ["answer", "sources"])
+        self.assertTrue(events[-2]["data"]["answer"])
+        self.assertLess(names.count("page_summarized"), 5)
+        self.assertTrue(sources)
+        self.assertTrue(all("/page/" in source for source in sources))
+
+class TestFakes(unittest.TestCase):
+    def test_latency_distributions(self):
+        self.assertEqual(LatencyModel(100, 0, "fixed").sample(), 0.1)
+        samples = [LatencyModel(100, 20, "uniform", seed=1).sample() for _ in range(50)]
+        self.assertTrue(all(0.08 <= sample <= 0.12 for sample in samples))
+        self.assertEqual(LatencyModel(0).sample(), 0)
+
+    def test_replies_are_deterministic(self):
+        messages = [{"role": "user", "content": "question"}]
+        self.assertEqual(FakeOpenAI(seed=1).reply(messages), FakeOpenAI(seed=1).reply(messages))
+        self.assertNotEqual(FakeOpenAI(seed=1).reply(messages), FakeOpenAI(seed=2).reply(messages))
+        self.assertEqual(FakeWeb().html(3), FakeWeb().html(3))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+from searchapp.core.search.extract import MainContentExtractor, convert, getExtractor
+
+PAGE = """
+<html><head><script>var tracking = 1;</script><style>p { color: red; }</style></head>
+<body>
+    <nav><ul><li>Home</li><li>About</li></ul></nav>
+    <div id="cookie-banner">We use cookies. <button>Accept</button></div>
+    <div class="sidebar"><p>Sidebar promotion text</p></div>
+    <main>
+        <h1>What is Python?</h1>
+        <p>Python is a programming language that lets you work quickly and integrate systems more effectively.</p>
+        <ul><li>Easy to learn</li><li>Batteries included</li></ul>
+        <p>It is used for web development, data science, scripting and much more besides.</p>
+    </main>
+    <footer>Copyright 2024</footer>
+</body></html>
+"""
+
+
+class TestMainContentExtractor(unittest.TestCase):
+    def setUp(self):
+        self.extractor = MainContentExtractor()
+
+    def test_boilerplate_removed(self):
+        markdown = self.extractor.extract(PAGE)
+        for boilerplate in ["tracking", "cookies", "Sidebar", "Copyright", "About"]:
+            self.assertNotIn(boilerplate, markdown)
+
+    def test_main_content_rendered_as_markdown(self):
+        markdown = self.extractor.extract(PAGE)
+        self.assertTrue(markdown.startswith("# What is Python?"))
+        self.assertIn("- Easy to learn\n- Batteries included", markdown)
+        self.assertIn("data science", markdown)
+
+    def test_div_only_page_falls_back_to_text(self):
+        markdown = self.extractor.extract("<html><body><div>" + "plain text " * 30 + "</div></body></html>")
+        self.assertIn("plain text", markdown)
+
+    def test_smaller_than_html2text(self):
+        self.assertLess(len(convert(PAGE, "http://x", "main")), len(convert(PAGE, "http://x", "html2text")))
+
+
+class TestConvert(unittest.TestCase):
+    def test_source_header(self):
+        self.assertTrue(convert(PAGE, "http://example.com", "main").startswith("source: http://example.com \n"))
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            getExtractor("missing")
+
+    def test_runs_in_process_pool(self):
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            markdown = pool.submit(convert, PAGE, "http://x", "main").result()
+        self.assertIn("What is Python?", markdown)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from searchapp.core.search.fetcher import PageFetcher
+
+
+class TestPageFetcher(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.requests = []
+
+        async def latin1(request):
+            body = '<html><head><meta charset="iso-8859-1"></head><body>café</body></html>'
+            return web.Response(body=body.encode("latin-1"), headers={"Content-Type": "text/html"})
+
+        async def large(request):
+            return web.Response(body=b"a" * 500_000, content_type="text/html")
+
+        async def image(request):
+            self.requests.append(request.path)
+            return web.Response(body=b"\x89PNG", content_type="image/png")
+
+        app = web.Application()
+        app.router.add_get("/latin1", latin1)
+        app.router.add_get("/large", large)
+        app.router.add_get("/image", image)
+        app.router.add_get("/file.zip", image)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.fetcher = PageFetcher(max_bytes=100_000)
+
+    async def asyncTearDown(self):
+        await self.fetcher.close()
+        await self.server.close()
+
+    def url(self, path):
+        return str(self.server.make_url(path))
+
+    async def test_charset_from_meta_tag(self):
+        result = await self.fetcher.fetch(self.url("/latin1"))
+        self.assertIn("café", result.text)
+        self.assertEqual(result.encoding, "iso8859-1")
+
+    async def test_body_is_capped(self):
+        result = await self.fetcher.fetch(self.url("/large"))
+        self.assertTrue(result.truncated)
+        self.assertEqual(len(result.text), 100_000)
+
+    async def test_non_text_content_is_skipped(self):
+        self.assertIsNone(await self.fetcher.fetch(self.url("/image")))
+
+    async def test_binary_extension_skipped_without_request(self):
+        self.assertIsNone(await self.fetcher.fetch(self.url("/file.zip")))
+        self.assertEqual(self.requests, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import redis
+
+from searchapp.utils.telemetry import record_cache
+from searchapp.web.flask_app import app
+
+
+class TestFlaskApp(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+
+    @patch('searchapp.web.flask_app.InputController')
+    def test_ask_stream_sends_events(self, mock_controller):
+        async def fake_stream(question):
+            yield {"event": "formatted_query", "data": {"query": question}}
+            yield {"event": "token", "data": {"text": "Hello"}}
+            yield {"event": "done", "data": {"cached": False}}
+
+        mock_controller.return_value.stream = fake_stream
+
+        response = self.client.get('/ask/stream?question=what+is+python')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.mimetype.startswith('text/event-stream'))
+
+        messages = [m for m in response.get_data(as_text=True).split("\n\n") if m]
+        events = [m.split("\n")[0] for m in messages]
+        self.assertEqual(events, ["event: formatted_query", "event: token", "event: done"])
+        self.assertEqual(json.loads(messages[1].split("\n")[1][len("data: "):]), {"text": "Hello"})
+
+    @patch('searchapp.web.flask_app.InputController')
+    def test_ask_uses_cache_and_single_flight(self, mock_controller):
+        controller = mock_controller.return_value
+        controller.runAsync = AsyncMock(return_value="Python is a language")
+        controller.sources = ["http://example.com"]
+
+        response = self.client.post('/ask', data={'question': 'what is python'})
+
+        self.assertEqual(response.get_json(), {'answer': "Python is a language", 'sources': ["http://example.com"]})
+        controller.runAsync.assert_awaited_once_with('what is python')
+        controller.main.assert_not_called()
+
+    @patch('searchapp.api.controller.getSingleFlight', return_value=None)
+    def test_ask_answers_when_redis_is_down(self, _):
+        with patch('searchapp.api.controller.InputController.memoization', return_value=None), \
+                patch('searchapp.api.controller.InputController.main', new=AsyncMock(return_value="Python is a language")), \
+                patch('searchapp.api.controller.InputController.storeResult', side_effect=redis.ConnectionError("down")):
+            response = self.client.post('/ask', data={'question': 'what is python'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['answer'], "Python is a language")
+
+    def test_metrics(self):
+        record_cache("bing", "miss")
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.mimetype.startswith('text/plain'))
+        body = response.get_data(as_text=True)
+        self.assertIn('# TYPE searchapp_stage_seconds histogram', body)
+        self.assertIn('searchapp_cache_requests_total{cache="bing",result="miss"}', body)
+
+    def test_ask_stream_requires_question(self):
+        response = self.client.get('/ask/stream')
+        self.assertEqual(response.status_code, 400)
+
+    @patch('searchapp.web.flask_app.InputController')
+    def test_submit_job_returns_id(self, mock_controller):
+        mock_controller.return_value.submitJob.return_value = {"id": "abc", "status": "queued"}
+
+        response = self.client.post('/jobs', data={'question': 'what is python'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.get_json(), {"id": "abc", "status": "queued"})
+
+    @patch('searchapp.web.flask_app.InputController')
+    def test_job_result(self, mock_controller):
+        status = mock_controller.return_value.jobStatus
+        status.return_value = {"status": "running"}
+        self.assertEqual(self.client.get('/jobs/abc/result').status_code, 202)
+
+        status.return_value = {"status": "done", "result": "An answer", "cached": False}
+        response = self.client.get('/jobs/abc/result')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["answer"], "An answer")
+
+        status.return_value = None
+        self.assertEqual(self.client.get('/jobs/abc/result').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,11 @@
+import asyncio
 import unittest
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 from searchapp.core.inference.inference import Inference
+from searchapp.core.inference.summary_cache import SummaryCache
+from searchapp.core.inference.tokens import TokenBudget, TokenBudgetExceeded, countMessageTokens
+from searchapp.utils.caching import JSONCache, LocalCache
+from searchapp.utils.ranking import estimateTokens
 
 class TestInference(unittest.TestCase):
     def setUp(self):
@@ -34,5 +39,248 @@ class TestInference(unittest.TestCase):
         result = self.inference.finalAnswer()
         self.assertEqual(result.json()["choices"][0]["message"]["content"], "final answer")
 
+    @patch('searchapp.core.inference.inference.requests.post')
+    def test_postChat_records_usage(self, mock_post):
+        mock_post.return_value = Mock(status_code=200, **{"json.return_value": {
+            "choices": [{"message": {"content": "formatted question"}}],
+            "usage": {"prompt_tokens": 80, "completion_tokens": 5},
+        }})
+
+        self.inference.formatQuestion("How do I make a cake?")
+
+        self.assertEqual(self.inference.usage.stages["format_question"], {"calls": 1, "prompt": 80, "completion": 5})
+        self.assertEqual(self.inference.tokenBudget.spent, 85)
+        self.assertEqual(self.inference.tokenBudget.reserved, 0)
+
+    @patch('searchapp.core.inference.inference.requests.post')
+    def test_sync_calls_respect_the_budget(self, mock_post):
+        self.inference.tokenBudget = TokenBudget(10)
+        self.inference.pagesInMD = ["source: http://a.com\npage one"]
+
+        self.assertEqual(self.inference.formatQuestion("How do I make a cake?"), "How do I make a cake?")
+        self.inference.populatePageResponses()
+        with self.assertRaises(TokenBudgetExceeded):
+            self.inference.finalAnswer()
+
+        mock_post.assert_not_called()
+        self.assertEqual(self.inference.pageRelevantResponses, [])
+
+class TestInferenceAsync(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.inference = Inference()
+        self.inference.question = "test question"
+        self.inference.summaryCache = None
+        self.inference.queryCache = None
+
+    async def test_setQuestionAsync(self):
+        with patch.object(Inference, 'postChatAsync', new=AsyncMock(return_value=" formatted question\n")):
+            await self.inference.setQuestionAsync("How do I make a cake?")
+        self.assertEqual(self.inference.question, "How do I make a cake?")
+        self.assertEqual(self.inference.formattedQuestion, "formatted question")
+
+    async def test_formatted_query_cached(self):
+        self.inference.queryCache = JSONCache("query", local_cache=LocalCache(), redis_helper=Mock(**{"lookup.return_value": None}))
+        mock_post = AsyncMock(return_value="formatted question")
+        with patch.object(Inference, 'postChatAsync', new=mock_post):
+            first = await self.inference.formatQuestionAsync("How do I make a cake?")
+            second = await self.inference.formatQuestionAsync("how do I make a cake")
+
+        self.assertEqual(first, second)
+        self.assertEqual(mock_post.await_count, 1)
+
+    async def test_formatQuestionAsync_falls_back_to_question(self):
+        with patch.object(Inference, 'postChatAsync', new=AsyncMock(return_value=None)):
+            result = await self.inference.formatQuestionAsync("How do I make a cake?")
+        self.assertEqual(result, "How do I make a cake?")
+
+    async def test_populatePageResponsesAsync_skips_failures(self):
+        self.inference.pagesInMD = ["page1", "page2", "page3"]
+
+        async def summarize(prompt, **kwargs):
+            return None if "page2" in prompt else prompt.split("page content:")[1].strip().replace("page", "summary")
+
+        with patch.object(Inference, 'postChatAsync', new=AsyncMock(side_effect=summarize)):
+            await self.inference.populatePageResponsesAsync()
+        self.assertEqual(self.inference.pageRelevantResponses, ["summary1", "summary3"])
+
+    async def test_summary_cache_skips_unchanged_pages(self):
+        self.inference.summaryCache = SummaryCache(
+            cache=JSONCache("summary", local_cache=LocalCache(), redis_helper=Mock(**{"lookup.return_value": None}))
+        )
+        mock_post = AsyncMock(return_value="summary")
+        with patch.object(Inference, 'postChatAsync', new=mock_post):
+            await self.inference.relevantPageResponseAsync("page one")
+            await self.inference.relevantPageResponseAsync("page one")
+            self.inference.question = "  Test QUESTION? "
+            await self.inference.relevantPageResponseAsync("page one")
+            await self.inference.relevantPageResponseAsync("page two")
+
+        self.assertEqual(mock_post.await_count, 2)
+        self.assertEqual(self.inference.summaryCacheHits, 2)
+
+    async def test_postChatAsync_records_usage(self):
+        self.inference.client = Mock(postJson=AsyncMock(return_value=(200, {
+            "choices": [{"message": {"content": "answer"}}],
+            "usage": {"prompt_tokens": 120, "completion_tokens": 30},
+        })))
+
+        result = await self.inference.postChatAsync("prompt", purpose="final_answer")
+
+        self.assertEqual(result, "answer")
+        self.assertEqual(self.inference.usage.stages["final_answer"], {"calls": 1, "prompt": 120, "completion": 30})
+        self.assertEqual(self.inference.tokensUsedInput, 120)
+        self.assertEqual(self.inference.tokenBudget.spent, 150)
+        self.assertEqual(self.inference.tokenBudget.reserved, 0)
+
+    async def test_postChatAsync_skips_calls_over_budget(self):
+        self.inference.client = Mock(postJson=AsyncMock())
+        self.inference.tokenBudget = TokenBudget(10)
+
+        self.assertIsNone(await self.inference.postChatAsync("a long prompt " * 20))
+        self.inference.client.postJson.assert_not_awaited()
+
+    async def test_pages_skipped_when_budget_is_spent(self):
+        self.inference.tokenBudget = TokenBudget(6000)
+        self.inference.answerTokenReserve = 4000
+        self.inference.tokenBudget.spent = 1500
+        mock_post = AsyncMock(return_value="summary")
+
+        with patch.object(Inference, 'postChatAsync', new=mock_post):
+            self.assertIsNone(await self.inference.relevantPageResponseAsync("page one"))
+        mock_post.assert_not_awaited()
+
+    async def test_pages_trimmed_to_the_budget(self):
+        self.inference.tokenBudget = TokenBudget(6000)
+        self.inference.answerTokenReserve = 4000
+        prompts = []
+
+        async def summarize(prompt, **kwargs):
+            prompts.append(prompt)
+            return "summary"
+
+        page = "\n\n".join(f"Paragraph {i} " + "word " * 150 for i in range(40))
+        with patch.object(Inference, 'postChatAsync', new=AsyncMock(side_effect=summarize)):
+            await self.inference.relevantPageResponseAsync(page)
+
+        # 6000 - 4000 reserve - prompt and summary allowance leaves 1500 tokens of page at most
+        self.assertLess(estimateTokens(prompts[0]), 1500 + 200)
+        self.assertEqual(self.inference.tokenBudget.reserved, 0)
+
+    def test_final_answer_drops_summaries_over_budget(self):
+        self.inference.pageRelevantResponses = ["short summary"] + ["long summary " * 200] * 3
+        self.inference.tokenBudget = TokenBudget(1400)
+        self.inference.answerTokenReserve = 200
+
+        summaries = self.inference.summariesWithinBudget()
+
+        # About 650 tokens per long summary, only the first fits next to the prompt and the reply's reserve
+        self.assertEqual(summaries, self.inference.pageRelevantResponses[:2])
+
+    async def test_final_answer_capped_at_the_remaining_budget(self):
+        self.inference.pageRelevantResponses = ["summary"]
+        self.inference.tokenBudget = TokenBudget(5000)
+        self.inference.answerTokenReserve = 1000
+        self.inference.client = Mock(postJson=AsyncMock(return_value=(200, {
+            "choices": [{"message": {"content": "answer"}}],
+        })))
+
+        self.assertEqual(await self.inference.finalAnswerAsync(), "answer")
+
+        payload = self.inference.client.postJson.await_args.kwargs["payload"]
+        promptTokens = countMessageTokens(payload["messages"], payload["model"])
+        self.assertEqual(payload["max_tokens"], 5000 - promptTokens)
+
+    async def test_iterPageResponsesAsync_starts_before_slow_pages(self):
+        events = []
+
+        async def pages():
+            yield "fast page"
+            await asyncio.sleep(0.1)
+            events.append("slow page ready")
+            yield "slow page"
+
+        async def summarize(page):
+            events.append(f"summarized {page}")
+            return page.upper()
+
+        with patch.object(Inference, 'relevantPageResponseAsync', new=AsyncMock(side_effect=summarize)):
+            results = [item async for item in self.inference.iterPageResponsesAsync(pages())]
+
+        self.assertEqual(events[0], "summarized fast page")
+        self.assertEqual(sorted(results), [(0, "FAST PAGE"), (1, "SLOW PAGE")])
+        self.assertEqual(self.inference.pagesInMD, ["fast page", "slow page"])
+
+    async def test_summary_target_cancels_stragglers(self):
+        cancelled = []
+
+        async def summarize(page):
+            if page == "slow page":
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    cancelled.append(page)
+                    raise
+            return page.upper()
+
+        self.inference.pagesInMD = ["slow page", "page one", "page two"]
+        self.inference.summaryTarget = 2
+        with patch.object(Inference, 'relevantPageResponseAsync', new=AsyncMock(side_effect=summarize)):
+            results = [item async for item in self.inference.iterPageResponsesAsync()]
+            await asyncio.sleep(0)
+
+        self.assertEqual(sorted(results), [(1, "PAGE ONE"), (2, "PAGE TWO")])
+        self.assertEqual(cancelled, ["slow page"])
+
+    async def test_summary_deadline(self):
+        async def summarize(page):
+            await asyncio.sleep(10 if page == "slow page" else 0)
+            return page.upper()
+
+        self.inference.pagesInMD = ["slow page", "page one"]
+        self.inference.summaryDeadline = asyncio.get_running_loop().time() + 0.1
+        with patch.object(Inference, 'relevantPageResponseAsync', new=AsyncMock(side_effect=summarize)):
+            await asyncio.wait_for(self.inference.populatePageResponsesAsync(), 1)
+
+        self.assertEqual(self.inference.pageRelevantResponses, ["PAGE ONE"])
+
+    async def test_summaries_finished_before_the_deadline_are_kept(self):
+        self.inference.pagesInMD = ["page one", "page two", "page three"]
+        self.inference.summaryDeadline = asyncio.get_running_loop().time() + 0.05
+        results = []
+        with patch.object(Inference, 'relevantPageResponseAsync', new=AsyncMock(side_effect=str.upper)):
+            async for item in self.inference.iterPageResponsesAsync():
+                results.append(item)
+                # A slow consumer: the deadline passes while the other summaries wait in the queue
+                await asyncio.sleep(0.1)
+
+        self.assertEqual(sorted(summary for _, summary in results), ["PAGE ONE", "PAGE THREE", "PAGE TWO"])
+
+    async def test_fast_mode_skips_page_summaries(self):
+        self.inference.fastMode = True
+        self.inference.question = "who created Python"
+        self.inference.pagesInMD = [
+            "source: http://a.com\nPython was created by Guido van Rossum. Snakes are reptiles that shed skin.",
+            "source: http://b.com\nNothing about the subject is on this page at all.",
+        ]
+        mock_post = AsyncMock(return_value="final answer")
+        with patch.object(Inference, 'postChatAsync', new=mock_post):
+            await self.inference.populatePageResponsesAsync()
+            answer = await self.inference.finalAnswerAsync()
+
+        self.assertEqual(answer, "final answer")
+        # Only the final answer went to the model
+        self.assertEqual(mock_post.await_count, 1)
+        self.assertEqual(self.inference.pageRelevantResponses, ["source: http://a.com\nPython was created by Guido van Rossum."])
+        self.assertEqual(self.inference.sourcesUsed, ["http://a.com"])
+        self.assertIn("Guido van Rossum", mock_post.await_args.args[0])
+
+    def test_sources_follow_the_summaries_used(self):
+        self.inference.pagesInMD = ["source: https://a.example \nA", "no header", "source: https://c.example \nC"]
+        for index in range(3):
+            self.inference.addSummary(index, f"summary {index}")
+
+        self.inference.summariesWithinBudget()
+        self.assertEqual(self.inference.sourcesUsed, ["https://a.example", "https://c.example"])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
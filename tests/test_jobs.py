@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+
+from searchapp.api.jobs import CANCELLED, DONE, FAILED, JobManager
+from searchapp.utils.aio import iterate_sync
+from searchapp.utils.caching import JSONCache, LocalCache
+
+def wait_for(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for the job")
+        time.sleep(0.01)
+
+class TestJobManager(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.runs = []
+
+        async def runner(question):
+            self.runs.append(question)
+            yield {"event": "formatted_query", "data": {"query": question}}
+            while not self.release.is_set():
+                await asyncio.sleep(0.01)
+            yield {"event": "token", "data": {"text": "Hello "}}
+            yield {"event": "token", "data": {"text": "world"}}
+            yield {"event": "done", "data": {"cached": False}}
+
+        redis_helper = Mock(**{"lookup.return_value": None})
+        self.manager = JobManager(
+            runner,
+            max_workers=2,
+            store=JSONCache("job", local_cache=LocalCache(), redis_helper=redis_helper),
+            cancel_flags=JSONCache("jobcancel", redis_helper=redis_helper),
+        )
+
+    def tearDown(self):
+        # Let unfinished jobs end before the background loop is reused
+        self.release.set()
+        wait_for(lambda: all(job.finished for job in self.manager.jobs.values()))
+
+    def test_submit_returns_immediately_and_completes(self):
+        job = self.manager.submit("What is Python?")
+        self.assertFalse(job.finished)
+
+        self.release.set()
+        wait_for(lambda: self.manager.get(job.id)["status"] == DONE)
+
+        state = self.manager.get(job.id)
+        self.assertEqual(state["result"], "Hello world")
+        self.assertEqual([event["event"] for event in state["events"]], ["formatted_query", "done"])
+
+    def test_duplicate_questions_share_a_job(self):
+        first = self.manager.submit("What is Python?")
+        second = self.manager.submit("what is python")
+        self.assertEqual(first.id, second.id)
+
+        self.release.set()
+        wait_for(lambda: first.finished)
+        self.assertEqual(self.runs, ["What is Python?"])
+
+        # A finished question can be asked again
+        third = self.manager.submit("what is python")
+        self.assertNotEqual(third.id, first.id)
+        wait_for(lambda: third.finished)
+
+    def test_cancel_running_job(self):
+        job = self.manager.submit("What is Python?")
+        wait_for(lambda: job.status == "running")
+
+        self.assertTrue(self.manager.cancel(job.id))
+        wait_for(lambda: job.finished)
+        self.assertEqual(job.status, CANCELLED)
+        self.assertFalse(self.manager.cancel(job.id))
+
+    def test_failed_runner_marks_job_failed(self):
+        async def broken(question):
+            raise RuntimeError("upstream down")
+            yield
+
+        self.manager.runner = broken
+        job = self.manager.submit("What is Python?")
+        wait_for(lambda: job.finished)
+
+        self.assertEqual(job.status, FAILED)
+        self.assertEqual(job.error, "upstream down")
+
+    def test_subscribe_streams_events_until_finished(self):
+        job = self.manager.submit("What is Python?")
+        self.release.set()
+
+        events = list(iterate_sync(self.manager.subscribe(job.id), timeout=2))
+        self.assertEqual([event["event"] for event in events], ["formatted_query", "done", "job"])
+        self.assertEqual(events[-1]["data"]["result"], "Hello world")
+
+    def test_unknown_job(self):
+        self.assertIsNone(self.manager.get("missing"))
+        self.assertFalse(self.manager.cancel("missing"))
+
+if __name__ == '__main__':
+    unittest.main()
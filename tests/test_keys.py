@@ -0,0 +1,82 @@
+import unittest
+
+from searchapp.utils.keys import MinHasher, NearDuplicateIndex, normalize_question, question_key
+
+
+class FakeRedisHelper:
+    def __init__(self):
+        self.values = {}
+        self.sets = {}
+
+    def store(self, key, value, ttl=None):
+        self.values[key] = value
+
+    def lookup(self, key):
+        return self.values.get(key)
+
+    def add_to_sets(self, keys, member, ttl=None):
+        for key in keys:
+            self.sets.setdefault(key, set()).add(member)
+
+    def union_sets(self, keys):
+        return set().union(*(self.sets.get(key, set()) for key in keys))
+
+
+class TestQuestionKeys(unittest.TestCase):
+    def test_variants_share_a_key(self):
+        variants = ["What is Python?", "what is python", "What is python ?", "  WHAT   is\tPython!! ", "Ｗhat is Python？"]
+        self.assertEqual(len({question_key(v) for v in variants}), 1)
+        self.assertEqual(normalize_question(variants[0]), "what is python")
+
+    def test_different_questions_differ(self):
+        self.assertNotEqual(question_key("What is Python 2?"), question_key("What is Python 3?"))
+
+    def test_symbols_keep_questions_apart(self):
+        pairs = [
+            ("What is C++?", "what is c"),
+            ("What is C#?", "what is c"),
+            ("What is C++?", "What is C#?"),
+            ("Is 3.14 > 3?", "is 3 14 3"),
+            ("$100 in EUR", "100 in eur"),
+            ("-5 squared", "5 squared"),
+        ]
+        for first, second in pairs:
+            self.assertNotEqual(question_key(first), question_key(second), (first, second))
+        self.assertEqual(normalize_question("What is C++?"), "what is c++")
+        self.assertEqual(normalize_question("Is 3.14 > 3?"), "is 3.14 > 3")
+        self.assertEqual(normalize_question('"Hello, world!"'), "hello world")
+
+    def test_namespace(self):
+        self.assertTrue(question_key("q", namespace="query").startswith("query:"))
+
+
+class TestNearDuplicates(unittest.TestCase):
+    def setUp(self):
+        self.redis = FakeRedisHelper()
+        self.index = NearDuplicateIndex(self.redis, threshold=0.6)
+
+    def test_similarity(self):
+        hasher = MinHasher()
+        same = hasher.similarity(hasher.signature("what is python"), hasher.signature("What is Python?"))
+        different = hasher.similarity(hasher.signature("what is python"), hasher.signature("best pizza in rome"))
+        self.assertEqual(same, 1.0)
+        self.assertLess(different, 0.2)
+
+    def test_paraphrase_found(self):
+        self.index.add("what is the python programming language", "answer:1")
+        self.assertEqual(self.index.query("What is the Python programming language used for"), "answer:1")
+
+    def test_unrelated_question_not_found(self):
+        self.index.add("what is the python programming language", "answer:1")
+        self.assertIsNone(self.index.query("how tall is the eiffel tower"))
+
+    def test_symbols_keep_questions_apart(self):
+        self.index.add("What is C++?", "answer:cpp")
+        self.index.add("-5 squared", "answer:negative")
+        self.assertEqual(self.index.query("what is c++"), "answer:cpp")
+        self.assertIsNone(self.index.query("What is C#?"))
+        self.assertIsNone(self.index.query("5 squared"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+
+from searchapp.core.search.fetcher import FetchResult
+from searchapp.core.search.page_cache import PageCache, canonical_url
+from searchapp.core.search.web import WebSearch
+from searchapp.utils.caching import JSONCache, LocalCache
+
+
+def make_cache(**kwargs):
+    redis_helper = Mock()
+    redis_helper.lookup.return_value = None
+    return PageCache(cache=JSONCache("page", local_cache=LocalCache(), redis_helper=redis_helper), **kwargs)
+
+
+class TestCanonicalUrl(unittest.TestCase):
+    def test_equivalent_urls(self):
+        self.assertEqual(
+            canonical_url("HTTPS://Example.COM:443/docs?b=2&a=1&utm_source=bing#intro"),
+            canonical_url("https://example.com/docs?a=1&b=2"),
+        )
+
+    def test_empty_path(self):
+        self.assertEqual(canonical_url("http://example.com"), "http://example.com/")
+
+
+class TestPageCache(unittest.TestCase):
+    def test_round_trip(self):
+        cache = make_cache()
+        cache.put("http://example.com/a", "markdown", "main", etag='"v1"')
+
+        page = cache.get("http://example.com/a?utm_medium=x", "main")
+        self.assertEqual(page.markdown, "markdown")
+        self.assertEqual(page.etag, '"v1"')
+        self.assertTrue(cache.isFresh(page))
+
+    def test_other_extractor_misses(self):
+        cache = make_cache()
+        cache.put("http://example.com/a", "markdown", "main")
+        self.assertIsNone(cache.get("http://example.com/a", "html2text"))
+
+    def test_large_pages_not_cached(self):
+        cache = make_cache(max_entry_bytes=10)
+        cache.put("http://example.com/a", "x" * 100, "main")
+        self.assertIsNone(cache.get("http://example.com/a", "main"))
+
+
+class TestConditionalFetch(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.web_search = WebSearch()
+        self.web_search.pageCache = make_cache(fresh_for=0)
+        self.web_search.pageCache.put("http://example.com/a", "cached markdown", self.web_search.extractor, etag='"v1"')
+        self.web_search.fetcher = Mock()
+
+    async def test_not_modified_reuses_markdown(self):
+        self.web_search.fetcher.fetch = AsyncMock(
+            return_value=FetchResult(url="http://example.com/a", status=304, text="", etag='"v1"')
+        )
+        with patch('searchapp.core.search.web.convert') as mock_convert:
+            markdown = await self.web_search.processPageAsync({"url": "http://example.com/a"})
+
+        self.assertEqual(markdown, "cached markdown")
+        mock_convert.assert_not_called()
+        self.web_search.fetcher.fetch.assert_awaited_once_with(
+            "http://example.com/a", etag='"v1"', last_modified=None
+        )
+
+    async def test_changed_page_is_converted_and_cached(self):
+        self.web_search.fetcher.fetch = AsyncMock(
+            return_value=FetchResult(url="http://example.com/a", status=200, text="<p>new</p>", etag='"v2"')
+        )
+        markdown = await self.web_search.processPageAsync({"url": "http://example.com/a"})
+
+        self.assertIn("new", markdown)
+        page = self.web_search.pageCache.get("http://example.com/a", self.web_search.extractor)
+        self.assertEqual(page.etag, '"v2"')
+
+    async def test_fresh_entry_skips_fetch(self):
+        self.web_search.pageCache.fresh_for = 3600
+        self.web_search.fetcher.fetch = AsyncMock()
+        markdown = await self.web_search.processPageAsync({"url": "http://example.com/a"})
+
+        self.assertEqual(markdown, "cached markdown")
+        self.web_search.fetcher.fetch.assert_not_awaited()
+
+
+class TestSharedFetches(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_questions_share_a_page_fetch(self):
+        fetches = []
+
+        async def fetch(url, etag=None, last_modified=None):
+            fetches.append(url)
+            await asyncio.sleep(0.05)
+            return FetchResult(url=url, status=200, text="<p>Shared page</p>")
+
+        searches = []
+        for _ in range(3):
+            web_search = WebSearch()
+            web_search.pageCache = None
+            web_search.fetcher = Mock(fetch=fetch)
+            searches.append(web_search)
+
+        results = await asyncio.gather(
+            searches[0].processPageAsync({"url": "http://example.com/a"}),
+            searches[1].processPageAsync({"url": "http://example.com/a?utm_source=bing"}),
+            searches[2].processPageAsync({"url": "http://example.com/b"}),
+        )
+
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(sorted(fetches), ["http://example.com/a", "http://example.com/b"])
+
+    async def test_fetch_cancelled_when_every_waiter_leaves(self):
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def fetch(url, etag=None, last_modified=None):
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        searches = []
+        for _ in range(2):
+            web_search = WebSearch()
+            web_search.pageCache = None
+            web_search.fetcher = Mock(fetch=fetch)
+            searches.append(web_search)
+
+        waiters = [asyncio.ensure_future(search.processPageAsync({"url": "http://example.com/slow"})) for search in searches]
+        await started.wait()
+
+        # The download keeps going while another question still waits for it
+        waiters[0].cancel()
+        await asyncio.sleep(0.01)
+        self.assertFalse(cancelled.is_set())
+
+        waiters[1].cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.gather(*waiters, return_exceptions=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
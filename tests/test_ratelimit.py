@@ -0,0 +1,84 @@
+import time
+import unittest
+from email.utils import formatdate
+from unittest.mock import Mock
+
+import redis
+
+from searchapp.utils.ratelimit import RateLimitTimeout, TokenBucket, parse_retry_after
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_wait(self):
+        bucket = TokenBucket("test", rate=10, capacity=2, use_redis=False)
+
+        self.assertEqual(bucket.tryAcquire(), 0)
+        self.assertEqual(bucket.tryAcquire(), 0)
+        wait = bucket.tryAcquire()
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 0.1)
+
+    def test_acquire_sync_waits_for_refill(self):
+        bucket = TokenBucket("test", rate=20, capacity=1, use_redis=False)
+        bucket.acquireSync()
+
+        start = time.monotonic()
+        bucket.acquireSync()
+        self.assertGreaterEqual(time.monotonic() - start, 0.03)
+
+    def test_acquire_timeout(self):
+        bucket = TokenBucket("test", rate=1, capacity=1, use_redis=False)
+        bucket.acquireSync()
+
+        with self.assertRaises(RateLimitTimeout):
+            bucket.acquireSync(timeout=0.1)
+
+    def test_block_pauses_bucket(self):
+        bucket = TokenBucket("test", rate=100, use_redis=False)
+        bucket.block(0.5)
+
+        self.assertGreater(bucket.tryAcquire(), 0.4)
+
+    def test_uses_redis_script(self):
+        helper = Mock()
+        script, blockScript = Mock(return_value=b"0.25"), Mock(return_value=1)
+        helper.redis_client.register_script.side_effect = [script, blockScript]
+        bucket = TokenBucket("bing", rate=3, redis_helper=helper)
+
+        self.assertEqual(bucket.tryAcquire(), 0.25)
+        script.assert_called_once_with(keys=["ratelimit:bing", "ratelimit:bing:blocked"], args=[3, 3, 1])
+
+        # Blocks only ever extend the shared pause, see BLOCK_SCRIPT
+        bucket.block(2)
+        blockScript.assert_called_once_with(keys=["ratelimit:bing:blocked"], args=[2000])
+
+        blockScript.reset_mock()
+        bucket.block(0.0004)
+        blockScript.assert_called_once_with(keys=["ratelimit:bing:blocked"], args=[1])
+        bucket.block(0)
+        blockScript.assert_called_once()
+
+    def test_falls_back_to_local_bucket(self):
+        helper = Mock()
+        script = Mock(side_effect=redis.ConnectionError("down"))
+        helper.redis_client.register_script.return_value = script
+        bucket = TokenBucket("bing", rate=3, capacity=1, redis_helper=helper)
+
+        self.assertEqual(bucket.tryAcquire(), 0)
+        self.assertGreater(bucket.tryAcquire(), 0)
+        # Redis is skipped until the retry window has passed
+        self.assertEqual(script.call_count, 1)
+
+class TestParseRetryAfter(unittest.TestCase):
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after("3"), 3.0)
+
+    def test_http_date(self):
+        value = formatdate(time.time() + 10, usegmt=True)
+        self.assertAlmostEqual(parse_retry_after(value), 10, delta=1.5)
+
+    def test_missing_or_invalid(self):
+        self.assertEqual(parse_retry_after(None, default=2.0), 2.0)
+        self.assertEqual(parse_retry_after("soon", default=2.0), 2.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+import asyncio
+import random
+import unittest
+from contextlib import asynccontextmanager
+from unittest.mock import patch
+
+import aiohttp
+
+from searchapp.utils.ratelimit import TokenBucket
+from searchapp.utils.resilience import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    ResiliencePolicy,
+    UpstreamError,
+    backoffDelay,
+)
+
+class TestBackoff(unittest.TestCase):
+    def test_full_jitter_is_capped(self):
+        rng = random.Random(0)
+        delays = [backoffDelay(attempt, base=0.5, cap=2, rng=rng) for attempt in range(10) for _ in range(20)]
+        self.assertTrue(all(0 <= delay <= 2 for delay in delays))
+        self.assertLessEqual(max(backoffDelay(0, rng=rng) for _ in range(50)), 0.5)
+
+    def test_retry_after_is_respected(self):
+        policy = ResiliencePolicy("test")
+        self.assertGreaterEqual(policy.retryDelay(UpstreamError(429, retry_after=3), 0), 3)
+        self.assertIsNone(policy.retryDelay(UpstreamError(400), 0))
+        self.assertIsNone(policy.retryDelay(UpstreamError(503), 2))
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_then_half_opens_then_closes(self):
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+        breaker.recordFailure()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.recordFailure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+
+        with patch("searchapp.utils.resilience.time.monotonic", return_value=breaker.openedAt + 31):
+            self.assertTrue(breaker.allow())
+            self.assertEqual(breaker.state, HALF_OPEN)
+            # Only the trial call gets through
+            self.assertFalse(breaker.allow())
+
+        breaker.recordSuccess()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_failed_trial_reopens(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+        breaker.recordFailure()
+        self.assertTrue(breaker.allow())
+        breaker.recordFailure()
+        self.assertEqual(breaker.state, OPEN)
+
+class TestResiliencePolicy(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.policy = ResiliencePolicy("test", timeout=1, max_retries=2, backoff_base=0.01)
+
+    async def test_retries_5xx_then_succeeds(self):
+        calls = []
+
+        async def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise UpstreamError(503)
+            return "ok"
+
+        self.assertEqual(await self.policy.call(flaky), "ok")
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(self.policy.breaker.state, CLOSED)
+
+    async def test_client_errors_are_not_retried(self):
+        calls = []
+
+        async def bad_request():
+            calls.append(1)
+            raise UpstreamError(400)
+
+        with self.assertRaises(UpstreamError):
+            await self.policy.call(bad_request)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.policy.breaker.failures, 0)
+
+    async def test_timeout_per_attempt(self):
+        async def hang():
+            await asyncio.sleep(10)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.policy.call(hang, timeout=0.05, retries=1)
+
+    async def test_rate_limiter_wait_is_not_a_failure(self):
+        bucket = TokenBucket("test", rate=10, capacity=1, use_redis=False)
+        self.policy.breaker = CircuitBreaker("test", failure_threshold=3)
+
+        @asynccontextmanager
+        async def rateLimited():
+            await bucket.acquire()
+            yield
+
+        async def healthy():
+            return "ok"
+
+        # Six callers queue for up to half a second, well past the 0.05s timeout per attempt
+        results = await asyncio.gather(*(
+            self.policy.call(healthy, timeout=0.05, retries=0, gate=rateLimited) for _ in range(6)
+        ))
+
+        self.assertEqual(results, ["ok"] * 6)
+        self.assertEqual(self.policy.breaker.state, CLOSED)
+        self.assertEqual(self.policy.breaker.failures, 0)
+        self.assertLess(max(self.policy.latency.samples), 0.05)
+
+    async def test_open_circuit_fails_fast(self):
+        self.policy.breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+        calls = []
+
+        async def down():
+            calls.append(1)
+            raise aiohttp.ClientConnectionError("refused")
+
+        with self.assertRaises(aiohttp.ClientConnectionError):
+            await self.policy.call(down, retries=1)
+        with self.assertRaises(CircuitOpenError):
+            await self.policy.call(down)
+        self.assertEqual(len(calls), 2)
+
+    async def test_hedges_slow_calls(self):
+        for _ in range(20):
+            self.policy.latency.record(0.01)
+        calls = []
+
+        async def sometimes_slow():
+            calls.append(1)
+            await asyncio.sleep(1 if len(calls) == 1 else 0)
+            return len(calls)
+
+        start = asyncio.get_running_loop().time()
+        result = await self.policy.call(sometimes_slow, hedge=True)
+
+        self.assertEqual(result, 2)
+        self.assertEqual(len(calls), 2)
+        self.assertLess(asyncio.get_running_loop().time() - start, 0.5)
+
+    async def test_hedge_takes_its_own_gate_slot(self):
+        for _ in range(20):
+            self.policy.latency.record(0.01)
+        slots = asyncio.Semaphore(1)
+        running = []
+        concurrent = []
+
+        async def slow():
+            running.append(1)
+            concurrent.append(len(running))
+            try:
+                await asyncio.sleep(0.2)
+                return "ok"
+            finally:
+                running.pop()
+
+        result = await self.policy.call(slow, hedge=True, gate=lambda: slots)
+
+        self.assertEqual(result, "ok")
+        # The duplicate waited for the primary's slot instead of exceeding the limit
+        self.assertEqual(max(concurrent), 1)
+
+    def test_callSync(self):
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) == 1:
+                raise UpstreamError(502)
+            return "ok"
+
+        self.assertEqual(self.policy.callSync(flaky), "ok")
+        self.assertEqual(len(calls), 2)
+
+if __name__ == '__main__':
+    unittest.main()
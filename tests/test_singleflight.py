@@ -0,0 +1,115 @@
+import asyncio
+import unittest
+from unittest.mock import Mock
+
+import redis
+
+from searchapp.utils.singleflight import LOCAL_TOKEN, SingleFlight
+
+class FakeRedisClient:
+    """Just enough of redis-py for leases: SET NX and the compare-and-delete/expire scripts."""
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, px=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def register_script(self, script):
+        def run(keys, args):
+            if self.data.get(keys[0]) != args[0]:
+                return 0
+            if "DEL" in script:
+                del self.data[keys[0]]
+            return 1
+        return run
+
+def make_flight(client, **kwargs):
+    helper = Mock()
+    helper.redis_client = client
+    return SingleFlight(redis_helper=helper, poll_interval=0.01, **kwargs)
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.client = FakeRedisClient()
+        self.store = {}
+        self.computed = 0
+
+    async def compute(self, flight_group, key="answer:1"):
+        flight = await flight_group.join(key, lambda: self.store.get(key))
+        if flight.result:
+            return flight.result
+        self.computed += 1
+        await asyncio.sleep(0.05)
+        self.store[key] = "answer"
+        await flight.finish("answer")
+        return "answer"
+
+    async def test_coalesces_within_worker(self):
+        group = make_flight(self.client)
+        results = await asyncio.gather(*(self.compute(group) for _ in range(5)))
+
+        self.assertEqual(results, ["answer"] * 5)
+        self.assertEqual(self.computed, 1)
+        self.assertEqual(self.client.data, {})
+
+    async def test_coalesces_across_workers(self):
+        first, second = make_flight(self.client), make_flight(self.client)
+        results = await asyncio.gather(self.compute(first), self.compute(second))
+
+        self.assertEqual(results, ["answer", "answer"])
+        self.assertEqual(self.computed, 1)
+
+    async def test_takes_over_when_lease_expires(self):
+        # A leader in another worker died, its lease disappears without a result
+        self.client.data["lease:answer:1"] = "dead"
+        group = make_flight(self.client)
+
+        async def expire():
+            await asyncio.sleep(0.05)
+            del self.client.data["lease:answer:1"]
+
+        expiry = asyncio.ensure_future(expire())
+        flight = await group.join("answer:1", lambda: None)
+        await expiry
+
+        self.assertTrue(flight.isLeader)
+        self.assertIsNone(flight.result)
+        await flight.finish(None)
+
+    async def test_wait_timeout_falls_back_to_computing(self):
+        self.client.data["lease:answer:1"] = "stuck"
+        group = make_flight(self.client, wait_timeout=0.05)
+
+        flight = await group.join("answer:1", lambda: None)
+
+        self.assertFalse(flight.isLeader)
+        self.assertIsNone(flight.result)
+        self.assertEqual(self.client.data["lease:answer:1"], "stuck")
+
+    async def test_failed_leader_releases_local_waiters(self):
+        group = make_flight(self.client)
+        leader = await group.join("answer:1", lambda: None)
+        waiter = asyncio.ensure_future(group.join("answer:1", lambda: None))
+        await asyncio.sleep(0.01)
+
+        await leader.finish(None)
+        # The waiter competes again and becomes the new leader
+        flight = await waiter
+        self.assertTrue(flight.isLeader)
+        await flight.finish(None)
+
+    async def test_leads_locally_without_redis(self):
+        client = Mock()
+        client.set.side_effect = redis.ConnectionError("down")
+        group = make_flight(client)
+
+        flight = await group.join("answer:1", lambda: None)
+        self.assertEqual(flight.token, LOCAL_TOKEN)
+        await flight.finish("answer")
+
+if __name__ == '__main__':
+    unittest.main()
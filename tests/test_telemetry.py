@@ -0,0 +1,146 @@
+import asyncio
+import unittest
+import unittest.mock
+
+from searchapp.utils import telemetry
+from searchapp.utils.telemetry import (
+    NOOP_SPAN,
+    Counter,
+    Histogram,
+    Registry,
+    StageTimings,
+    collect,
+    percentile,
+    stage,
+    summarize,
+    trace,
+)
+
+class TestStageTimings(unittest.TestCase):
+    def test_stage_records_only_while_collecting(self):
+        with stage("ignored"):
+            pass
+
+        with collect() as timings:
+            with stage("fetch"):
+                pass
+            with stage("fetch"):
+                pass
+        self.assertEqual(list(timings.stages), ["fetch"])
+        self.assertEqual(len(timings.stages["fetch"]), 2)
+
+    def test_tasks_record_into_the_request(self):
+        async def summarize_page():
+            with stage("summarize"):
+                await asyncio.sleep(0)
+
+        async def request():
+            with collect() as timings:
+                await asyncio.gather(*(asyncio.ensure_future(summarize_page()) for _ in range(3)))
+            return timings
+
+        timings = asyncio.run(request())
+        self.assertEqual(len(timings.stages["summarize"]), 3)
+
+    def test_merge(self):
+        first, second = StageTimings(), StageTimings()
+        first.record("fetch", 1.0)
+        second.record("fetch", 2.0)
+        second.record("convert", 0.5)
+        first.merge(second)
+        self.assertEqual(first.stages, {"fetch": [1.0, 2.0], "convert": [0.5]})
+
+class TestTracing(unittest.TestCase):
+    def tearDown(self):
+        telemetry.set_enabled(True)
+
+    def test_stages_become_spans_of_the_trace(self):
+        async def fetch(url):
+            with stage("fetch", url=url) as span:
+                await asyncio.sleep(0)
+                span.set(status=200)
+
+        async def request():
+            with trace("question", question="q") as root:
+                with stage("bing_search"):
+                    pass
+                await asyncio.gather(*(asyncio.ensure_future(fetch(f"https://example.com/{i}")) for i in range(2)))
+                return telemetry._trace.get()
+
+        current = asyncio.run(request())
+        spans = current.toDict()["spans"]
+        self.assertEqual([span["name"] for span in spans], ["bing_search", "fetch", "fetch"])
+        self.assertEqual(spans[1]["attributes"]["status"], 200)
+        self.assertIn("url", spans[2]["attributes"])
+        self.assertIsNone(telemetry._trace.get())
+
+    def test_stage_outside_a_trace_yields_a_noop_span(self):
+        with stage("fetch") as span:
+            span.set(status=200)
+        self.assertIs(span, NOOP_SPAN)
+
+    def test_errors_are_recorded_on_the_span(self):
+        with self.assertRaises(RuntimeError):
+            with trace("question") as root:
+                raise RuntimeError("boom")
+        self.assertEqual(root.attributes["error"], "RuntimeError")
+
+    def test_slow_traces_are_kept(self):
+        with unittest.mock.patch.object(telemetry, "SLOW_TRACE_SECONDS", 0):
+            with self.assertLogs("searchapp.utils.telemetry", level="WARNING"):
+                with trace("question", question="slow"):
+                    with stage("summarize"):
+                        pass
+        self.assertEqual(telemetry.slow_traces[-1]["attributes"]["question"], "slow")
+
+    def test_disabled_records_nothing(self):
+        telemetry.set_enabled(False)
+        before = telemetry.STAGE_SECONDS.count(stage="disabled_stage")
+        with trace("question") as root:
+            with stage("disabled_stage") as span:
+                pass
+        self.assertIs(span, NOOP_SPAN)
+        self.assertGreaterEqual(root.duration, 0)
+        self.assertEqual(telemetry.STAGE_SECONDS.count(stage="disabled_stage"), before)
+
+        hits = telemetry.CACHE_REQUESTS.value(cache="answers", result="hit")
+        telemetry.record_cache("answers", "hit")
+        self.assertEqual(telemetry.CACHE_REQUESTS.value(cache="answers", result="hit"), hits)
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = Histogram("test_seconds", "Test latency.", ["stage"], buckets=(0.1, 1))
+        histogram.observe(0.05, stage="fetch")
+        histogram.observe(0.5, stage="fetch")
+        histogram.observe(2, stage="fetch")
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{stage="fetch",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="fetch",le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{stage="fetch",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{stage="fetch"} 3', lines)
+
+    def test_registry_renders_counters(self):
+        registry = Registry()
+        counter = registry.register(Counter("test_total", "Test counter.", ["cache", "result"]))
+        counter.inc(cache="answers", result="hit")
+        counter.inc(cache="answers", result="hit")
+        text = registry.render()
+        self.assertIn("# TYPE test_total counter", text)
+        self.assertIn('test_total{cache="answers",result="hit"} 2', text)
+
+class TestPercentiles(unittest.TestCase):
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_summarize(self):
+        summary = summarize([0.1, 0.2, 0.3])
+        self.assertEqual(summary["count"], 3)
+        self.assertEqual(summary["p50"], 0.2)
+        self.assertAlmostEqual(summary["mean"], 0.2)
+
+if __name__ == '__main__':
+    unittest.main()
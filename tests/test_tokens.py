@@ -0,0 +1,57 @@
+import unittest
+from unittest.mock import Mock, patch
+
+from searchapp.core.inference import tokens
+from searchapp.core.inference.tokens import TokenBudget, TokenUsage, countMessageTokens, countTokens
+from searchapp.utils.ranking import estimateTokens
+
+class TestCounting(unittest.TestCase):
+    def test_falls_back_to_estimate_without_tiktoken(self):
+        with patch.object(tokens, "tiktoken", None), patch.dict(tokens._encodings, clear=True):
+            self.assertEqual(countTokens("a" * 40), estimateTokens("a" * 40))
+            self.assertEqual(countTokens(""), 0)
+
+    def test_falls_back_to_estimate_when_encodings_are_unavailable(self):
+        offline = Mock(**{
+            "encoding_for_model.side_effect": KeyError("unknown-model"),
+            "get_encoding.side_effect": OSError("no network"),
+        })
+        with patch.object(tokens, "tiktoken", offline), patch.dict(tokens._encodings, clear=True):
+            self.assertEqual(countTokens("a" * 40, model="unknown-model"), estimateTokens("a" * 40))
+
+    def test_message_overhead(self):
+        messages = [{"role": "user", "content": "hello"}]
+        self.assertEqual(
+            countMessageTokens(messages),
+            tokens.TOKENS_PER_REPLY + tokens.TOKENS_PER_MESSAGE + countTokens("user") + countTokens("hello"),
+        )
+
+class TestTokenUsage(unittest.TestCase):
+    def test_totals_per_stage(self):
+        usage = TokenUsage()
+        usage.record("summarize", 100, 20)
+        usage.record("summarize", 50, 10)
+        usage.record("final_answer", 300, 80)
+
+        self.assertEqual(usage.stages["summarize"], {"calls": 2, "prompt": 150, "completion": 30})
+        self.assertEqual(usage.promptTokens, 450)
+        self.assertEqual(usage.totalTokens, 560)
+
+class TestTokenBudget(unittest.TestCase):
+    def test_unlimited(self):
+        budget = TokenBudget(0)
+        self.assertIsNone(budget.remaining)
+        self.assertTrue(budget.reserve(10 ** 9))
+
+    def test_reserve_and_settle(self):
+        budget = TokenBudget(1000)
+        self.assertTrue(budget.reserve(600))
+        self.assertFalse(budget.reserve(600))
+        self.assertEqual(budget.remaining, 400)
+
+        budget.settle(600, 450)
+        self.assertEqual(budget.spent, 450)
+        self.assertEqual(budget.remaining, 550)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,14 @@
 import unittest
 from unittest.mock import Mock, patch
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from searchapp.core.search.bing import BingWebSearch
 from searchapp.core.search.web import WebSearch
+from searchapp.utils.caching import JSONCache, LocalCache
+from searchapp.utils.ratelimit import TokenBucket
+from searchapp.utils.telemetry import UPSTREAM_ERRORS
 
 class TestWebSearch(unittest.TestCase):
     def setUp(self):
@@ -55,5 +63,105 @@ class TestWebSearch(unittest.TestCase):
             self.assertEqual(len(pdf_links), 2)
             self.assertTrue(all(link.endswith('.pdf') for link in pdf_links))
 
+    def test_mergeResults(self):
+        formatted = {"webPages": {"value": [{"url": "http://a.com"}, {"url": "http://b.com"}]}}
+        raw = {"webPages": {"value": [{"url": "http://b.com"}, {"url": "http://c.com"}]}}
+
+        merged = self.web_search.mergeResults(formatted, None, raw)
+        urls = [page["url"] for page in merged["webPages"]["value"]]
+        self.assertEqual(urls, ["http://a.com", "http://b.com", "http://c.com"])
+
+        self.web_search.resultsCount = 2
+        merged = self.web_search.mergeResults(formatted, raw)
+        self.assertEqual(len(merged["webPages"]["value"]), 2)
+
+    def results(self, *snippets):
+        return {"webPages": {"value": [
+            {"url": f"http://{index}.com", "name": f"Page {index}", "snippet": snippet}
+            for index, snippet in enumerate(snippets)
+        ]}}
+
+    def test_rankResults_keeps_best_snippets(self):
+        self.web_search.fetchCount = 2
+        results = self.results(
+            "Bananas are rich in potassium.",
+            "Python was created by Guido van Rossum.",
+            "Weather in Paris.",
+            "The Python language, created in 1991.",
+        )
+
+        ranked = self.web_search.rankResults(results, "who created the Python language")
+        urls = [page["url"] for page in ranked["webPages"]["value"]]
+        self.assertEqual(sorted(urls), ["http://1.com", "http://3.com"])
+
+    def test_rankResults_widens_on_weak_snippets(self):
+        self.web_search.fetchCount = 2
+        self.web_search.widenCount = 3
+        results = self.results("alpha", "beta", "gamma", "delta")
+
+        ranked = self.web_search.rankResults(results, "unrelated question")
+        # Nothing matches, so Bing's order decides which three are kept
+        urls = [page["url"] for page in ranked["webPages"]["value"]]
+        self.assertEqual(urls, ["http://0.com", "http://1.com", "http://2.com"])
+
+        self.web_search.widenCount = 0
+        self.assertEqual(len(self.web_search.rankResults(results, "unrelated question")["webPages"]["value"]), 2)
+
+    def test_rankResults_few_results_unchanged(self):
+        results = self.results("alpha", "beta")
+        self.assertIs(self.web_search.rankResults(results, "question"), results)
+        self.assertIsNone(self.web_search.rankResults(None, "question"))
+
+class TestBingCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.calls = []
+        self.throttled = 0
+
+        async def search(request):
+            self.calls.append(dict(request.query))
+            if self.throttled:
+                self.throttled -= 1
+                return web.json_response({}, status=429, headers={"Retry-After": "0.05"})
+            return web.json_response({"webPages": {"value": [{"url": "http://example.com"}]}})
+
+        app = web.Application()
+        app.router.add_get("/v7.0/search", search)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+        self.bing = BingWebSearch()
+        self.bing.endpoint = str(self.server.make_url("/v7.0/search"))
+        self.bing.cache = JSONCache("bing", local_cache=LocalCache(), redis_helper=Mock(**{"lookup.return_value": None}))
+        self.bing.rate_limiter = TokenBucket("bing-test", rate=100, use_redis=False)
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    async def test_results_cached_per_query_mkt_count(self):
+        first = await self.bing.web_search_async("What is Python?")
+        second = await self.bing.web_search_async("what is python")
+        await self.bing.web_search_async("what is python", results_count=10)
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.calls[1]["count"], "10")
+
+    async def test_retries_after_429(self):
+        self.throttled = 1
+        results = await self.bing.web_search_async("rate limited")
+
+        self.assertEqual(results["webPages"]["value"][0]["url"], "http://example.com")
+        self.assertEqual(len(self.calls), 2)
+
+    async def test_gives_up_after_max_retries(self):
+        self.throttled = 5
+        self.bing.max_retries = 1
+
+        before = UPSTREAM_ERRORS.value(upstream="bing", kind="rate_limited")
+        self.assertIsNone(await self.bing.web_search_async("still limited"))
+        self.assertEqual(len(self.calls), 2)
+        # One failed search, counted once whatever the number of attempts
+        self.assertEqual(UPSTREAM_ERRORS.value(upstream="bing", kind="rate_limited") - before, 1)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file